@@ -1,11 +1,53 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routes import plan, notes, insights, youtube_notes, chat
+from routes import plan, notes, insights, youtube_notes, youtube_batch, chat, stats, jobs, batch
+from utils import http_pool
+from utils.llm_cache import llm_cache
+from utils.content_store import content_store
+from utils.notes_pipeline import notes_prompt_version
+from utils.artifact_store import artifact_store
+from utils.jobs import job_manager
+from utils.transcripts import transcript_store
+from utils.video_batches import video_batch_store
+from utils.extraction_pool import extraction_pool
+from utils.uploads import UploadLimitMiddleware
+from utils.ai_client import GeminiClient
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client is shared by every request; open its connections up front
+    ai_client = GeminiClient()
+    # Stored notes are only reused while the prompts that produced them are unchanged; set
+    # before jobs resume, since they look stored notes up
+    content_store.set_prompt_version(notes_prompt_version(ai_client))
+    await ai_client.warm_up()
+    # Downloads that expired while the server was down
+    await asyncio.to_thread(artifact_store.sweep)
+    # Probes models whose circuit breaker is half-open so they recover without user traffic
+    health_monitor = asyncio.create_task(ai_client.run_health_monitor())
+    # Background note generation; jobs interrupted by the last shutdown are queued again
+    await job_manager.start()
+    yield
+    await job_manager.stop()
+    health_monitor.cancel()
+    await http_pool.close_all()
+    llm_cache.close()
+    content_store.close()
+    transcript_store.close()
+    video_batch_store.close()
+    extraction_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Caps request bodies before they are parsed; added first so CORS headers still wrap its 413
+app.add_middleware(UploadLimitMiddleware)
 
 # CORS
 app.add_middleware(
@@ -21,8 +63,12 @@ app.include_router(plan.router)
 app.include_router(notes.router)
 app.include_router(insights.router)
 app.include_router(youtube_notes.router)
+app.include_router(youtube_batch.router)
 app.include_router(chat.router)
+app.include_router(jobs.router)
+app.include_router(batch.router)
+app.include_router(stats.router)
 
 @app.get("/ping")
 def ping():
-    return {"message": "pong"} 
\ No newline at end of file
+    return {"message": "pong"}
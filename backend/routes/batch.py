@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import zipfile
+import tempfile
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from utils.file_reader import extract_document_from_path, SUPPORTED_EXTENSIONS
+from utils.uploads import SpooledUpload, UploadTooLargeError, UPLOAD_SPOOL_DIR, save_upload
+from utils.batch import (BatchFile, BatchTooLargeError, UnreadableZipMember, BATCH_CONCURRENCY, BATCH_MAX_FILES,
+                         BATCH_MAX_TOTAL_BYTES, BATCH_WORKDIR_PREFIX, batch_stats, extract_zip_members, remove_dir,
+                         remove_stale_workdirs, ndjson, summarize)
+from routes.notes import generate_document_notes, notes_filename, http_error
+
+router = APIRouter()
+
+# Shared by every batch, so several batches at once do not multiply the load on the
+# extraction pool and the Gemini rate limits
+batch_slots = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+
+def _extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower()
+
+
+async def collect_batch_files(files: List[UploadFile], workdir: str) -> List[BatchFile]:
+    """Saves every upload to `workdir`, unpacking ZIP archives, and enforces the batch limits."""
+    batch: List[BatchFile] = []
+    total = 0
+
+    def add(filename: str, path: str, size: int, sha256: str):
+        nonlocal total
+        if len(batch) >= BATCH_MAX_FILES:
+            raise BatchTooLargeError(f"Too many files. A batch may contain at most {BATCH_MAX_FILES}.")
+        total += size
+        if total > BATCH_MAX_TOTAL_BYTES:
+            raise BatchTooLargeError(f"The batch is too large. The limit is {BATCH_MAX_TOTAL_BYTES / 1024 / 1024:g} MB.")
+        batch.append(BatchFile(len(batch), filename, path, size, sha256))
+
+    for number, upload in enumerate(files):
+        ext = _extension(upload.filename or "")
+        path = os.path.join(workdir, f"upload{number}.{ext}")
+        if ext == "zip":
+            archive = await save_upload(upload, path, BATCH_MAX_TOTAL_BYTES)
+            members_dir = os.path.join(workdir, f"upload{number}")
+            os.makedirs(members_dir)
+            members = await asyncio.to_thread(
+                extract_zip_members, archive.path, members_dir, SUPPORTED_EXTENSIONS,
+                BATCH_MAX_FILES - len(batch), BATCH_MAX_TOTAL_BYTES - total,
+            )
+            os.unlink(archive.path)
+            for name, member_path, size, sha256 in members:
+                add(name, member_path, size, sha256)
+        elif ext in SUPPORTED_EXTENSIONS:
+            saved = await save_upload(upload, path)
+            add(upload.filename, saved.path, saved.size, saved.sha256)
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type: {upload.filename}. Please upload PDF, DOCX, TXT or ZIP files.",
+            )
+    return batch
+
+
+async def process_file(item: BatchFile, no_cache: bool, batch_started: float) -> dict:
+    async with batch_slots:
+        started = time.perf_counter()
+        line = {"type": "file", "index": item.index, "filename": item.filename}
+        try:
+            spooled = SpooledUpload(item.path, item.size, item.sha256)
+            document = await extract_document_from_path(_extension(item.filename), spooled, item.filename,
+                                                        wait=True)
+            result = await generate_document_notes(document, notes_filename(os.path.basename(item.filename)), no_cache)
+            line.update({"status": "ok", "pages": document.page_count, "result": result})
+        except Exception as e:
+            error = http_error(e)
+            line.update({"status": "error", "status_code": error.status_code, "detail": error.detail})
+        finished = time.perf_counter()
+        line["processing_seconds"] = round(finished - started, 3)
+        line["latency_seconds"] = round(finished - batch_started, 3)
+        batch_stats.record_file(line["status"] == "ok", finished - started)
+        return line
+
+
+def summarize_files(lines: List[dict], total_bytes: int, elapsed: float) -> dict:
+    pages = sum(line.get("pages", 0) for line in lines)
+    elapsed = max(elapsed, 1e-6)
+    return {
+        **summarize(lines, elapsed),
+        "pages": pages,
+        "mb": round(total_bytes / 1024 / 1024, 2),
+        "pages_per_second": round(pages / elapsed, 2),
+        "mb_per_second": round(total_bytes / 1024 / 1024 / elapsed, 3),
+    }
+
+
+async def stream_batch(batch: List[BatchFile], workdir: str, no_cache: bool):
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(process_file(item, no_cache, started)) for item in batch]
+    lines = []
+    try:
+        yield ndjson({"type": "batch", "files": [item.filename for item in batch], "concurrency": BATCH_CONCURRENCY})
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            lines.append(line)
+            yield ndjson(line)
+        summary = summarize_files(lines, sum(item.size for item in batch), time.perf_counter() - started)
+        batch_stats.record_batch(summary)
+        yield ndjson(summary)
+    finally:
+        # The client went away: stop the files that have not finished
+        for task in tasks:
+            task.cancel()
+        await asyncio.to_thread(remove_dir, workdir)
+
+
+async def close_batch(stream, workdir: str):
+    """
+    Runs after the response, however it ended. Closing the stream cancels unfinished files
+    and removes the workdir; if the stream never started, its `finally` never runs, so the
+    workdir is removed here as well.
+    """
+    await stream.aclose()
+    await asyncio.to_thread(remove_dir, workdir)
+
+
+@router.post("/generate-notes/batch", tags=["notes"])
+async def generate_notes_batch(files: List[UploadFile] = File(...), no_cache: bool = Query(False)):
+    """
+    Generates notes for several PDF, DOCX or TXT files, or ZIP archives of them, processing up
+    to BATCH_CONCURRENCY files at a time. The response is NDJSON: a `batch` line listing the
+    files, one `file` line per document as soon as it finishes (with the usual /generate-notes
+    body under `result`, or `status_code` and `detail` if it failed), and a final `summary`
+    line with throughput and latency.
+    """
+    spool_dir = UPLOAD_SPOOL_DIR or tempfile.gettempdir()
+    await asyncio.to_thread(remove_stale_workdirs, spool_dir)
+    workdir = tempfile.mkdtemp(prefix=BATCH_WORKDIR_PREFIX, dir=spool_dir)
+    try:
+        batch = await collect_batch_files(files, workdir)
+        if not batch:
+            raise HTTPException(status_code=400, detail="No PDF, DOCX or TXT files found in the upload.")
+    except (UploadTooLargeError, BatchTooLargeError) as e:
+        await asyncio.to_thread(remove_dir, workdir)
+        batch_stats.rejected += 1
+        raise HTTPException(status_code=413, detail=str(e))
+    except zipfile.BadZipFile:
+        await asyncio.to_thread(remove_dir, workdir)
+        raise HTTPException(status_code=400, detail="The ZIP archive is damaged or not a ZIP file.")
+    except UnreadableZipMember as e:
+        await asyncio.to_thread(remove_dir, workdir)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await asyncio.to_thread(remove_dir, workdir)
+        raise
+
+    stream = stream_batch(batch, workdir, no_cache)
+    return StreamingResponse(
+        stream,
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(close_batch, stream, workdir),
+    )
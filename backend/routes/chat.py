@@ -2,8 +2,16 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from utils.ai_client import GeminiClient
+from utils.scheduler import Priority, SchedulerTimeout
+from utils.retry import RETRY_POLICIES
+from utils.tokens import PromptTooLargeError, token_estimator
+from utils.sse import sse_response, single_chunk
 
 router = APIRouter()
+ai_client = GeminiClient()
+
+# Tokens kept free for the instructions and question around the notes
+CHAT_PROMPT_RESERVE_TOKENS = 500
 
 class ChatRequest(BaseModel):
     message: str
@@ -16,9 +24,10 @@ class ChatResponse(BaseModel):
     referenced_notes: List[str]
 
 @router.post("/chat-with-notes", tags=["chat"])
-async def chat_with_notes(request: ChatRequest):
+async def chat_with_notes(request: ChatRequest, stream: bool = False, no_cache: bool = False):
     """
     Chat with AI assistant using selected notes as context.
+    With ?stream=true the answer is sent as Server-Sent Events while it is generated.
     """
     try:
         if not request.message.strip():
@@ -35,21 +44,28 @@ To get the most helpful responses, please:
 3. Ask me questions about those specific notes
 
 You can also ask me general study questions, and I'll provide helpful guidance!"""
-            
+
+            if stream:
+                return sse_response(
+                    single_chunk(response),
+                    on_complete=lambda text: {"response": text, "referenced_notes": []},
+                )
             return ChatResponse(
                 response=response,
                 referenced_notes=[]
             )
 
-        # Create AI client
-        ai_client = GeminiClient()
-        
+        # Very large note selections are trimmed to the model's token budget
+        context = ai_client.fit_to_budget(
+            request.context, reserve_tokens=CHAT_PROMPT_RESERVE_TOKENS + token_estimator.estimate(request.message), what="The selected note set"
+        )
+
         # Build the prompt with context
         prompt = f"""
         You are a helpful study assistant. You have access to the user's personal notes and should answer questions based on this information.
 
         USER'S NOTES:
-        {request.context}
+        {context}
 
         USER'S QUESTION: {request.message}
 
@@ -66,18 +82,30 @@ You can also ask me general study questions, and I'll provide helpful guidance!"
         Please provide a helpful response based on the user's notes using clean, readable text.
         """
 
-        # Generate response using Gemini
-        response = await ai_client._generate_with_fallback(prompt)
-        
         # For now, we'll return all selected notes as referenced
         # In a more advanced implementation, you could use semantic search to find the most relevant notes
         referenced_notes = request.selected_notes
 
+        if stream:
+            return sse_response(
+                ai_client._stream_with_fallback(prompt, use_cache=not no_cache, priority=Priority.INTERACTIVE,
+                                                retry_policy=RETRY_POLICIES["chat"]),
+                on_complete=lambda text: {"response": text, "referenced_notes": referenced_notes},
+            )
+
+        # Generate response using Gemini
+        response = await ai_client._generate_with_fallback(prompt, use_cache=not no_cache, priority=Priority.INTERACTIVE,
+                                                         retry_policy=RETRY_POLICIES["chat"])
+
         return ChatResponse(
             response=response,
             referenced_notes=referenced_notes
         )
 
+    except SchedulerTimeout:
+        raise HTTPException(status_code=503, detail="The AI service is busy right now. Please try again in a moment.")
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from utils.ai_client import GeminiClient
+from utils.sse import sse_response
+from utils.scheduler import SchedulerTimeout
+from utils.tokens import PromptTooLargeError
 
 router = APIRouter()
 ai_client = GeminiClient()
@@ -9,9 +12,18 @@ class InsightsRequest(BaseModel):
     note_content: str
 
 @router.post("/generate-insights", tags=["insights"])
-async def generate_insights_endpoint(req: InsightsRequest):
+async def generate_insights_endpoint(req: InsightsRequest, stream: bool = False, no_cache: bool = False):
     try:
-        insights_text = await ai_client.generate_notes_from_text(req.note_content)
+        if stream:
+            return sse_response(
+                ai_client.stream_notes_from_text(req.note_content, use_cache=not no_cache),
+                on_complete=lambda insights_text: {"insights": insights_text},
+            )
+        insights_text = await ai_client.generate_notes_from_text(req.note_content, use_cache=not no_cache)
         return {"insights": insights_text}
+    except SchedulerTimeout:
+        raise HTTPException(status_code=503, detail="The AI service is busy right now. Please try again in a moment.")
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate insights: {e}") 
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from utils.jobs import job_manager, JobQueueFull
+from utils.sse import format_sse
+from utils.scheduler import Priority
+from utils.file_reader import extract_document_from_path, SUPPORTED_EXTENSIONS
+from utils.uploads import SpooledUpload, UploadTooLargeError, save_upload
+from routes.notes import generate_document_notes, notes_filename, http_error
+from routes.youtube_notes import (YouTubeURLRequest, extract_video_id, fetch_transcript, generate_youtube_notes,
+                                  plan_youtube_pipeline, youtube_notes_response)
+
+router = APIRouter()
+
+
+async def run_notes_job(job: dict, report) -> dict:
+    payload = job["payload"]
+    try:
+        spooled = SpooledUpload(job["input_path"], payload["size"], payload["sha256"])
+        document = await extract_document_from_path(payload["ext"], spooled, payload["filename"], on_progress=report,
+                                                    wait=True)
+        report({"stage": "extract", "status": "done", "pages_extracted": document.page_count, "pages": document.page_count})
+        # Jobs have no connection to hold open, so they can wait longer for a rate-limit slot
+        return await generate_document_notes(
+            document, notes_filename(payload["filename"]), payload["no_cache"], payload["previous_hash"],
+            priority=Priority.BACKGROUND, on_progress=report,
+        )
+    except Exception as e:
+        raise http_error(e)
+
+
+async def run_youtube_job(job: dict, report) -> dict:
+    payload = job["payload"]
+    try:
+        video_id = extract_video_id(payload["video_url"])
+        report({"stage": "transcript", "status": "started"})
+        transcript = await fetch_transcript(video_id, payload.get("language"))
+        report({"stage": "transcript", "status": "done", "characters": len(transcript.text)})
+        report({"stage": "generate", "status": "started"})
+        use_cache = not payload["no_cache"]
+        pipeline = plan_youtube_pipeline(transcript, use_cache=use_cache, priority=Priority.BACKGROUND, on_progress=report)
+        ai_notes = await generate_youtube_notes(transcript, use_cache=use_cache, priority=Priority.BACKGROUND, pipeline=pipeline)
+        return youtube_notes_response(payload["video_url"], video_id, ai_notes, transcript, pipeline)
+    except Exception as e:
+        raise http_error(e)
+
+
+job_manager.register("notes", run_notes_job)
+job_manager.register("youtube", run_youtube_job)
+
+
+def accepted(job: dict) -> JSONResponse:
+    job_id = job["job_id"]
+    return JSONResponse(
+        status_code=202,
+        content={**job, "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"},
+    )
+
+
+@router.post("/jobs/notes", tags=["jobs"])
+async def submit_notes_job(file: UploadFile = File(...), no_cache: bool = Query(False), previous_hash: str = Query(None)):
+    """
+    Queues note generation for an uploaded document and returns the job ID right away.
+    Follow it with GET /jobs/{job_id} (polling) or GET /jobs/{job_id}/events (SSE).
+    """
+    ext = file.filename.split('.')[-1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: .{ext}. Please upload a PDF, DOCX, or TXT file.")
+    try:
+        job_manager.check_capacity()
+        job_id = job_manager.new_id()
+        # The upload is kept until the job finishes, so a restart can run it again
+        path = job_manager.input_path(job_id, f".{ext}")
+        try:
+            saved = await save_upload(file, path)
+            payload = {"filename": file.filename, "ext": ext, "size": saved.size, "sha256": saved.sha256,
+                       "no_cache": no_cache, "previous_hash": previous_hash}
+            return accepted(await job_manager.submit("notes", payload, job_id=job_id, input_path=path))
+        except BaseException:
+            await asyncio.to_thread(job_manager.remove_input, path)
+            raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.post("/jobs/youtube", tags=["jobs"])
+async def submit_youtube_job(request: YouTubeURLRequest, no_cache: bool = Query(False)):
+    """Queues note generation for a YouTube video; see /jobs/notes."""
+    extract_video_id(request.video_url)
+    try:
+        job = await job_manager.submit(
+            "youtube", {"video_url": request.video_url, "language": request.language, "no_cache": no_cache}
+        )
+        return accepted(job)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/jobs/{job_id}", tags=["jobs"])
+async def get_job(job_id: str):
+    """
+    Job status (queued, running, succeeded, failed, cancelled) with a progress summary while it
+    runs; `result` holds the usual endpoint response once it has succeeded.
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@router.get("/jobs/{job_id}/events", tags=["jobs"])
+async def job_events(job_id: str):
+    """
+    Server-Sent Events for a job: `status` with the current state, `progress` for every
+    pipeline step, then `done` (the result) or `failed`.
+    """
+    if await job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def event_stream():
+        async for item in job_manager.events(job_id):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event, data = item
+            yield format_sse(data, event=event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete("/jobs/{job_id}", tags=["jobs"])
+async def cancel_job(job_id: str):
+    job = await job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
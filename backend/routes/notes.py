@@ -1,75 +1,156 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from utils.ai_client import GeminiClient
-from pypdf import PdfReader
-import io
-import docx
+import math
+import asyncio
+import dataclasses
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from utils.ai_client import GeminiClient, GeminiAPIError
+from utils.sse import sse_response, single_chunk
+from utils.scheduler import SchedulerTimeout, Priority
+from utils.tokens import PromptTooLargeError
+from utils.file_reader import ExtractedDocument, extract_document_from_file, SUPPORTED_EXTENSIONS
+from utils.extraction_pool import ExtractionPoolFull, ExtractionTimeout
+from utils.uploads import UploadTooLargeError
+from utils.notes_pipeline import NotesPipeline, needs_map_reduce, previous_chunks, compare_revision
+from utils.content_store import content_store
+from utils.artifact_store import artifact_store, ArtifactNotFound, DOCX_MEDIA_TYPE
+from utils.text_normalize import NormalizationReport, normalize_pages, normalization_stats
 from fastapi.responses import FileResponse
-from docx import Document
-import tempfile
-import os
 
 router = APIRouter()
 ai_client = GeminiClient()
 
-def read_docx(file: io.BytesIO) -> str:
-    """Reads text from a DOCX file."""
-    doc = docx.Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+def http_error(e: Exception) -> HTTPException:
+    """Maps a failure while generating notes to the status the notes routes return for it."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, (UploadTooLargeError, PromptTooLargeError)):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, ExtractionPoolFull):
+        return HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, ExtractionTimeout):
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, SchedulerTimeout):
+        return HTTPException(status_code=503, detail="The AI service is busy right now. Please try again in a moment.")
+    # Still rate limited, overloaded or timing out once the retries ran out: tell the client to back off
+    if isinstance(e, GeminiAPIError) and e.timeout:
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, GeminiAPIError) and e.status_code in (429, 503):
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+        return HTTPException(status_code=503, detail=str(e), headers=headers)
+    print(f"An unexpected error occurred while generating notes: {e}")
+    return HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+def notes_filename(upload_name: str) -> str:
+    return f"AI_Notes_{upload_name.rsplit('.', 1)[0]}.docx"
+
+async def plan_notes_pipeline(document: ExtractedDocument, no_cache: bool = False, previous_hash: str = None,
+                              priority: Priority = Priority.BULK, on_progress=None) -> tuple:
+    """
+    Returns (pipeline, previous chunk hashes). Long documents are summarized section by section
+    in parallel and then merged; short ones get no pipeline and use a single prompt. A revision
+    is always chunked, with the previous version's chunk size, so unchanged sections are reused.
+    """
+    if previous_hash:
+        chunk_tokens, previous_hashes = await previous_chunks(content_store, previous_hash)
+        return NotesPipeline(ai_client, use_cache=not no_cache, priority=priority, on_progress=on_progress,
+                             chunk_store=content_store, chunk_tokens=chunk_tokens), previous_hashes
+    if needs_map_reduce(document.pages):
+        return NotesPipeline(ai_client, use_cache=not no_cache, priority=priority, on_progress=on_progress,
+                             chunk_store=content_store), None
+    return None, None
+
+async def normalize_document(document: ExtractedDocument) -> tuple:
+    """
+    Returns (document with normalized pages, NormalizationReport). Headers, footers, page
+    numbers and whitespace are stripped before any of the text is sent to Gemini.
+    """
+    pages, report = await asyncio.to_thread(normalize_pages, document.pages)
+    normalization_stats.record(report)
+    return dataclasses.replace(document, pages=pages), report
+
+async def finish_notes(document: ExtractedDocument, filename: str, notes_text: str, pipeline: NotesPipeline = None,
+                       previous_hash: str = None, previous_hashes=None,
+                       normalization: NormalizationReport = None) -> dict:
+    """Stores the notes and builds the /generate-notes response body."""
+    await content_store.put_notes(document.sha256, notes_text)
+    # The DOCX is only rendered if it is downloaded; `docx_path` carries the artifact ID
+    result = {"notes": notes_text, "docx_path": await artifact_store.put_notes(notes_text, filename),
+              "filename": filename, "content_hash": document.sha256}
+    if normalization:
+        result["normalization"] = normalization.as_dict()
+    if pipeline:
+        await content_store.put_document_chunks(document.sha256, pipeline.chunk_tokens, pipeline.chunk_hashes)
+        if previous_hash:
+            result["revision"] = {"previous_hash": previous_hash, **pipeline.summary,
+                                  **compare_revision(previous_hashes, pipeline.chunk_hashes,
+                                                   pipeline.reused_hashes)}
+    return result
+
+async def generate_document_notes(document: ExtractedDocument, filename: str, no_cache: bool = False,
+                                  previous_hash: str = None, priority: Priority = Priority.BULK,
+                                  on_progress=None) -> dict:
+    """Notes for an extracted document, without streaming; also used by background jobs."""
+    if not document.text.strip():
+        raise HTTPException(status_code=400, detail="Could not extract text from the file. It might be empty or scanned.")
+
+    # The same file uploaded before (by anyone) already has notes
+    stored_notes = None if no_cache else await content_store.get_notes(document.sha256)
+    if stored_notes:
+        return await finish_notes(document, filename, stored_notes)
+
+    document, normalization = await normalize_document(document)
+    pipeline, previous_hashes = await plan_notes_pipeline(document, no_cache, previous_hash, priority, on_progress)
+    if pipeline:
+        notes_text = await pipeline.generate(document.pages)
+    else:
+        notes_text = await ai_client.generate_notes_from_text(document.text, use_cache=not no_cache, priority=priority)
+
+    if not notes_text:
+        raise HTTPException(status_code=502, detail="AI service failed to generate notes. Please try again.")
+
+    return await finish_notes(document, filename, notes_text, pipeline, previous_hash, previous_hashes, normalization)
 
 @router.post("/generate-notes", tags=["notes"])
-async def generate_notes_from_file(file: UploadFile = File(...)):
+async def generate_notes_from_file(file: UploadFile = File(...), stream: bool = Query(False), no_cache: bool = Query(False),
+                                  previous_hash: str = Query(None)):
+    """
+    `previous_hash` is the content_hash of an earlier version of the same document. The new
+    version is then chunked like the old one and only sections whose text changed are sent
+    to Gemini; the response's `revision` field reports how many were reused.
+    """
     try:
         file_extension = file.filename.split('.')[-1].lower()
-        contents = await file.read()
-        file_stream = io.BytesIO(contents)
-
-        text = ""
-        if file_extension == 'pdf':
-            reader = PdfReader(file_stream)
-            for page in reader.pages:
-                text += page.extract_text() or ""
-        elif file_extension == 'docx':
-            text = read_docx(file_stream)
-        elif file_extension == 'txt':
-            text = contents.decode('utf-8')
-        else:
+        if file_extension not in SUPPORTED_EXTENSIONS:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: .{file_extension}. Please upload a PDF, DOCX, or TXT file.")
 
-        if not text.strip():
+        # PDF/DOCX parsing is CPU-bound and runs in the extraction process pool
+        document = await extract_document_from_file(file)
+        filename = notes_filename(file.filename)
+
+        if not stream:
+            return await generate_document_notes(document, filename, no_cache, previous_hash)
+
+        if not document.text.strip():
             raise HTTPException(status_code=400, detail="Could not extract text from the file. It might be empty or scanned.")
 
-        notes_text = await ai_client.generate_notes_from_text(text)
-        
-        if not notes_text:
-            raise HTTPException(status_code=502, detail="AI service failed to generate notes. Please try again.")
+        stored_notes = None if no_cache else await content_store.get_notes(document.sha256)
+        if stored_notes:
+            return sse_response(single_chunk(stored_notes), on_complete=lambda notes_text: finish_notes(document, filename, notes_text))
 
-        # Create DOCX file from notes_text and save it
-        doc = Document()
-        for line in notes_text.splitlines():
-            doc.add_paragraph(line)
-        
-        # Save DOCX to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            doc.save(tmp.name)
-            tmp_path = tmp.name
+        document, normalization = await normalize_document(document)
+        pipeline, previous_hashes = await plan_notes_pipeline(document, no_cache, previous_hash)
 
-        filename = f"AI_Notes_{file.filename.rsplit('.', 1)[0]}.docx"
-        
-        # Return both the notes text and the file path for download
-        return {
-            "notes": notes_text,
-            "docx_path": tmp_path,
-            "filename": filename
-        }
+        def finish(notes_text: str):
+            return finish_notes(document, filename, notes_text, pipeline, previous_hash, previous_hashes, normalization)
+
+        if pipeline:
+            return sse_response(pipeline.stream(document.pages), on_complete=finish)
+        return sse_response(ai_client.stream_notes_from_text(document.text, use_cache=not no_cache), on_complete=finish)
 
-    except HTTPException as he:
-        raise he
     except Exception as e:
-        print(f"An unexpected error occurred in generate_notes_from_file: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+        raise http_error(e)
 
 @router.post("/generate-notes-from-topic", tags=["notes"])
-async def generate_notes_from_topic(request: dict):
+async def generate_notes_from_topic(request: dict, no_cache: bool = False):
     try:
         topic = request.get("topic", "")
         day = request.get("day", 1)
@@ -96,7 +177,7 @@ async def generate_notes_from_topic(request: dict):
         Make the notes comprehensive, well-structured, and easy to understand for students.
         """
         
-        notes_text = await ai_client.generate_notes_from_text(prompt)
+        notes_text = await ai_client.generate_notes_from_text(prompt, use_cache=not no_cache)
         
         if not notes_text:
             raise HTTPException(status_code=502, detail="AI service failed to generate notes. Please try again.")
@@ -107,22 +188,20 @@ async def generate_notes_from_topic(request: dict):
             "day": day
         }
         
-    except HTTPException as he:
-        raise he
     except Exception as e:
-        print(f"An unexpected error occurred in generate_notes_from_topic: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+        raise http_error(e)
 
-@router.get("/download-notes/{file_path:path}", tags=["notes"])
-async def download_notes(file_path: str):
+@router.get("/download-notes/{artifact_id}", tags=["notes"])
+async def download_notes(artifact_id: str):
+    """
+    Streams the notes as DOCX. `artifact_id` is the `docx_path` returned by /generate-notes;
+    the document is rendered on the first download.
+    """
     try:
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        filename = os.path.basename(file_path)
-        return FileResponse(file_path, filename=filename, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-    except HTTPException as he:
-        raise he
+        path, filename = await artifact_store.get_docx(artifact_id)
+        return FileResponse(path, filename=filename, media_type=DOCX_MEDIA_TYPE)
+    except ArtifactNotFound:
+        raise HTTPException(status_code=404, detail="File not found or expired")
     except Exception as e:
         print(f"An unexpected error occurred in download_notes: {e}")
         raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
\ No newline at end of file
@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from utils.ai_client import GeminiClient
+from utils.scheduler import SchedulerTimeout
+from utils.tokens import PromptTooLargeError
 router = APIRouter()
 ai_client = GeminiClient()
 
@@ -53,14 +55,18 @@ class StudyPlanRequest(BaseModel):
     duration_days: int
 
 @router.post("/generate-plan", tags=["plan"])
-async def generate_plan_endpoint(req: StudyPlanRequest):
+async def generate_plan_endpoint(req: StudyPlanRequest, no_cache: bool = False):
     try:
         plan_text = await ai_client.generate_plan(
-            req.goal, req.speed, req.hours_per_day, req.duration_days
+            req.goal, req.speed, req.hours_per_day, req.duration_days, use_cache=not no_cache
         )
         # The plan_text can be a JSON string wrapped in markdown, so we extract it
         plan_json = extract_json_from_response(plan_text)
         return {"plan": plan_json}
+    except SchedulerTimeout:
+        raise HTTPException(status_code=503, detail="The AI service is busy right now. Please try again in a moment.")
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+from utils import http_pool
+from utils.llm_cache import llm_cache
+from utils.content_store import content_store
+from utils.tokens import token_estimator
+from utils.extraction_pool import extraction_pool
+from utils.uploads import upload_stats
+from utils.artifact_store import artifact_store
+from utils.jobs import job_manager
+from utils.batch import batch_stats
+from utils.text_normalize import normalization_stats
+from utils.transcripts import transcript_store
+from utils.transcript_notes import transcript_notes_stats
+from utils.video_batches import video_batch_store
+from utils.ai_client import gemini_flights, hedge_policy, latency_tracker, model_health, scheduler, retry_stats
+
+router = APIRouter()
+
+@router.get("/stats", tags=["stats"])
+async def get_stats():
+    """
+    Runtime counters for the Gemini pipeline (connection pool, response cache, content store, request coalescing, hedging, model health, rate-limit queues, retries, token usage, text normalization), the document extraction pool, uploads, batch uploads, downloadable artifacts and background jobs, plus the YouTube transcript cache, windowed video notes and video batches.
+    """
+    return {
+        "http_pool": http_pool.stats(),
+        "llm_cache": llm_cache.stats(),
+        "content_store": content_store.stats(),
+        "singleflight": gemini_flights.stats(),
+        "hedging": hedge_policy.stats(),
+        "latency": latency_tracker.stats(),
+        "models": model_health.stats(),
+        "scheduler": scheduler.stats(),
+        "retries": retry_stats.stats(),
+        "tokens": token_estimator.stats(),
+        "normalization": normalization_stats.stats(),
+        "extraction": extraction_pool.stats(),
+        "uploads": upload_stats.stats(),
+        "artifacts": artifact_store.stats(),
+        "jobs": job_manager.stats(),
+        "batch": batch_stats.stats(),
+        "transcripts": transcript_store.stats(),
+        "video_windows": transcript_notes_stats.stats(),
+        "video_batches": video_batch_store.stats(),
+    }
@@ -0,0 +1,155 @@
+import time
+import asyncio
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from utils.transcripts import video_url
+from utils.batch import ndjson, summarize
+from utils.video_batches import (video_batch_store, playlist_video_ids, PlaylistError, YOUTUBE_BATCH_CONCURRENCY,
+                                 YOUTUBE_BATCH_FETCH_CONCURRENCY, YOUTUBE_BATCH_MAX_VIDEOS)
+from routes.notes import http_error
+from routes.youtube_notes import (extract_playlist_id, parse_video_reference, fetch_transcript, plan_youtube_pipeline,
+                                  generate_youtube_notes, youtube_notes_response)
+
+router = APIRouter()
+
+# Shared by every batch, like the document batch slots: transcript fetches are cheap and get
+# more room than note generation, which is bound by the Gemini rate limits
+fetch_slots = asyncio.Semaphore(max(1, YOUTUBE_BATCH_FETCH_CONCURRENCY))
+notes_slots = asyncio.Semaphore(max(1, YOUTUBE_BATCH_CONCURRENCY))
+
+
+class YouTubeBatchRequest(BaseModel):
+    # Video URLs or bare video IDs
+    videos: List[str] = []
+    playlist_url: Optional[str] = None
+    # Transcript language code; defaults to TRANSCRIPT_DEFAULT_LANGUAGE
+    language: Optional[str] = None
+    # Resumes an earlier batch; the other fields are ignored
+    batch_id: Optional[str] = None
+
+
+async def resolve_videos(request: YouTubeBatchRequest) -> List[str]:
+    """Video IDs of a batch request: the playlist's videos first, then the listed ones, without duplicates."""
+    video_ids = []
+    if request.playlist_url:
+        playlist_id = extract_playlist_id(request.playlist_url)
+        if not playlist_id:
+            raise HTTPException(status_code=400, detail="Invalid YouTube playlist URL format")
+        try:
+            video_ids.extend(await playlist_video_ids(playlist_id, YOUTUBE_BATCH_MAX_VIDEOS + 1))
+        except PlaylistError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+    video_ids.extend(parse_video_reference(reference) for reference in request.videos)
+    video_ids = list(dict.fromkeys(video_ids))
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="No videos to process. Send `videos` or a `playlist_url`.")
+    if len(video_ids) > YOUTUBE_BATCH_MAX_VIDEOS:
+        video_batch_store.counters["rejected"] += 1
+        raise HTTPException(status_code=413, detail=f"Too many videos. A batch may contain at most {YOUTUBE_BATCH_MAX_VIDEOS}.")
+    return video_ids
+
+
+async def process_video(index: int, video_id: str, batch_id: str, options: dict, batch_started: float) -> dict:
+    started = time.perf_counter()
+    line = {"type": "video", "index": index, "video_id": video_id}
+    use_cache = not options["no_cache"]
+    try:
+        async with fetch_slots:
+            transcript = await fetch_transcript(video_id, options["language"])
+        async with notes_slots:
+            pipeline = plan_youtube_pipeline(transcript, use_cache=use_cache)
+            ai_notes = await generate_youtube_notes(transcript, use_cache=use_cache, pipeline=pipeline)
+        result = youtube_notes_response(video_url(video_id), video_id, ai_notes, transcript, pipeline)
+        line.update({"status": "ok", "result": result})
+    except Exception as e:
+        error = http_error(e)
+        line.update({"status": "error", "status_code": error.status_code, "detail": error.detail})
+    finished = time.perf_counter()
+    line["processing_seconds"] = round(finished - started, 3)
+    line["latency_seconds"] = round(finished - batch_started, 3)
+    video_batch_store.record_video(line["status"] == "ok", finished - started)
+    if line["status"] == "ok":
+        # Only successes are kept; failed videos are tried again when the batch is resumed
+        await video_batch_store.finish_video(batch_id, video_id, line)
+    return line
+
+
+async def stream_video_batch(batch_id: str, video_ids: List[str], options: dict, finished: Dict[str, dict]):
+    started = time.perf_counter()
+    pending = [(index, video_id) for index, video_id in enumerate(video_ids) if video_id not in finished]
+    tasks = [asyncio.ensure_future(process_video(index, video_id, batch_id, options, started))
+             for index, video_id in pending]
+    lines = []
+    try:
+        yield ndjson({"type": "batch", "batch_id": batch_id, "videos": video_ids, "replayed": len(video_ids) - len(pending),
+                      "concurrency": YOUTUBE_BATCH_CONCURRENCY})
+        # Videos finished by an earlier run of this batch come back first, as stored
+        for index, video_id in enumerate(video_ids):
+            if video_id in finished:
+                line = {**finished[video_id], "index": index, "replayed": True}
+                lines.append(line)
+                video_batch_store.counters["replayed"] += 1
+                yield ndjson(line)
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            lines.append(line)
+            yield ndjson(line)
+        summary = summarize(lines, time.perf_counter() - started, "videos", batch_id=batch_id,
+                            replayed=len(video_ids) - len(pending))
+        if summary["failed"]:
+            summary["resume"] = {"batch_id": batch_id}
+        video_batch_store.record_batch(summary)
+        yield ndjson(summary)
+    finally:
+        # The client went away: stop the videos that have not finished; the batch can be resumed
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/generate-notes/youtube/batch", tags=["youtube-notes"])
+async def generate_youtube_notes_batch(request: YouTubeBatchRequest, no_cache: bool = Query(False)):
+    """
+    Generates notes for several YouTube videos: a list of video URLs or IDs, a playlist, or
+    both. Transcripts are fetched up to YOUTUBE_BATCH_FETCH_CONCURRENCY at a time and notes
+    generated up to YOUTUBE_BATCH_CONCURRENCY at a time, shared across all batches. The
+    response is NDJSON: a `batch` line with the batch ID and the video IDs, one `video` line
+    per video as soon as it finishes (the usual /generate-notes/youtube body under `result`, or
+    `status_code` and `detail`), and a final `summary` line.
+
+    Send `batch_id` to resume a batch that was interrupted or had failures: videos that already
+    succeeded are replayed from storage and only the others are processed.
+    """
+    if request.batch_id:
+        batch = await video_batch_store.load(request.batch_id)
+        if batch is None:
+            raise HTTPException(status_code=404, detail="Batch not found or expired")
+        video_batch_store.counters["resumed"] += 1
+        batch_id, video_ids, options, finished = batch["batch_id"], batch["video_ids"], batch["options"], batch["finished"]
+    else:
+        video_ids = await resolve_videos(request)
+        options = {"language": request.language, "no_cache": no_cache}
+        batch_id = await video_batch_store.create(video_ids, options)
+        finished = {}
+
+    return StreamingResponse(
+        stream_video_batch(batch_id, video_ids, options, finished),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/generate-notes/youtube/batch/{batch_id}", tags=["youtube-notes"])
+async def get_youtube_notes_batch(batch_id: str):
+    """Videos of a batch and which of them have finished, e.g. to decide whether to resume it."""
+    batch = await video_batch_store.load(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found or expired")
+    finished = batch["finished"]
+    return {
+        "batch_id": batch_id,
+        "videos": batch["video_ids"],
+        "finished": [video_id for video_id in batch["video_ids"] if video_id in finished],
+        "pending": [video_id for video_id in batch["video_ids"] if video_id not in finished],
+    }
@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 import re
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+import logging
+from typing import Optional
+from utils.ai_client import GeminiClient
+from utils.sse import sse_response
+from utils.scheduler import SchedulerTimeout, Priority
+from utils.retry import RETRY_POLICIES
+from utils.tokens import PromptTooLargeError, token_estimator
+from utils.transcripts import (transcript_store, Transcript, TranscriptUnavailable, TranscriptTimeout, format_timestamp,
+                               parse_timestamp, video_url)
+from utils.transcript_notes import TranscriptNotesPipeline, needs_windows, timestamp_links
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
+ai_client = GeminiClient()
 
 class YouTubeURLRequest(BaseModel):
     video_url: str
+    # Transcript language code; defaults to TRANSCRIPT_DEFAULT_LANGUAGE
+    language: Optional[str] = None
 
 def extract_video_id(url: str) -> str:
     """Extract YouTube video ID from various URL formats."""
@@ -14,7 +28,8 @@ def extract_video_id(url: str) -> str:
         r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([^&\n?#]+)',
         r'youtube\.com\/watch\?.*v=([^&\n?#]+)',
         r'youtu\.be\/([^&\n?#]+)',
-        r'youtube\.com\/embed\/([^&\n?#]+)'
+        r'youtube\.com\/embed\/([^&\n?#]+)',
+        r'youtube\.com\/(?:shorts|live)\/([^&\n?#\/]+)'
     ]
     
     for pattern in patterns:
@@ -24,13 +39,23 @@ def extract_video_id(url: str) -> str:
     
     raise HTTPException(status_code=400, detail="Invalid YouTube URL format")
 
-async def generate_youtube_notes(transcript: str) -> str:
-    """Generate AI notes from YouTube transcript using Gemini API."""
-    from utils.ai_client import GeminiClient
-    
-    ai_client = GeminiClient()
-    
-    prompt = f"""
+def extract_playlist_id(url: str) -> Optional[str]:
+    """The playlist ID of a playlist URL (the `list` parameter), or None."""
+    match = re.search(r'[?&]list=([A-Za-z0-9_-]+)', url)
+    if match:
+        return match.group(1)
+    return None
+
+def parse_video_reference(value: str) -> str:
+    """A video ID from a YouTube URL or a bare 11-character video ID."""
+    value = value.strip()
+    if re.fullmatch(r'[A-Za-z0-9_-]{11}', value):
+        return value
+    return extract_video_id(value)
+
+def build_youtube_notes_prompt(transcript: str) -> str:
+    """Builds the revision-notes prompt for a YouTube transcript."""
+    return f"""
     Create comprehensive revision notes from the following YouTube video transcript.
     
     Requirements:
@@ -64,95 +89,155 @@ async def generate_youtube_notes(transcript: str) -> str:
     
     Create clean, readable notes using plain text formatting.
     """
-    
+
+def fit_transcript(transcript: str) -> str:
+    """Trims very long transcripts to the model's token budget."""
+    reserve = token_estimator.estimate(build_youtube_notes_prompt(""))
+    return ai_client.fit_to_budget(transcript, reserve, what="The video transcript")
+
+def plan_youtube_pipeline(transcript: Transcript, use_cache: bool = True, priority: Priority = Priority.BULK,
+                          on_progress=None) -> Optional[TranscriptNotesPipeline]:
+    """Long videos are summarized in time windows in parallel; short ones get no pipeline and use a single prompt."""
+    if needs_windows(transcript):
+        return TranscriptNotesPipeline(ai_client, use_cache=use_cache, priority=priority, on_progress=on_progress)
+    return None
+
+async def generate_youtube_notes(transcript: Transcript, use_cache: bool = True, priority: Priority = Priority.BULK,
+                                 pipeline: TranscriptNotesPipeline = None) -> str:
+    """Generate AI notes from YouTube transcript using Gemini API."""
     try:
-        notes = await ai_client._generate_with_fallback(prompt)
+        if pipeline:
+            return await pipeline.generate(transcript)
+        prompt = build_youtube_notes_prompt(fit_transcript(transcript.text))
+        notes = await ai_client._generate_with_fallback(prompt, use_cache=use_cache, priority=priority,
+                                                        retry_policy=RETRY_POLICIES["youtube"])
         return notes
+    except SchedulerTimeout:
+        raise HTTPException(status_code=503, detail="The AI service is busy right now. Please try again in a moment.")
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate AI notes: {str(e)}")
 
-@router.post("/generate-notes/youtube", tags=["youtube-notes"])
-async def generate_youtube_notes_endpoint(request: YouTubeURLRequest):
+def youtube_notes_response(url: str, video_id: str, ai_notes: str, transcript: Transcript,
+                           pipeline: TranscriptNotesPipeline = None) -> dict:
+    response = {
+        "success": True,
+        "ai_notes": ai_notes,
+        "video_url": url,
+        "video_id": video_id,
+        "message": "YouTube notes generated successfully",
+        # Deep links for the timestamps the notes cite
+        "timestamps": timestamp_links(ai_notes, transcript, video_id),
+    }
+    if pipeline:
+        # Time range and title of every part of a long video
+        response["sections"] = [
+            {**section, "url": video_url(video_id, section["start"])} for section in pipeline.sections()
+        ]
+    return response
+
+async def fetch_transcript(video_id: str, language: str = None) -> Transcript:
+    """
+    Fetches a video's transcript; raises HTTPException if there is none. Transcripts come
+    from the transcript cache when possible.
+    """
     try:
-        print(f"Received request with video_url: {request.video_url}")
-        # Extract video ID from URL
-        video_id = extract_video_id(request.video_url)
-        print(f"Extracted video_id: {video_id}")
-        
-        # Fetch transcript
-        try:
-            print(f"Attempting to fetch transcript for video_id: {video_id}")
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-            print(f"Successfully fetched transcript with {len(transcript_list)} entries")
-            
-            # Debug: Print first entry structure
-            if transcript_list:
-                print(f"First transcript entry: {transcript_list[0]}")
-            
-            # Format transcript manually to avoid formatter issues
-            transcript_text = ""
-            for entry in transcript_list:
-                if isinstance(entry, dict) and 'text' in entry:
-                    transcript_text += entry['text'] + " "
-                else:
-                    print(f"Unexpected entry format: {entry}")
-                    transcript_text += str(entry) + " "
-            
-            transcript_text = transcript_text.strip()
-            print(f"Formatted transcript length: {len(transcript_text)} characters")
-        except TranscriptsDisabled as e:
-            print(f"TranscriptsDisabled exception: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        logger.info(f"[YouTube] Fetching transcript for video_id: {video_id}")
+        transcript = await transcript_store.get_transcript(video_id, language)
+        logger.info(f"[YouTube] Got transcript with {len(transcript)} entries, {len(transcript.text)} characters")
+    except TranscriptUnavailable as e:
+        logger.warning(f"[YouTube] Transcript unavailable for {video_id}: {e}")
+        if e.reason == "disabled":
             raise HTTPException(
                 status_code=400,
                 detail="Transcripts are disabled for this video. The video owner has turned off captions/subtitles."
             )
-        except NoTranscriptFound as e:
-            print(f"NoTranscriptFound exception: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(
-                status_code=400,
-                detail="No transcript found for this video. The video may not have any captions or subtitles available."
-            )
-        except Exception as e:
-            print(f"Unexpected error fetching transcript: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(
-                status_code=500,
-                detail=f"An unexpected error occurred while fetching the transcript: {str(e)}"
-            )
+        raise HTTPException(
+            status_code=400,
+            detail="No transcript found for this video. The video may not have any captions or subtitles available."
+        )
+    except TranscriptTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"[YouTube] Unexpected error fetching transcript for {video_id}: {type(e).__name__}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"An unexpected error occurred while fetching the transcript: {str(e)}"
+        )
+
+    if not transcript.text:
+        raise HTTPException(
+            status_code=400,
+            detail="Transcript is empty or unavailable for this video."
+        )
+    return transcript
+
+@router.post("/generate-notes/youtube", tags=["youtube-notes"])
+async def generate_youtube_notes_endpoint(request: YouTubeURLRequest, stream: bool = False, no_cache: bool = False):
+    try:
+        # Extract video ID from URL
+        video_id = extract_video_id(request.video_url)
+        logger.info(f"[YouTube] Notes requested for video_id: {video_id}")
         
-        if not transcript_text.strip():
-            raise HTTPException(
-                status_code=400, 
-                detail="Transcript is empty or unavailable for this video."
+        # Fetch transcript
+        transcript = await fetch_transcript(video_id, request.language)
+        pipeline = plan_youtube_pipeline(transcript, use_cache=not no_cache)
+
+        if stream:
+            def on_complete(ai_notes: str) -> dict:
+                return youtube_notes_response(request.video_url, video_id, ai_notes, transcript, pipeline)
+            if pipeline:
+                # Each part's notes arrive as a progress event as soon as that window is done
+                return sse_response(pipeline.stream(transcript), on_complete=on_complete)
+            prompt = build_youtube_notes_prompt(fit_transcript(transcript.text))
+            return sse_response(
+                ai_client._stream_with_fallback(prompt, use_cache=not no_cache, retry_policy=RETRY_POLICIES["youtube"]),
+                on_complete=on_complete,
             )
-        
+
         # Generate AI notes
-        ai_notes = await generate_youtube_notes(transcript_text)
+        ai_notes = await generate_youtube_notes(transcript, use_cache=not no_cache, pipeline=pipeline)
         
         # Save to Supabase (for now, just return the notes)
         # TODO: Add Supabase integration when authentication is set up
-        print(f"Generated AI notes for video: {video_id}")
-        print(f"Notes length: {len(ai_notes)} characters")
+        logger.info(f"[YouTube] Generated {len(ai_notes)} characters of notes for video: {video_id}")
         
-        return {
-            "success": True,
-            "ai_notes": ai_notes,
-            "video_url": request.video_url,
-            "video_id": video_id,
-            "message": "YouTube notes generated successfully"
-        }
+        return youtube_notes_response(request.video_url, video_id, ai_notes, transcript, pipeline)
         
     except HTTPException as he:
         raise he
+    except PromptTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+@router.get("/youtube-notes/transcript/{video_id}/at", tags=["youtube-notes"])
+async def transcript_at(video_id: str, t: str = Query(..., description="Time in the video: seconds, m:ss or h:mm:ss"),
+                        language: str = None):
+    """What was said at a point in the video, with a few seconds of context and a deep link."""
+    try:
+        seconds = parse_timestamp(t)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    transcript = await fetch_transcript(video_id, language)
+    if seconds > transcript.duration:
+        raise HTTPException(status_code=400, detail=f"The video is only {format_timestamp(transcript.duration)} long.")
+    found = transcript.at(seconds)
+    return {"video_id": video_id, **found, "url": video_url(video_id, found["start"])}
+
+@router.get("/youtube-notes/transcript/{video_id}/search", tags=["youtube-notes"])
+async def transcript_search(video_id: str, q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=200),
+                            language: str = None):
+    """Where a word or phrase is said in the video, in time order, with deep links."""
+    transcript = await fetch_transcript(video_id, language)
+    matches = transcript.search(q, limit)
+    return {
+        "video_id": video_id,
+        "query": q,
+        "matches": [{**match, "url": video_url(video_id, match["start"])} for match in matches],
+    }
+
 @router.get("/youtube-notes/test", tags=["youtube-notes"])
 async def test_youtube_notes():
     """Test endpoint to verify the route is working."""
@@ -163,46 +248,45 @@ async def test_youtube_notes():
     }
 
 @router.get("/youtube-notes/test-transcript/{video_id}", tags=["youtube-notes"])
-async def test_transcript_fetch(video_id: str):
+async def test_transcript_fetch(video_id: str, language: str = None):
     """Test endpoint to verify transcript fetching works."""
     try:
-        print(f"Testing transcript fetch for video_id: {video_id}")
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        print(f"Success! Found {len(transcript_list)} transcript entries")
+        logger.info(f"[YouTube] Testing transcript fetch for video_id: {video_id}")
+        transcript = await transcript_store.get_transcript(video_id, language)
+        logger.info(f"[YouTube] Found {len(transcript)} transcript entries")
         return {
             "success": True,
             "video_id": video_id,
-            "transcript_count": len(transcript_list),
+            "transcript_count": len(transcript),
             "message": "Transcript fetch successful"
         }
-    except TranscriptsDisabled as e:
-        print(f"TranscriptsDisabled exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except TranscriptUnavailable as e:
+        logger.warning(f"[YouTube] Transcript unavailable for {video_id}: {e}")
+        if e.reason == "disabled":
+            return {
+                "success": False,
+                "video_id": video_id,
+                "error": "TranscriptsDisabled",
+                "message": "Transcripts are disabled for this video"
+            }
         return {
             "success": False,
             "video_id": video_id,
-            "error": "TranscriptsDisabled",
-            "message": "Transcripts are disabled for this video"
+            "error": "NoTranscriptFound",
+            "message": "No transcript found for this video"
         }
-    except NoTranscriptFound as e:
-        print(f"NoTranscriptFound exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except TranscriptTimeout as e:
         return {
             "success": False,
             "video_id": video_id,
-            "error": "NoTranscriptFound",
-            "message": "No transcript found for this video"
+            "error": "Timeout",
+            "message": str(e)
         }
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"[YouTube] Unexpected error testing transcript fetch for {video_id}: {type(e).__name__}: {e}", exc_info=True)
         return {
             "success": False,
             "video_id": video_id,
             "error": "UnexpectedError",
             "message": f"Unexpected error: {str(e)}"
-        } 
\ No newline at end of file
+        }
@@ -0,0 +1,54 @@
+from utils.text_normalize import normalize_pages
+
+
+def slide(i: int) -> str:
+    return "\n".join([
+        "Lecture 4 — Linear Algebra",
+        f"Theorem {i}.1",
+        f"Example {i}",
+        f"Let A be a {i}x{i} matrix.",
+        f"Every matrix of rank {i} has property P{i}.",
+        f"Exercise {i}: compute the determinant.",
+    ])
+
+
+def test_slide_pages_keep_their_content():
+    pages, report = normalize_pages([slide(i) for i in range(1, 7)])
+
+    assert all(pages)
+    for i, page in enumerate(pages, 1):
+        assert f"Theorem {i}.1" in page
+        assert f"Example {i}" in page
+        assert f"Every matrix of rank {i} has property P{i}." in page
+    assert not any("theorem" in header or "example" in header for header in report.headers)
+
+
+def test_header_heavy_pdf_strips_headers_and_keeps_body():
+    body = [
+        "Gradient descent updates the weights against the gradient of the loss.",
+        "The learning rate scales each step; too large a rate diverges.",
+        "Momentum averages recent gradients to damp oscillation.",
+        "Stochastic variants estimate the gradient from a mini-batch.",
+        "Early stopping ends training once validation loss rises.",
+    ]
+    pages = [
+        "\n".join([
+            "CS229 Machine Learning — Course Notes",
+            "Confidential - do not distribute",
+            f"Section {i}",
+            f"{body[i - 1]} (part {i})",
+            "Stanford University",
+            f"Page {i} of 5",
+        ])
+        for i in range(1, 6)
+    ]
+
+    normalized, report = normalize_pages(pages)
+
+    for i, page in enumerate(normalized, 1):
+        assert f"{body[i - 1]} (part {i})" in page
+        assert f"Section {i}" in page
+        assert "Course Notes" not in page
+        assert "Page" not in page
+        assert "Confidential" not in page
+    assert report.repeated_lines >= 10
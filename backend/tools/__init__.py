@@ -0,0 +1 @@
+# Makes tools a package
@@ -0,0 +1,82 @@
+"""
+Compares PDF text extraction throughput of the old pypdf path against the PyMuPDF engine in
+utils/file_reader.py, both in-process and page-parallel through the extraction pool:
+
+    python -m tools.bench_extraction sample.pdf other.pdf --repeat 3 --workers 4
+
+pypdf is not a dependency of the app any more; install it separately to include the baseline.
+"""
+import os
+import time
+import asyncio
+import argparse
+
+
+def bench_pypdf(contents: bytes):
+    import io
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(contents))
+    pages = [page.extract_text() or "" for page in reader.pages]
+    return len(pages), sum(len(p) for p in pages)
+
+
+def bench_pymupdf(contents: bytes):
+    from utils.file_reader import extract_pdf_pages
+    pages = extract_pdf_pages(contents)
+    return len(pages), sum(len(p) for p in pages)
+
+
+async def bench_pool(contents: bytes):
+    from utils.file_reader import extract_document
+    document = await extract_document("pdf", contents)
+    return document.page_count, len(document.text)
+
+
+def report(name: str, size: int, pages: int, chars: int, elapsed: float):
+    print(
+        f"  {name:<16} {elapsed:8.3f}s  {pages / elapsed:9.1f} pages/s  "
+        f"{size / elapsed / 1024 / 1024:7.2f} MB/s  {chars:,} chars"
+    )
+
+
+async def run(args):
+    from utils.extraction_pool import extraction_pool
+
+    # Start the workers up front so process spawn time is not billed to the first file
+    await asyncio.gather(*(extraction_pool.run(os.getpid) for _ in range(extraction_pool.workers)))
+
+    for path in args.files:
+        contents = open(path, "rb").read()
+        print(f"{path} ({len(contents) / 1024 / 1024:.1f} MB)")
+        candidates = [("pymupdf", bench_pymupdf), ("pymupdf+pool", None)]
+        try:
+            import pypdf  # noqa: F401
+            candidates.insert(0, ("pypdf", bench_pypdf))
+        except ImportError:
+            print("  pypdf            not installed, skipping baseline")
+
+        for name, fn in candidates:
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                pages, chars = await bench_pool(contents) if fn is None else fn(contents)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            report(name, len(contents), pages, chars, best)
+
+    extraction_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF text extraction")
+    parser.add_argument("files", nargs="+", help="PDF files to extract")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per engine; the best one is reported")
+    parser.add_argument("--workers", type=int, help="extraction pool size (default EXTRACTION_WORKERS)")
+    args = parser.parse_args()
+    if args.workers:
+        os.environ["EXTRACTION_WORKERS"] = str(args.workers)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
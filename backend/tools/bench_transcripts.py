@@ -0,0 +1,93 @@
+"""
+Compares transcript fetching through youtube-transcript-api (blocking, a new requests session
+per call, run in worker threads as TRANSCRIPT_FETCHER=library does) against the native async
+fetcher in utils/youtube_fetcher.py, both against tools/youtube_fixture.py:
+
+    MOCK_YOUTUBE_LATENCY=fixed:0.05 uvicorn tools.youtube_fixture:app --port 8091
+    python -m tools.bench_transcripts --base-url http://localhost:8091 --videos 100 --concurrency 8
+
+Prints transcripts per second and latency percentiles, and checks both paths return the same
+entries.
+"""
+import time
+import asyncio
+import argparse
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def point_library_at(base_url: str):
+    """youtube-transcript-api has its URLs hard-coded; redirect them to the fixture server."""
+    from youtube_transcript_api import _transcripts
+    _transcripts.WATCH_URL = base_url + "/watch?v={video_id}"
+    _transcripts.INNERTUBE_API_URL = base_url + "/youtubei/v1/player?key={api_key}"
+
+
+async def run_path(name: str, fetch, video_ids, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, entries = [], 0
+
+    async def one(video_id: str):
+        nonlocal entries
+        async with slots:
+            started = time.perf_counter()
+            result = await fetch(video_id)
+            latencies.append(time.perf_counter() - started)
+            entries += len(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(video_id) for video_id in video_ids))
+    elapsed = time.perf_counter() - started
+    print(
+        f"  {name:<8} {elapsed:8.3f}s  {len(video_ids) / elapsed:8.1f} transcripts/s  "
+        f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p95 {percentile(latencies, 0.95) * 1000:7.1f} ms  "
+        f"{entries:,} entries"
+    )
+    return len(video_ids) / elapsed
+
+
+async def run(args):
+    from utils import http_pool
+    from utils.transcripts import fetch_transcript_entries
+    from utils.youtube_fetcher import AsyncTranscriptFetcher
+
+    point_library_at(args.base_url)
+    fetcher = AsyncTranscriptFetcher(args.base_url, concurrency=args.concurrency)
+
+    async def library(video_id: str):
+        return await asyncio.to_thread(fetch_transcript_entries, video_id, "en")
+
+    async def native(video_id: str):
+        return await fetcher.get_transcript(video_id, ["en"])
+
+    sample = "benchcheck0"
+    same = [(e["text"], e["start"], e["duration"]) for e in await library(sample)] == \
+           [(e["text"], e["start"], e["duration"]) for e in await native(sample)]
+    print(f"Both paths return the same entries: {'yes' if same else 'NO'}")
+
+    try:
+        for round_number in range(1, args.repeat + 1):
+            video_ids = [f"bench{round_number:02d}{i:04d}" for i in range(args.videos)]
+            print(f"Round {round_number}: {args.videos} videos, concurrency {args.concurrency}")
+            baseline = await run_path("library", library, video_ids, args.concurrency)
+            fast = await run_path("async", native, video_ids, args.concurrency)
+            print(f"  speed-up {fast / baseline:.2f}x")
+        print(f"HTTP requests made by the async fetcher: {fetcher.counters['requests']}")
+    finally:
+        await http_pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YouTube transcript fetching")
+    parser.add_argument("--base-url", default="http://localhost:8091", help="tools/youtube_fixture.py address")
+    parser.add_argument("--videos", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Small async load generator for the backend routes. Pair it with tools/mock_gemini.py so no
+real Gemini quota is used:
+
+    python -m tools.loadtest --route chat --requests 200 --concurrency 20
+    python -m tools.loadtest --route notes --file sample.pdf --requests 20 --concurrency 4
+
+Prints throughput, latency percentiles and status code counts.
+"""
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+
+PRESETS = {
+    "ping": ("GET", "/ping", None),
+    "plan": ("POST", "/generate-plan", {"goal": "Learn linear algebra", "speed": "average", "hours_per_day": 2, "duration_days": 7}),
+    "insights": ("POST", "/generate-insights", {"note_content": "Eigenvalues describe how a linear map stretches space."}),
+    "topic": ("POST", "/generate-notes-from-topic", {"topic": "Eigenvalues", "day": 1, "tasks": ["Read chapter 5"]}),
+    "chat": ("POST", "/chat-with-notes", {"message": "What is an eigenvalue?", "context": "Eigenvalues describe how a linear map stretches space.", "selected_notes": ["Linear algebra"], "user_id": "loadtest"}),
+    "notes": ("POST", "/generate-notes", None),
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def run(args):
+    method, path, body = PRESETS[args.route]
+    file_bytes = open(args.file, "rb").read() if args.file else None
+    latencies, statuses = [], Counter()
+    remaining = iter(range(args.requests))
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        async def worker():
+            for index in remaining:
+                # Vary the payload so the response cache and request coalescing do not hide upstream latency
+                params = {"no_cache": "true"} if args.no_cache else {}
+                started = time.perf_counter()
+                try:
+                    if args.route == "notes":
+                        name = f"loadtest_{index}.{args.file.rsplit('.', 1)[-1]}"
+                        response = await client.post(path, params=params, files={"file": (name, file_bytes)})
+                    elif body is not None:
+                        payload = dict(body)
+                        if args.unique:
+                            first_key = next(iter(payload))
+                            payload[first_key] = f"{payload[first_key]} #{index}"
+                        response = await client.request(method, path, params=params, json=payload)
+                    else:
+                        response = await client.request(method, path)
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"route={args.route} requests={args.requests} concurrency={args.concurrency}")
+    print(f"elapsed={elapsed:.2f}s throughput={args.requests / elapsed:.2f} req/s")
+    print(
+        "latency p50={:.3f}s p95={:.3f}s p99={:.3f}s max={:.3f}s".format(
+            percentile(latencies, 0.5), percentile(latencies, 0.95), percentile(latencies, 0.99), max(latencies, default=0.0)
+        )
+    )
+    print("status:", dict(statuses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test StudyAI backend routes")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--route", choices=sorted(PRESETS), default="chat")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--file", help="document to upload for --route notes")
+    parser.add_argument("--unique", action="store_true", help="make every request body unique")
+    parser.add_argument("--no-cache", action="store_true", help="send ?no_cache=true")
+    args = parser.parse_args()
+    if args.route == "notes" and not args.file:
+        parser.error("--route notes needs --file")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Deterministic local stand-in for the Gemini REST API, for load testing and offline development.
+
+Run it next to the backend:
+
+    uvicorn tools.mock_gemini:app --port 8090
+    GEMINI_BASE_URL=http://localhost:8090 GEMINI_API_KEY=test uvicorn main:app --port 8000
+
+It speaks the generateContent, streamGenerateContent (alt=sse) and countTokens wire format.
+Behaviour is configured through environment variables (or a JSON file, see MOCK_GEMINI_CONFIG):
+
+    MOCK_GEMINI_SEED             RNG seed; the same seed and request order give the same run (default 42)
+    MOCK_GEMINI_LATENCY          fixed:S | uniform:LO:HI | normal:MEAN:STD | lognormal:MU:SIGMA (seconds)
+    MOCK_GEMINI_ERRORS           injected error rates, e.g. "429:0.05,503:0.02,403:0,timeout:0.01"
+    MOCK_GEMINI_TIMEOUT_SECONDS  how long a "timeout" error hangs before answering (default 300)
+    MOCK_GEMINI_MODE             "canned" (note-shaped text, JSON for plan prompts) or "echo"
+    MOCK_GEMINI_CANNED_FILE      file whose content replaces the built-in canned notes
+    MOCK_GEMINI_STREAM_CHUNKS    number of chunks a streamed answer is split into (default 8)
+    MOCK_GEMINI_CONFIG           JSON file with the same keys in lower case (without the prefix),
+                                 plus an optional "models" object of per-model overrides
+"""
+import os
+import json
+import math
+import random
+import asyncio
+import logging
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANNED_NOTES = """1. MAIN TOPIC
+- Key point one
+- Key point two
+- Important concept
+
+1.1 Sub-topic
+- Detailed explanation
+- Related information
+- Examples
+
+SUMMARY
+- Main takeaways
+- Key points to remember
+"""
+
+DEFAULT_CANNED_PLAN = {
+    "title": "Mock Study Plan",
+    "totalDays": 3,
+    "dailyHours": 2,
+    "estimatedCompletion": "in 3 days",
+    "days": [
+        {"day": day, "topic": f"Topic {day}", "time": "2 hours",
+         "tasks": [f"Read chapter {day}", f"Practice set {day}"], "completed": False}
+        for day in range(1, 4)
+    ],
+}
+
+
+def _load_config() -> dict:
+    config = {
+        "seed": int(os.getenv("MOCK_GEMINI_SEED", "42")),
+        "latency": os.getenv("MOCK_GEMINI_LATENCY", "lognormal:-1.2:0.5"),
+        "errors": os.getenv("MOCK_GEMINI_ERRORS", ""),
+        "timeout_seconds": float(os.getenv("MOCK_GEMINI_TIMEOUT_SECONDS", "300")),
+        "mode": os.getenv("MOCK_GEMINI_MODE", "canned"),
+        "canned_file": os.getenv("MOCK_GEMINI_CANNED_FILE", ""),
+        "stream_chunks": int(os.getenv("MOCK_GEMINI_STREAM_CHUNKS", "8")),
+        "models": {},
+    }
+    path = os.getenv("MOCK_GEMINI_CONFIG")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    return config
+
+
+def _parse_errors(spec: str) -> dict:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, rate = item.split(":")
+        rates[kind] = float(rate)
+    return rates
+
+
+class MockBehaviour:
+    def __init__(self, config: dict):
+        self.config = config
+        self.rng = random.Random(config["seed"])
+        self.counters = {"requests": 0, "errors": {}, "by_model": {}}
+        canned_file = config.get("canned_file")
+        if canned_file:
+            with open(canned_file, encoding="utf-8") as f:
+                self.canned_notes = f.read()
+        else:
+            self.canned_notes = DEFAULT_CANNED_NOTES
+
+    def setting(self, model: str, key: str):
+        return self.config.get("models", {}).get(model, {}).get(key, self.config[key])
+
+    def latency(self, model: str) -> float:
+        kind, *args = str(self.setting(model, "latency")).split(":")
+        values = [float(a) for a in args]
+        if kind == "fixed":
+            return values[0]
+        if kind == "uniform":
+            return self.rng.uniform(values[0], values[1])
+        if kind == "normal":
+            return max(0.0, self.rng.gauss(values[0], values[1]))
+        if kind == "lognormal":
+            return self.rng.lognormvariate(values[0], values[1])
+        raise ValueError(f"Unknown latency distribution: {kind}")
+
+    def pick_error(self, model: str) -> Optional[str]:
+        roll = self.rng.random()
+        cumulative = 0.0
+        for kind, rate in _parse_errors(self.setting(model, "errors")).items():
+            cumulative += rate
+            if roll < cumulative:
+                return kind
+        return None
+
+    def answer(self, model: str, prompt: str) -> str:
+        if self.setting(model, "mode") == "echo":
+            return f"[{model}] {prompt.strip()[:2000]}"
+        if "day-by-day study plan" in prompt:
+            return "```json\n" + json.dumps(DEFAULT_CANNED_PLAN, indent=2) + "\n```"
+        return self.canned_notes
+
+    def count(self, model: str, error: Optional[str] = None):
+        self.counters["requests"] += 1
+        self.counters["by_model"][model] = self.counters["by_model"].get(model, 0) + 1
+        if error:
+            self.counters["errors"][error] = self.counters["errors"].get(error, 0) + 1
+
+
+behaviour = MockBehaviour(_load_config())
+app = FastAPI(title="Mock Gemini API")
+
+
+def _prompt_text(body: dict) -> str:
+    return "".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def _tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _response_body(text: str, prompt: str, final: bool = True) -> dict:
+    body = {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP" if final else None,
+            "index": 0,
+        }],
+        "modelVersion": "mock",
+    }
+    if final:
+        body["usageMetadata"] = {
+            "promptTokenCount": _tokens(prompt),
+            "candidatesTokenCount": _tokens(text),
+            "totalTokenCount": _tokens(prompt) + _tokens(text),
+        }
+    return body
+
+
+def _error_response(status_code: int) -> JSONResponse:
+    messages = {
+        403: ("PERMISSION_DENIED", "Method doesn't allow unregistered callers."),
+        429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+        503: ("UNAVAILABLE", "The model is overloaded. Please try again later."),
+    }
+    status, message = messages.get(status_code, ("INTERNAL", "Internal error."))
+    error = {"code": status_code, "message": message, "status": status}
+    headers = {}
+    if status_code == 429:
+        error["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "2s"}]
+        headers["Retry-After"] = "2"
+    return JSONResponse({"error": error}, status_code=status_code, headers=headers)
+
+
+@app.head("/")
+@app.get("/")
+async def root():
+    # Target of the backend's connection warm-up
+    return {"service": "mock-gemini"}
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    return behaviour.counters
+
+
+@app.post("/v1beta/models/{model_action}")
+async def model_action(model_action: str, request: Request):
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+    prompt = _prompt_text(body)
+
+    if action == "countTokens":
+        behaviour.count(model)
+        return {"totalTokens": _tokens(prompt)}
+    if action not in ("generateContent", "streamGenerateContent"):
+        return JSONResponse({"error": {"code": 404, "message": f"Unknown action {action}"}}, status_code=404)
+
+    # Draw latency and error before sleeping so the RNG sequence only depends on request order
+    latency = behaviour.latency(model)
+    error = behaviour.pick_error(model)
+    behaviour.count(model, error)
+
+    if error == "timeout":
+        await asyncio.sleep(behaviour.setting(model, "timeout_seconds"))
+    elif error:
+        await asyncio.sleep(latency * 0.1)
+        return _error_response(int(error))
+
+    text = behaviour.answer(model, prompt)
+    if action == "generateContent":
+        await asyncio.sleep(latency)
+        return _response_body(text, prompt)
+
+    chunks = max(1, int(behaviour.setting(model, "stream_chunks")))
+    size = math.ceil(len(text) / chunks)
+    pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    async def events():
+        # Time to first token is a third of the total latency, the rest is spread over the chunks
+        await asyncio.sleep(latency / 3)
+        for index, piece in enumerate(pieces):
+            final = index == len(pieces) - 1
+            yield f"data: {json.dumps(_response_body(piece, prompt, final=final))}\r\n\r\n"
+            if not final:
+                await asyncio.sleep(latency * 2 / 3 / len(pieces))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,126 @@
+"""
+Local stand-in for the parts of YouTube that transcript fetching talks to, for tests and
+benchmarks without the network. It speaks the same protocol to both transcript fetchers:
+the watch page (with the Innertube API key), the player API (caption tracks) and timedtext XML.
+
+    uvicorn tools.youtube_fixture:app --port 8091
+    YOUTUBE_BASE_URL=http://localhost:8091 uvicorn main:app --port 8000
+
+Video IDs pick the behaviour:
+
+    disabled*     captions are turned off (TranscriptsDisabled)
+    unavailable*  the video does not exist (VideoUnavailable)
+    de*           only a German generated track (NoTranscriptFound for "en")
+    blocked*      every request answers 429
+    anything else English manual and generated tracks plus a German generated track
+
+Other settings come from environment variables:
+
+    MOCK_YOUTUBE_ENTRIES   transcript entries per video (default 1200, 5 seconds each)
+    MOCK_YOUTUBE_LATENCY   fixed:S | uniform:LO:HI seconds added to every response (default fixed:0)
+    MOCK_YOUTUBE_SEED      seed of the generated transcript text (default 42)
+"""
+import os
+import random
+import asyncio
+from html import escape
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse
+
+API_KEY = "fixture-innertube-key"
+WORDS = ("the matrix eigenvalue vector basis linear map determinant we can see that so this is "
+         "an important result it's called the spectral theorem & we'll prove it next").split()
+
+app = FastAPI(title="YouTube fixture")
+counters = {"watch": 0, "player": 0, "timedtext": 0}
+
+
+def _latency() -> float:
+    kind, *args = os.getenv("MOCK_YOUTUBE_LATENCY", "fixed:0").split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return random.uniform(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+
+async def _delay():
+    seconds = _latency()
+    if seconds > 0:
+        await asyncio.sleep(seconds)
+
+
+def transcript_entries(video_id: str, lang: str) -> list:
+    """The transcript served for a video: deterministic for a video, language and seed."""
+    rng = random.Random(f"{os.getenv('MOCK_YOUTUBE_SEED', '42')}:{video_id}:{lang}")
+    entries = int(os.getenv("MOCK_YOUTUBE_ENTRIES", "1200"))
+    return [
+        {"text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))), "start": i * 5.0, "duration": 4.8}
+        for i in range(entries)
+    ]
+
+
+@app.get("/watch")
+async def watch(v: str):
+    counters["watch"] += 1
+    await _delay()
+    if v.startswith("blocked"):
+        return Response(status_code=429)
+    # Like the real page, the config is embedded in a script tag with HTML entities
+    html = (
+        "<html><head><title>Fixture</title></head><body>"
+        f"<script>ytcfg.set({{&quot;INNERTUBE_API_KEY&quot;: &quot;{API_KEY}&quot;, &quot;VIDEO_ID&quot;: &quot;{escape(v)}&quot;}});</script>"
+        "</body></html>"
+    )
+    return HTMLResponse(html)
+
+
+@app.post("/youtubei/v1/player")
+async def player(request: Request, key: str = ""):
+    counters["player"] += 1
+    await _delay()
+    body = await request.json()
+    video_id = body.get("videoId", "")
+    if key != API_KEY:
+        return JSONResponse({"error": {"code": 400, "message": "API key not valid"}}, status_code=400)
+    if video_id.startswith("blocked"):
+        return Response(status_code=429)
+    if video_id.startswith("unavailable"):
+        return JSONResponse({"playabilityStatus": {"status": "ERROR", "reason": "This video is unavailable"}})
+    data = {"playabilityStatus": {"status": "OK"}}
+    if video_id.startswith("disabled"):
+        return JSONResponse(data)
+
+    base = str(request.base_url).rstrip("/")
+
+    def track(code: str, name: str, generated: bool) -> dict:
+        kind = "asr" if generated else ""
+        entry = {"baseUrl": f"{base}/api/timedtext?v={video_id}&lang={code}&kind={kind}&fmt=srv3",
+                 "name": {"runs": [{"text": name}]}, "languageCode": code, "isTranslatable": True}
+        if generated:
+            entry["kind"] = "asr"
+        return entry
+
+    tracks = [track("de", "German (auto-generated)", True)]
+    if not video_id.startswith("de"):
+        tracks = [track("en", "English", False), track("en", "English (auto-generated)", True)] + tracks
+    data["captions"] = {"playerCaptionsTracklistRenderer": {"captionTracks": tracks, "translationLanguages": []}}
+    return JSONResponse(data)
+
+
+@app.get("/api/timedtext")
+async def timedtext(v: str, lang: str = "en", kind: str = ""):
+    counters["timedtext"] += 1
+    await _delay()
+    lines = "".join(
+        f'<text start="{e["start"]:.2f}" dur="{e["duration"]:.2f}">{escape(escape(e["text"]))}</text>'
+        for e in transcript_entries(v + kind, lang)
+    )
+    return Response(f'<?xml version="1.0" encoding="utf-8" ?><transcript>{lines}</transcript>', media_type="text/xml")
+
+
+@app.get("/fixture/stats")
+async def fixture_stats():
+    return counters
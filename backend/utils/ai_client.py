@@ -1,7 +1,20 @@
 import os
+import json
+import time
+import asyncio
 import httpx
 from dotenv import load_dotenv
 import logging
+from dataclasses import dataclass
+from typing import Optional
+from utils import http_pool
+from utils.llm_cache import llm_cache, make_key, CACHE_ENABLED
+from utils.singleflight import SingleFlight
+from utils.hedging import LatencyTracker, HedgePolicy, HEDGE_ENABLED
+from utils.circuit_breaker import ModelHealth, CB_PROBE_INTERVAL
+from utils.scheduler import GeminiScheduler, Priority, SchedulerTimeout, DEFAULT_DEADLINES
+from utils.retry import RetryPolicy, RetryStats, RETRY_POLICIES, decorrelated_jitter, parse_retry_after
+from utils.tokens import token_estimator, prompt_budget, PromptTooLargeError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -18,24 +31,77 @@ GEMINI_MODELS = [
 # Set a longer timeout (in seconds)
 CLIENT_TIMEOUT = 120.0
 
+# Point this at tools/mock_gemini.py (e.g. http://localhost:8090) for load tests and offline work
+GEMINI_API_HOST = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+
+# Shared by every GeminiClient instance so coalescing and latency stats work across routes
+gemini_flights = SingleFlight()
+latency_tracker = LatencyTracker()
+hedge_policy = HedgePolicy(latency_tracker)
+model_health = ModelHealth(latency_tracker)
+scheduler = GeminiScheduler()
+retry_stats = RetryStats()
+
+
+class GeminiAPIError(Exception):
+    """
+    A failed Gemini call. The message is the user-facing text the routes already rely on;
+    status_code and retry_after let the retry policy decide whether to try again.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None,
+                 timeout: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.timeout = timeout
+
+    def is_retryable(self, policy: RetryPolicy) -> bool:
+        return self.timeout or self.status_code in policy.retry_on
+
+
+@dataclass
+class _CallOptions:
+    """Per-request settings threaded from the public methods down to each model call."""
+    priority: Priority
+    retry_policy: RetryPolicy
+    deadline_at: float
+
+    @classmethod
+    def create(cls, priority: Priority, retry_policy: Optional[RetryPolicy]) -> "_CallOptions":
+        policy = retry_policy or RETRY_POLICIES["default"]
+        return cls(priority, policy, time.monotonic() + policy.deadline)
+
 class GeminiClient:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             logger.critical("GEMINI_API_KEY not found in .env file or environment variables. The application will not work without it.")
             raise ValueError("GEMINI_API_KEY not found in .env file")
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+        self.base_url = f"{GEMINI_API_HOST}/v1beta/models"
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """The app-wide pooled client; one keep-alive pool is shared by every GeminiClient."""
+        return http_pool.get_client("gemini", timeout=CLIENT_TIMEOUT)
+
+    async def warm_up(self):
+        """Opens pooled connections to the Gemini host so the first request skips the handshake."""
+        self.http_client  # creates the pool on first use
+        await http_pool.warm_up("gemini", GEMINI_API_HOST)
 
     async def health_check(self):
         """
         Checks Gemini API connectivity and authentication by making a minimal request.
         Returns a dict with status and error details if any.
+        The outcome is fed to the model's circuit breaker.
         """
         test_prompt = "Say hello."
         for model in GEMINI_MODELS:
             try:
                 logger.info(f"[HealthCheck] Testing model: {model}")
-                result = await self.call_gemini_api(model, test_prompt)
+                options = _CallOptions.create(Priority.BACKGROUND, RETRY_POLICIES["background"])
+                result = await self._timed_call(model, test_prompt, None, options, force=True)
                 if result:
                     logger.info(f"[HealthCheck] Model {model} responded successfully.")
                     return {"success": True, "model": model, "response": result}
@@ -43,85 +109,397 @@ class GeminiClient:
                 logger.error(f"[HealthCheck] Model {model} failed: {e}")
         return {"success": False, "error": "All Gemini models failed. Check API key, billing, and API enablement."}
 
-    async def call_gemini_api(self, model: str, prompt: str):
-        api_url = f"{self.base_url}/{model}:generateContent?key={self.api_key}"
-        
+    async def probe_unhealthy_models(self):
+        """Sends one probe to every model whose circuit is half-open, so it can close without user traffic."""
+        for model in GEMINI_MODELS:
+            if model_health.breaker(model).probe_due():
+                try:
+                    logger.info(f"[HealthCheck] Probing model: {model}")
+                    options = _CallOptions.create(Priority.BACKGROUND, RETRY_POLICIES["background"])
+                    await self._timed_call(model, "Say hello.", None, options)
+                except Exception as e:
+                    logger.warning(f"[HealthCheck] Probe to {model} failed: {e}")
+
+    async def run_health_monitor(self, interval: float = CB_PROBE_INTERVAL):
+        """Background task started from the app lifespan."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.probe_unhealthy_models()
+
+    def _build_payload(self, prompt: str, generation_config: Optional[dict] = None) -> dict:
         payload = {
             "contents": [{"parts":[{"text": prompt}]}]
         }
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return payload
+
+    async def call_gemini_api(self, model: str, prompt: str, generation_config: Optional[dict] = None):
+        api_url = f"{self.base_url}/{model}:generateContent?key={self.api_key}"
         
+        payload = self._build_payload(prompt, generation_config)
+        
+        headers = {"Content-Type": "application/json"}
+
+        client = self.http_client
+        try:
+            response = await client.post(api_url, headers=headers, json=payload)
+            response.raise_for_status()
+            result = response.json()
+            token_estimator.record_usage(model, prompt, result.get("usageMetadata"))
+
+            candidates = result.get("candidates")
+            if not candidates or not candidates[0].get("content"):
+                raise ValueError(f"Gemini API returned unexpected structure: {result}")
+            parts = candidates[0]["content"].get("parts")
+            if not parts or not parts[0].get("text"):
+                raise ValueError(f"Gemini API returned unexpected structure: {result}")
+            
+            return parts[0]["text"]
+
+        except httpx.HTTPStatusError as e:
+            self._raise_http_error(model, e)
+        except httpx.TimeoutException:
+            logger.error(f"Request to model {model} timed out.")
+            raise GeminiAPIError("The Gemini API request timed out. Please try again later.", timeout=True)
+        except Exception as e:
+            logger.error(f"Unexpected error with model {model}: {type(e).__name__}: {e}", exc_info=True)
+            raise Exception(f"Unexpected error: {e}")
+
+    async def stream_gemini_api(self, model: str, prompt: str, generation_config: Optional[dict] = None):
+        """
+        Streams the response of a single model as text chunks using :streamGenerateContent.
+        Errors are mapped to the same user-facing messages as call_gemini_api.
+        """
+        api_url = f"{self.base_url}/{model}:streamGenerateContent?alt=sse&key={self.api_key}"
+
+        payload = self._build_payload(prompt, generation_config)
+
         headers = {"Content-Type": "application/json"}
 
-        async with httpx.AsyncClient(timeout=CLIENT_TIMEOUT) as client:
+        client = self.http_client
+        usage = None
+        try:
+            async with client.stream("POST", api_url, headers=headers, json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                # With alt=sse every event is a "data: {...}" line holding a partial GenerateContentResponse
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):])
+                    usage = chunk.get("usageMetadata") or usage
+                    candidates = chunk.get("candidates") or [{}]
+                    parts = (candidates[0].get("content") or {}).get("parts") or []
+                    text = "".join(part.get("text", "") for part in parts)
+                    if text:
+                        yield text
+            token_estimator.record_usage(model, prompt, usage)
+        except httpx.HTTPStatusError as e:
+            self._raise_http_error(model, e)
+        except httpx.TimeoutException:
+            logger.error(f"Streaming request to model {model} timed out.")
+            raise GeminiAPIError("The Gemini API request timed out. Please try again later.", timeout=True)
+
+    async def count_tokens(self, model: str, text: str) -> int:
+        """Exact token count from the countTokens API. Costs a round trip; budgeting uses the local estimate."""
+        api_url = f"{self.base_url}/{model}:countTokens?key={self.api_key}"
+        try:
+            response = await self.http_client.post(api_url, json={"contents": [{"parts": [{"text": text}]}]})
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self._raise_http_error(model, e)
+        return response.json().get("totalTokens", 0)
+
+    def prompt_budget(self) -> int:
+        """Input token budget that fits every model in the fallback chain."""
+        return min(prompt_budget(model) for model in GEMINI_MODELS)
+
+    def fit_to_budget(self, text: str, reserve_tokens: int = 0, what: str = "Input") -> str:
+        """Trims (or rejects) `text` so that it plus `reserve_tokens` of surrounding prompt fits the budget."""
+        return token_estimator.fit(text, self.prompt_budget() - reserve_tokens, what)
+
+    def _check_prompt_size(self, prompt: str):
+        estimated = token_estimator.estimate(prompt)
+        if estimated > self.prompt_budget():
+            token_estimator.rejected += 1
+            raise PromptTooLargeError(
+                f"The request is too large to process (about {estimated:,} tokens, limit {self.prompt_budget():,})."
+            )
+
+    def _raise_http_error(self, model: str, e: httpx.HTTPStatusError):
+        # Enhanced error handling for user-friendly messages
+        status_code = e.response.status_code
+        retry_after = parse_retry_after(e.response)
+        try:
+            error_body = e.response.json()
+        except Exception:
+            error_body = e.response.text
+        if status_code == 403:
+            logger.error(f"Authentication failed for model {model} (Forbidden). This often means your API key is invalid or the Gemini API is not enabled in your Google Cloud project.")
+            raise GeminiAPIError("Authentication failed: Check your Gemini API key and API enablement in Google Cloud.", status_code)
+        elif status_code == 503:
+            logger.warning(f"Model {model} is overloaded. Trying next model.")
+            # Propagate a special message for user-facing error
+            raise GeminiAPIError("The Gemini model is currently overloaded. Please try again later.", status_code, retry_after)
+        elif status_code == 429:
+            logger.error(f"Quota exceeded for model {model}. Response: {error_body}")
+            raise GeminiAPIError("You have exceeded your Gemini API quota. Please check your plan and billing details at https://ai.google.dev/gemini-api/docs/rate-limits.", status_code, retry_after)
+        logger.error(f"Gemini API HTTP error with model {model}. Status code: {status_code}. Response: {error_body}", exc_info=True)
+        raise GeminiAPIError(f"Gemini API error ({status_code}): {error_body}", status_code, retry_after)
+
+    async def _cached_response(self, prompt: str, generation_config: Optional[dict], use_cache: bool) -> Optional[str]:
+        """Looks the prompt up for every model in fallback order; an answer from any of them will do."""
+        if not (use_cache and CACHE_ENABLED):
+            return None
+        keys = [make_key(model, prompt, generation_config) for model in GEMINI_MODELS]
+        return await llm_cache.get(*keys)
+
+    async def _store_response(self, model: str, prompt: str, generation_config: Optional[dict], result: str, use_cache: bool):
+        if use_cache and CACHE_ENABLED and result:
+            await llm_cache.set(make_key(model, prompt, generation_config), model, result)
+
+    async def _generate_with_fallback(self, prompt: str, generation_config: Optional[dict] = None, use_cache: bool = True,
+                                      priority: Priority = Priority.BULK, retry_policy: Optional[RetryPolicy] = None):
+        cached = await self._cached_response(prompt, generation_config, use_cache)
+        if cached is not None:
+            logger.info("Serving response from LLM cache")
+            return cached
+        self._check_prompt_size(prompt)
+        # Identical prompts already in flight (double clicks, frontend retries) share one upstream call
+        flight_key = make_key(",".join(GEMINI_MODELS), prompt, {"config": generation_config, "use_cache": use_cache})
+        return await gemini_flights.do(
+            flight_key,
+            lambda: self._generate_uncached(prompt, generation_config, use_cache, _CallOptions.create(priority, retry_policy)),
+        )
+
+    async def _acquire_slot(self, model: str, prompt: str, options: _CallOptions):
+        """Waits for a rate-limit slot; a queue timeout is not the model's fault, so the breaker ignores it."""
+        breaker = model_health.breaker(model)
+        remaining = max(0.0, options.deadline_at - time.monotonic())
+        try:
+            await scheduler.acquire(
+                model, token_estimator.estimate(prompt), options.priority,
+                deadline=min(DEFAULT_DEADLINES[options.priority], remaining),
+            )
+        except (SchedulerTimeout, asyncio.CancelledError):
+            breaker.abandon()
+            raise
+
+    def _retry_delay(self, model: str, error: Exception, attempt: int, previous: float,
+                     options: _CallOptions) -> Optional[float]:
+        """
+        How long to back off before retrying `model`, or None to give up on it. Uses decorrelated
+        jitter, never sleeps less than the server's Retry-After/RetryInfo, and gives up rather
+        than sleep past the request deadline.
+        """
+        policy = options.retry_policy
+        if not isinstance(error, GeminiAPIError) or not error.is_retryable(policy):
+            return None
+        if attempt >= policy.max_attempts:
+            retry_stats.record_give_up(model)
+            return None
+        delay = max(decorrelated_jitter(previous, policy), error.retry_after or 0.0)
+        if time.monotonic() + delay >= options.deadline_at:
+            logger.warning(f"Not retrying {model}: a {delay:.1f}s backoff would pass the request deadline")
+            retry_stats.record_give_up(model)
+            return None
+        retry_stats.record_retry(model, error.status_code, delay)
+        logger.info(f"Retrying {model} in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+        return delay
+
+    async def _timed_call(self, model: str, prompt: str, generation_config: Optional[dict],
+                          options: _CallOptions, force: bool = False):
+        """
+        call_gemini_api plus retries and health bookkeeping: the circuit breaker gates each attempt
+        and records its outcome, the scheduler queues it behind the model's rate limits, transient
+        errors are retried per the retry policy, and successful latencies feed hedging and health scores.
+        `force` skips the breaker check (health checks, or every circuit being open).
+        """
+        breaker = model_health.breaker(model)
+        attempt = 0
+        delay = options.retry_policy.base_delay
+        while True:
+            attempt += 1
+            if not force:
+                breaker.before_call()
+            await self._acquire_slot(model, prompt, options)
+            started = time.perf_counter()
             try:
-                response = await client.post(api_url, headers=headers, json=payload)
-                response.raise_for_status()
-                result = response.json()
-
-                candidates = result.get("candidates")
-                if not candidates or not candidates[0].get("content"):
-                    raise ValueError(f"Gemini API returned unexpected structure: {result}")
-                parts = candidates[0]["content"].get("parts")
-                if not parts or not parts[0].get("text"):
-                    raise ValueError(f"Gemini API returned unexpected structure: {result}")
-                
-                return parts[0]["text"]
-
-            except httpx.HTTPStatusError as e:
-                # Enhanced error handling for user-friendly messages
-                status_code = e.response.status_code
-                try:
-                    error_body = e.response.json()
-                except Exception:
-                    error_body = e.response.text
-                if status_code == 403:
-                    logger.error(f"Authentication failed for model {model} (Forbidden). This often means your API key is invalid or the Gemini API is not enabled in your Google Cloud project.")
-                    raise Exception("Authentication failed: Check your Gemini API key and API enablement in Google Cloud.")
-                elif status_code == 503:
-                    logger.warning(f"Model {model} is overloaded. Trying next model.")
-                    # Propagate a special message for user-facing error
-                    raise Exception("The Gemini model is currently overloaded. Please try again later.")
-                elif status_code == 429:
-                    logger.error(f"Quota exceeded for model {model}. Response: {error_body}")
-                    raise Exception("You have exceeded your Gemini API quota. Please check your plan and billing details at https://ai.google.dev/gemini-api/docs/rate-limits.")
-                logger.error(f"--- Gemini API HTTP Error with model {model} ---")
-                print(f"Status Code: {status_code}")
-                print(f"Response Body: {error_body}")
-                print("-----------------------------")
-                raise Exception(f"Gemini API error ({status_code}): {error_body}")
-            except httpx.ReadTimeout:
-                print(f"--- Timeout Error with model {model} ---")
-                print(f"The request to the model took too long to respond.")
-                print("------------------------")
-                raise Exception("The Gemini API request timed out. Please try again later.")
+                result = await self.call_gemini_api(model, prompt, generation_config)
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
             except Exception as e:
-                print(f"--- Unexpected Error with model {model} ---")
-                print(f"Error Type: {type(e)}")
-                print(f"Error Message: {e}")
-                import traceback
-                traceback.print_exc()
-                print("------------------------")
-                raise Exception(f"Unexpected error: {e}")
-
-    async def _generate_with_fallback(self, prompt: str):
-        for model in GEMINI_MODELS:
+                breaker.record_failure()
+                delay = self._retry_delay(model, e, attempt, delay, options)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            latency_tracker.record(model, time.perf_counter() - started)
+            breaker.record_success()
+            return result
+
+    def _model_order(self):
+        """Fallback order for the next request: healthiest models first, open circuits skipped."""
+        return model_health.ordered(GEMINI_MODELS), model_health.all_unavailable(GEMINI_MODELS)
+
+    async def _generate_uncached(self, prompt: str, generation_config: Optional[dict], use_cache: bool, options: _CallOptions):
+        if HEDGE_ENABLED and len(GEMINI_MODELS) > 1:
+            model, result = await self._generate_hedged(prompt, generation_config, options)
+        else:
+            model, result = await self._generate_sequential(prompt, generation_config, options)
+        await self._store_response(model, prompt, generation_config, result, use_cache)
+        return result
+
+    async def _generate_sequential(self, prompt: str, generation_config: Optional[dict], options: _CallOptions):
+        models, last_resort = self._model_order()
+        last_error = None
+        for model in models:
             logger.info(f"Attempting to use model: {model}")
-            result = await self.call_gemini_api(model, prompt)
+            try:
+                result = await self._timed_call(model, prompt, generation_config, options, force=last_resort)
+            except Exception as e:
+                last_error = e
+                result = None
             if result:
                 logger.info(f"Successfully generated content with model: {model}")
-                return result
+                return model, result
             logger.warning(f"Model {model} failed. Trying next model in fallback list.")
         logger.critical("All Gemini models in the fallback list failed. Please check API key, billing, and API enablement.")
-        raise Exception("All Gemini models failed.")
+        raise last_error or Exception("All Gemini models failed.")
+
+    async def _generate_hedged(self, prompt: str, generation_config: Optional[dict], options: _CallOptions):
+        """
+        Hedged fallback: if the current model has not answered within its hedge delay (its observed
+        p95 latency), the next model is started in parallel and the first good answer wins. A model
+        that fails hands over to the next one immediately. Hedges are capped by the hedge budget.
+        """
+        hedge_policy.start_request()
+        models, last_resort = self._model_order()
+        pending = {}
+        next_index = 0
+        hedging_allowed = True
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            model = models[next_index]
+            next_index += 1
+            logger.info(f"Attempting to use model: {model}")
+            pending[asyncio.ensure_future(self._timed_call(model, prompt, generation_config, options, force=last_resort))] = model
 
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedging_allowed and next_index < len(models):
+                    timeout = hedge_policy.delay_for(models[next_index - 1])
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
 
-    async def generate_plan(self, goal, speed, hours_per_day, duration_days):
+                if not done:
+                    if hedge_policy.allow_hedge():
+                        logger.info(f"No answer after {timeout:.1f}s, hedging with {models[next_index]}")
+                        launch()
+                    else:
+                        hedging_allowed = False
+                    continue
+
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is None and task.result():
+                        if model != models[0] and pending:
+                            hedge_policy.counters["hedges_won"] += 1
+                        logger.info(f"Successfully generated content with model: {model}")
+                        return model, task.result()
+                    last_error = task.exception()
+                    logger.warning(f"Model {model} failed. Trying next model in fallback list.")
+                    if next_index < len(models):
+                        launch()
+        finally:
+            # Cancel the losers; httpx closes their connections' streams on cancellation
+            for task in pending:
+                task.cancel()
+
+        logger.critical("All Gemini models in the fallback list failed. Please check API key, billing, and API enablement.")
+        raise last_error or Exception("All Gemini models failed.")
+
+    async def _stream_with_fallback(self, prompt: str, generation_config: Optional[dict] = None, use_cache: bool = True,
+                                    priority: Priority = Priority.BULK, retry_policy: Optional[RetryPolicy] = None):
+        """
+        Streaming counterpart of _generate_with_fallback. A model is only skipped if it fails
+        before sending its first chunk; once text has reached the caller it cannot be retracted,
+        so a mid-stream failure is raised instead of switching models.
+        """
+        cached = await self._cached_response(prompt, generation_config, use_cache)
+        if cached is not None:
+            logger.info("Serving streamed response from LLM cache")
+            yield cached
+            return
+        self._check_prompt_size(prompt)
+        options = _CallOptions.create(priority, retry_policy)
+        models, last_resort = self._model_order()
+        last_error = None
+        for model in models:
+            logger.info(f"Attempting to stream with model: {model}")
+            breaker = model_health.breaker(model)
+            collected = []
+            attempt = 0
+            delay = options.retry_policy.base_delay
+            while True:
+                attempt += 1
+                try:
+                    if not last_resort:
+                        breaker.before_call()
+                    await self._acquire_slot(model, prompt, options)
+                    try:
+                        async for chunk in self.stream_gemini_api(model, prompt, generation_config):
+                            collected.append(chunk)
+                            yield chunk
+                    except (asyncio.CancelledError, GeneratorExit):
+                        breaker.abandon()
+                        raise
+                    except Exception:
+                        breaker.record_failure()
+                        raise
+                    breaker.record_success()
+                    logger.info(f"Successfully streamed content with model: {model}")
+                    await self._store_response(model, prompt, generation_config, "".join(collected), use_cache)
+                    return
+                except Exception as e:
+                    if collected:
+                        raise
+                    last_error = e
+                    # Nothing has been sent yet, so a transient error can still be retried on this model
+                    delay = self._retry_delay(model, e, attempt, delay, options)
+                    if delay is None:
+                        logger.warning(f"Model {model} failed before streaming ({e}). Trying next model in fallback list.")
+                        break
+                    await asyncio.sleep(delay)
+        logger.critical("All Gemini models in the fallback list failed. Please check API key, billing, and API enablement.")
+        raise last_error or Exception("All Gemini models failed.")
+
+
+    async def generate_plan(self, goal, speed, hours_per_day, duration_days, use_cache: bool = True,
+                            priority: Priority = Priority.INTERACTIVE):
         prompt = self.build_study_plan_prompt(goal, speed, hours_per_day, duration_days)
-        return await self._generate_with_fallback(prompt)
+        return await self._generate_with_fallback(prompt, use_cache=use_cache, priority=priority,
+                                                  retry_policy=RETRY_POLICIES["plan"])
+
+    async def generate_notes_from_text(self, text: str, use_cache: bool = True, priority: Priority = Priority.BULK):
+        prompt = self.build_notes_prompt(self._fit_notes_text(text))
+        return await self._generate_with_fallback(prompt, use_cache=use_cache, priority=priority,
+                                                  retry_policy=RETRY_POLICIES["notes"])
 
-    async def generate_notes_from_text(self, text: str):
-        prompt = self.build_notes_prompt(text)
-        return await self._generate_with_fallback(prompt)
+    def stream_notes_from_text(self, text: str, use_cache: bool = True, priority: Priority = Priority.BULK):
+        prompt = self.build_notes_prompt(self._fit_notes_text(text))
+        return self._stream_with_fallback(prompt, use_cache=use_cache, priority=priority,
+                                          retry_policy=RETRY_POLICIES["notes"])
+
+    def _fit_notes_text(self, text: str) -> str:
+        return self.fit_to_budget(text, token_estimator.estimate(self.build_notes_prompt("")), what="The document")
 
     def build_study_plan_prompt(self, goal, speed, hours, duration):
         return f"""
@@ -196,4 +574,44 @@ class GeminiClient:
 
         Text to analyze:
         {text}
-        """
\ No newline at end of file
+        """
+    def build_section_notes_prompt(self, text, index, total, label):
+        return f"""
+        The following text is section {index} of {total} ({label}) of a longer document.
+        Generate structured, hierarchical notes for this section only.
+        The output should be clean, readable text without markdown symbols.
+
+        Requirements:
+        - Use clear headings with numbers (1., 2., 3.) instead of ##
+        - Use bullet points (- or •) for key points
+        - Keep every definition, formula, date and example that matters
+        - Do not write an introduction or a summary section; they are added when sections are merged
+        - Avoid markdown symbols like #, *, **, etc.
+
+        Text to analyze:
+        {text}
+        """
+
+    def build_merge_notes_prompt(self, section_notes, final):
+        sections = "\n\n".join(
+            f"--- Part {number} ---\n{notes.strip()}" for number, notes in enumerate(section_notes, start=1)
+        )
+        ending = (
+            "- Include a summary section at the end" if final
+            else "- Do not add a summary section; more parts will be merged later"
+        )
+        return f"""
+        The following are notes taken from consecutive parts of one document, in order.
+        Merge them into one set of structured, hierarchical notes.
+        The output should be clean, readable text without markdown symbols.
+
+        Requirements:
+        - Use clear headings with numbers (1., 2., 3.) instead of ##, renumbered across the whole result
+        - Use bullet points (- or •) for key points
+        - Combine topics that continue across parts and remove repetition, but keep every distinct fact
+        {ending}
+        - Avoid markdown symbols like #, *, **, etc.
+
+        Notes to merge:
+        {sections}
+        """
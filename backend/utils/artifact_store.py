@@ -0,0 +1,205 @@
+import io
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import re
+import threading
+
+from docx import Document
+
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join("data", "artifacts"))
+ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 3600)))
+ARTIFACT_MAX_DISK_BYTES = int(float(os.getenv("ARTIFACT_MAX_DISK_MB", "256")) * 1024 * 1024)
+# Expired and over-budget artifacts are swept at most this often, on writes
+ARTIFACT_SWEEP_INTERVAL_SECONDS = float(os.getenv("ARTIFACT_SWEEP_INTERVAL_SECONDS", "60"))
+# Artifacts used this recently are never swept, so a download still streaming its DOCX keeps
+# the file, however full the directory is
+ARTIFACT_GRACE_SECONDS = float(os.getenv("ARTIFACT_GRACE_SECONDS", "600"))
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ArtifactNotFound(Exception):
+    """Raised for unknown, malformed or expired artifact IDs."""
+
+
+def render_notes_docx(notes_text: str) -> bytes:
+    """Renders notes to a DOCX document in memory, one paragraph per line."""
+    doc = Document()
+    for line in notes_text.splitlines():
+        doc.add_paragraph(line)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ArtifactStore:
+    """
+    Downloadable notes, addressed by opaque IDs instead of file paths. Generating notes only
+    stores their text; the DOCX is rendered in a worker thread the first time it is
+    downloaded, and kept next to the text for later downloads. Most notes are never
+    downloaded, so most are never rendered.
+
+    Each artifact is `<id>.json` (text and download filename) plus, once rendered,
+    `<id>.docx`. Artifacts expire ARTIFACT_TTL_SECONDS after their last use, and the least
+    recently used ones are deleted while the directory is above ARTIFACT_MAX_DISK_MB.
+    Artifacts used within ARTIFACT_GRACE_SECONDS are kept either way, so a file is not
+    deleted while a download is still streaming it.
+    """
+
+    def __init__(self, directory: str = ARTIFACT_DIR, ttl: float = ARTIFACT_TTL_SECONDS,
+                 max_disk_bytes: int = ARTIFACT_MAX_DISK_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._renders = SingleFlight()
+        self._last_sweep = 0.0
+        self.counters = {
+            "stored": 0, "downloads": 0, "rendered": 0, "render_reused": 0, "expired": 0, "evicted": 0, "not_found": 0,
+        }
+
+    def _path(self, artifact_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{artifact_id}.{suffix}")
+
+    def _put(self, artifact_id: str, notes_text: str, filename: str):
+        os.makedirs(self.directory, exist_ok=True)
+        body = json.dumps({"filename": filename, "notes": notes_text}, ensure_ascii=False)
+        _write_atomic(self._path(artifact_id, "json"), body.encode("utf-8"))
+
+    def _load(self, artifact_id: str) -> dict:
+        meta = self._path(artifact_id, "json")
+        try:
+            if time.time() - os.path.getmtime(meta) > self.ttl:
+                self._remove(artifact_id)
+                self.counters["expired"] += 1
+                raise ArtifactNotFound(artifact_id)
+            with open(meta, encoding="utf-8") as f:
+                data = json.load(f)
+            # Every download counts as a use: it restarts the TTL and the sweep's grace window
+            os.utime(meta)
+            return data
+        except FileNotFoundError:
+            raise ArtifactNotFound(artifact_id)
+
+    def _render(self, artifact_id: str, notes_text: str) -> str:
+        path = self._path(artifact_id, "docx")
+        if os.path.exists(path):
+            self.counters["render_reused"] += 1
+            return path
+        started = time.perf_counter()
+        _write_atomic(path, render_notes_docx(notes_text))
+        self.counters["rendered"] += 1
+        logger.info(f"[Artifacts] Rendered {artifact_id[:12]} in {time.perf_counter() - started:.2f}s")
+        return path
+
+    def _remove(self, artifact_id: str):
+        for suffix in ("json", "docx"):
+            try:
+                os.unlink(self._path(artifact_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _sweep(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        now = time.time()
+        artifacts = {}
+        for name in names:
+            artifact_id, _, suffix = name.partition(".")
+            if not _ARTIFACT_ID.match(artifact_id):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entry = artifacts.setdefault(artifact_id, {"size": 0, "last_used": 0.0})
+            entry["size"] += st.st_size
+            if suffix == "json":
+                entry["last_used"] = st.st_mtime
+
+        total = 0
+        for artifact_id, entry in list(artifacts.items()):
+            idle = now - entry["last_used"]
+            if idle > self.ttl and idle > ARTIFACT_GRACE_SECONDS:
+                self._remove(artifact_id)
+                self.counters["expired"] += 1
+                del artifacts[artifact_id]
+            else:
+                total += entry["size"]
+
+        # Least recently used artifacts go first
+        for artifact_id, entry in sorted(artifacts.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_disk_bytes or now - entry["last_used"] < ARTIFACT_GRACE_SECONDS:
+                break
+            self._remove(artifact_id)
+            total -= entry["size"]
+            self.counters["evicted"] += 1
+
+    # --- public API ---
+
+    async def put_notes(self, notes_text: str, filename: str) -> str:
+        """
+        Stores notes for a later DOCX download and returns the artifact ID. IDs are random, so
+        two uploads with identical notes get separate artifacts, each with its own filename.
+        """
+        artifact_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._put, artifact_id, notes_text, filename)
+        self.counters["stored"] += 1
+        if time.monotonic() - self._last_sweep > ARTIFACT_SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = time.monotonic()
+            await asyncio.to_thread(self._sweep)
+        return artifact_id
+
+    async def get_docx(self, artifact_id: str) -> tuple:
+        """
+        Returns (path, filename) of the rendered DOCX, rendering it on first use. Concurrent
+        downloads of the same artifact share one render. Raises ArtifactNotFound.
+        """
+        if not _ARTIFACT_ID.match(artifact_id or ""):
+            self.counters["not_found"] += 1
+            raise ArtifactNotFound(artifact_id)
+        try:
+            data = await asyncio.to_thread(self._load, artifact_id)
+        except ArtifactNotFound:
+            self.counters["not_found"] += 1
+            raise
+        path = await self._renders.do(
+            artifact_id, lambda: asyncio.to_thread(self._render, artifact_id, data["notes"])
+        )
+        self.counters["downloads"] += 1
+        return path, data["filename"]
+
+    def sweep(self):
+        """Deletes expired and over-budget artifacts; blocking, meant for startup."""
+        self._last_sweep = time.monotonic()
+        self._sweep()
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "max_disk_mb": round(self.max_disk_bytes / 1024 / 1024, 1),
+            "grace_seconds": ARTIFACT_GRACE_SECONDS,
+            **self.counters,
+            "in_flight_renders": self._renders.stats()["in_flight"],
+        }
+
+
+artifact_store = ArtifactStore()
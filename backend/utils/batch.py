@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import logging
+from dataclasses import dataclass
+from typing import List
+
+from utils.hedging import LatencyTracker
+from utils.uploads import UPLOAD_MAX_FILE_BYTES, UPLOAD_CHUNK_BYTES, UploadTooLargeError
+
+logger = logging.getLogger(__name__)
+
+# Files of all batches processed at the same time; every file still goes through the shared
+# extraction pool and Gemini scheduler
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+# Total uncompressed size of the files in one batch, ZIP members included
+BATCH_MAX_TOTAL_BYTES = int(float(os.getenv("BATCH_MAX_TOTAL_MB", "500")) * 1024 * 1024)
+# Batch working directories older than this are left over from a dropped response and deleted
+BATCH_WORKDIR_TTL_SECONDS = float(os.getenv("BATCH_WORKDIR_TTL_SECONDS", str(6 * 3600)))
+BATCH_WORKDIR_PREFIX = "batch_"
+
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch has too many files or too many bytes once unpacked."""
+
+
+class UnreadableZipMember(Exception):
+    """Raised for a ZIP member that is encrypted or uses a compression method zipfile cannot read."""
+
+
+@dataclass
+class BatchFile:
+    """One document of a batch, saved to disk."""
+    index: int
+    filename: str
+    path: str
+    size: int
+    sha256: str
+
+
+def extract_zip_members(zip_path: str, dest_dir: str, extensions: tuple, max_files: int,
+                        max_total_bytes: int, max_file_bytes: int = UPLOAD_MAX_FILE_BYTES) -> List[tuple]:
+    """
+    Unpacks the members of a ZIP with a supported extension into `dest_dir` and returns
+    (member name, path, size, sha256) for each. Directories, hidden files and macOS resource
+    forks are skipped. Sizes are counted while decompressing rather than trusted from the
+    archive's directory, so a ZIP bomb is stopped at the limit.
+    """
+    members = []
+    total = 0
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            if info.is_dir() or not base or base.startswith(".") or "__MACOSX/" in name:
+                continue
+            if base.rsplit(".", 1)[-1].lower() not in extensions:
+                continue
+            if len(members) >= max_files:
+                raise BatchTooLargeError(f"Too many files. A batch may contain at most {max_files}.")
+            path = os.path.join(dest_dir, f"{len(members)}_{base}")
+            size = 0
+            digest = hashlib.sha256()
+            try:
+                with archive.open(info) as source, open(path, "wb") as target:
+                    while chunk := source.read(UPLOAD_CHUNK_BYTES):
+                        size += len(chunk)
+                        total += len(chunk)
+                        if size > max_file_bytes:
+                            raise UploadTooLargeError(
+                                f"{name} in the ZIP archive is too large. The limit is {max_file_bytes / 1024 / 1024:g} MB."
+                            )
+                        if total > max_total_bytes:
+                            raise BatchTooLargeError(
+                                f"The batch is too large. The limit is {max_total_bytes / 1024 / 1024:g} MB uncompressed."
+                            )
+                        digest.update(chunk)
+                        target.write(chunk)
+            except (RuntimeError, NotImplementedError) as e:
+                # zipfile raises RuntimeError for encrypted members, NotImplementedError for
+                # compression methods it does not support
+                raise UnreadableZipMember(
+                    f"{name} in the ZIP archive is encrypted or compressed in an unsupported way."
+                ) from e
+            members.append((name, path, size, digest.hexdigest()))
+    return members
+
+
+def remove_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def remove_stale_workdirs(parent: str, max_age: float = BATCH_WORKDIR_TTL_SECONDS) -> int:
+    """
+    Deletes batch working directories in `parent` older than `max_age`. A batch normally
+    removes its own once the response ends; this catches those whose response never ran,
+    e.g. when the client disconnected before the first line was sent. Returns how many were removed.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(parent))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name.startswith(BATCH_WORKDIR_PREFIX) and entry.is_dir() and entry.stat().st_mtime < cutoff:
+                remove_dir(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"[Batch] Removed {removed} stale working directories")
+    return removed
+
+
+def ndjson(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+
+def summarize(lines: List[dict], elapsed: float, unit: str = "files", **fields) -> dict:
+    """
+    The closing `summary` line of a batch stream: counts, throughput and latency percentiles of
+    the `unit` lines. `fields` go right after the type. Lines replayed from an earlier run are
+    counted but left out of throughput and latency.
+    """
+    processed = sorted(line["latency_seconds"] for line in lines if not line.get("replayed"))
+    failed = sum(1 for line in lines if line["status"] != "ok")
+    elapsed = max(elapsed, 1e-6)
+
+    def percentile(q: float) -> float:
+        return processed[min(len(processed) - 1, int(q * len(processed)))] if processed else 0.0
+
+    return {
+        "type": "summary",
+        **fields,
+        unit: len(lines),
+        "succeeded": len(lines) - failed,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        f"{unit}_per_minute": round(len(processed) / elapsed * 60, 1),
+        "latency_seconds": {"p50": percentile(0.5), "p95": percentile(0.95), "max": processed[-1] if processed else 0.0},
+    }
+
+
+class BatchStats:
+    def __init__(self):
+        self.batches = 0
+        self.files = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_batch: dict = {}
+        self.latency = LatencyTracker()
+
+    def record_file(self, ok: bool, seconds: float):
+        self.files += 1
+        if ok:
+            self.succeeded += 1
+            self.latency.record("file", seconds)
+        else:
+            self.failed += 1
+
+    def record_batch(self, summary: dict):
+        self.batches += 1
+        self.last_batch = summary
+        logger.info(
+            f"[Batch] {summary['files']} files ({summary['failed']} failed) in {summary['elapsed_seconds']}s, "
+            f"{summary['pages_per_second']} pages/s"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": BATCH_CONCURRENCY,
+            "batches": self.batches,
+            "files": self.files,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "file_latency": self.latency.stats().get("file", {}),
+            "last_batch": self.last_batch,
+        }
+
+
+batch_stats = BatchStats()
@@ -0,0 +1,171 @@
+import os
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from utils.hedging import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+CB_WINDOW_SECONDS = float(os.getenv("GEMINI_CB_WINDOW_SECONDS", "60"))
+CB_MIN_REQUESTS = int(os.getenv("GEMINI_CB_MIN_REQUESTS", "5"))
+CB_ERROR_THRESHOLD = float(os.getenv("GEMINI_CB_ERROR_THRESHOLD", "0.5"))
+CB_OPEN_SECONDS = float(os.getenv("GEMINI_CB_OPEN_SECONDS", "30"))
+CB_HALF_OPEN_PROBES = int(os.getenv("GEMINI_CB_HALF_OPEN_PROBES", "1"))
+CB_PROBE_INTERVAL = float(os.getenv("GEMINI_CB_PROBE_INTERVAL", "30"))
+# Latency at which a model's health score is halved
+CB_LATENCY_REFERENCE = float(os.getenv("GEMINI_CB_LATENCY_REFERENCE", "10.0"))
+# Health scores are bucketed into this many bands before models are reordered
+CB_SCORE_BANDS = 4
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker for one model.
+
+    closed     -> requests flow; opens when the error rate over the last CB_WINDOW_SECONDS
+                  exceeds CB_ERROR_THRESHOLD (with at least CB_MIN_REQUESTS outcomes)
+    open       -> requests are refused for CB_OPEN_SECONDS
+    half_open  -> up to CB_HALF_OPEN_PROBES probe requests; a success closes the circuit,
+                  a failure opens it again
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > CB_WINDOW_SECONDS:
+            self._outcomes.popleft()
+
+    def error_rate(self) -> float:
+        self._trim(time.monotonic())
+        if not self._outcomes:
+            return 0.0
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return failures / len(self._outcomes)
+
+    def sample_count(self) -> int:
+        self._trim(time.monotonic())
+        return len(self._outcomes)
+
+    def _refresh(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= CB_OPEN_SECONDS:
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            logger.info(f"[CircuitBreaker] {self.model} is half-open, allowing probe requests")
+
+    def available(self) -> bool:
+        """Whether a request could be sent now. Does not reserve a probe slot."""
+        self._refresh()
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight < CB_HALF_OPEN_PROBES
+        return True
+
+    def before_call(self):
+        if not self.available():
+            self.counters["rejected"] += 1
+            raise CircuitOpenError(f"Circuit for model {self.model} is open")
+        if self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+
+    def abandon(self):
+        """Releases a probe slot when a call is cancelled before it produced an outcome."""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_success(self):
+        self.counters["successes"] += 1
+        if self.state == HALF_OPEN:
+            logger.info(f"[CircuitBreaker] Probe to {self.model} succeeded, closing circuit")
+            self.state = CLOSED
+            self._outcomes.clear()
+        self._outcomes.append((time.monotonic(), True))
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        self._outcomes.append((now, False))
+        self._trim(now)
+        if self.state == CLOSED and len(self._outcomes) >= CB_MIN_REQUESTS and self.error_rate() >= CB_ERROR_THRESHOLD:
+            self._open(now)
+
+    def _open(self, now: float):
+        logger.warning(f"[CircuitBreaker] Opening circuit for {self.model} (error rate {self.error_rate():.0%})")
+        self.state = OPEN
+        self.opened_at = now
+        self.probes_in_flight = 0
+        self.counters["opened"] += 1
+
+    def probe_due(self) -> bool:
+        self._refresh()
+        return self.state == HALF_OPEN and self.probes_in_flight < CB_HALF_OPEN_PROBES
+
+
+class ModelHealth:
+    """Circuit breakers for every model plus a health score used to order the fallback list."""
+
+    def __init__(self, tracker: LatencyTracker):
+        self.tracker = tracker
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(model)
+        return self._breakers[model]
+
+    def score(self, model: str) -> float:
+        """
+        1.0 is a perfectly healthy model; lowered by errors and by p95 latency. The error rate
+        only counts once the window holds CB_MIN_REQUESTS outcomes, so one stray 503 does
+        not demote the preferred model.
+        """
+        breaker = self.breaker(model)
+        error_rate = breaker.error_rate() if breaker.sample_count() >= CB_MIN_REQUESTS else 0.0
+        p95: Optional[float] = self.tracker.percentile(model, 0.95)
+        latency_factor = 1.0 / (1.0 + (p95 or 0.0) / CB_LATENCY_REFERENCE)
+        return (1.0 - error_rate) * latency_factor
+
+    def ordered(self, models: List[str]) -> List[str]:
+        """
+        Models that can take traffic, healthiest first. Scores are compared in coarse bands so
+        near-equal models (including one with no samples yet) keep their configured preference
+        order instead of flapping. If every circuit is open the configured order is returned
+        unchanged as a last resort.
+        """
+        usable = [m for m in models if self.breaker(m).available()]
+        if not usable:
+            return list(models)
+        return sorted(usable, key=lambda m: -min(CB_SCORE_BANDS - 1, int(self.score(m) * CB_SCORE_BANDS)))
+
+    def all_unavailable(self, models: List[str]) -> bool:
+        return not any(self.breaker(m).available() for m in models)
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "state": breaker.state,
+                "error_rate": round(breaker.error_rate(), 3),
+                "score": round(self.score(model), 3),
+                **breaker.counters,
+            }
+            for model, breaker in self._breakers.items()
+        }
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import List, Optional
+
+from utils.db_size import track_sizes, stored_bytes
+
+logger = logging.getLogger(__name__)
+
+CONTENT_STORE_ENABLED = os.getenv("CONTENT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTENT_STORE_DB_PATH = os.getenv("CONTENT_STORE_DB_PATH", os.path.join("data", "content_store.sqlite3"))
+CONTENT_STORE_TTL_SECONDS = float(os.getenv("CONTENT_STORE_TTL_SECONDS", str(30 * 24 * 3600)))
+CONTENT_STORE_MAX_DB_BYTES = int(float(os.getenv("CONTENT_STORE_MAX_DB_MB", "512")) * 1024 * 1024)
+
+_TABLES = ("documents", "notes", "chunk_notes", "document_chunks")
+
+
+class ContentStore:
+    """
+    Content-addressed store for uploads, keyed by the SHA-256 of the uploaded bytes:
+    the extracted pages of each document, and the notes generated from it per prompt
+    version. A re-upload of the same file skips both extraction and Gemini. Section notes
+    of map-reduce chunks are stored by chunk hash as well, so a revised document only
+    regenerates the sections that changed.
+
+    Notes written under an older prompt version are never served, and are purged the first
+    time the store is opened with a new version. Both tables share a TTL and a size budget;
+    the least recently used rows are evicted first.
+    """
+
+    def __init__(self, db_path: str = CONTENT_STORE_DB_PATH, ttl: float = CONTENT_STORE_TTL_SECONDS,
+                 max_db_bytes: int = CONTENT_STORE_MAX_DB_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_db_bytes = max_db_bytes
+        self.prompt_version: Optional[str] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.counters = {
+            "document_hits": 0, "document_misses": 0, "notes_hits": 0, "notes_misses": 0,
+            "chunk_hits": 0, "chunk_misses": 0, "writes": 0, "evictions": 0, "invalidated": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    hash TEXT PRIMARY KEY,
+                    ext TEXT NOT NULL,
+                    pages TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS notes (
+                    hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    notes TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (hash, prompt_version)
+                )"""
+            )
+            # Section notes of individual chunks, shared by every document containing the chunk
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS chunk_notes (
+                    hash TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    notes TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (hash, prompt_version)
+                )"""
+            )
+            # Ordered chunk hashes of a document, to compare a revision with its previous version
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS document_chunks (
+                    hash TEXT NOT NULL,
+                    chunk_tokens INTEGER NOT NULL,
+                    chunks TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (hash, chunk_tokens)
+                )"""
+            )
+            for table in _TABLES:
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table}(created_at)")
+            track_sizes(self._db, _TABLES)
+            if self.prompt_version:
+                stale = sum(
+                    self._db.execute(f"DELETE FROM {table} WHERE prompt_version != ?", (self.prompt_version,)).rowcount
+                    for table in ("notes", "chunk_notes")
+                )
+                if stale > 0:
+                    logger.info(f"[ContentStore] Dropped {stale} notes from older prompt versions")
+                    self.counters["invalidated"] += stale
+            self._db.commit()
+        return self._db
+
+    def _touch(self, db: sqlite3.Connection, table: str, where: str, params: tuple, created_at: float) -> bool:
+        now = time.time()
+        if now - created_at > self.ttl:
+            db.execute(f"DELETE FROM {table} WHERE {where}", params)
+            db.commit()
+            return False
+        db.execute(f"UPDATE {table} SET last_access = ? WHERE {where}", (now, *params))
+        db.commit()
+        return True
+
+    def _get_document(self, content_hash: str) -> Optional[tuple]:
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute("SELECT ext, pages, created_at FROM documents WHERE hash = ?", (content_hash,)).fetchone()
+            if row is None or not self._touch(db, "documents", "hash = ?", (content_hash,), row[2]):
+                return None
+            return row[0], json.loads(row[1])
+
+    def _get_notes(self, table: str, content_hash: str, prompt_version: str) -> Optional[str]:
+        with self._db_lock:
+            db = self._connect()
+            where, params = "hash = ? AND prompt_version = ?", (content_hash, prompt_version)
+            row = db.execute(f"SELECT notes, created_at FROM {table} WHERE {where}", params).fetchone()
+            if row is None or not self._touch(db, table, where, params, row[1]):
+                return None
+            return row[0]
+
+    def _get_document_chunks(self, content_hash: str) -> Optional[tuple]:
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT chunk_tokens, chunks, created_at FROM document_chunks WHERE hash = ? ORDER BY last_access DESC",
+                (content_hash,),
+            ).fetchone()
+            if row is None:
+                return None
+            where, params = "hash = ? AND chunk_tokens = ?", (content_hash, row[0])
+            if not self._touch(db, "document_chunks", where, params, row[2]):
+                return None
+            return row[0], json.loads(row[1])
+
+    def _put(self, sql: str, params: tuple):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(sql, params)
+            self._evict_locked(db)
+            db.commit()
+
+    def _evict_locked(self, db: sqlite3.Connection):
+        cutoff = time.time() - self.ttl
+        for table in _TABLES:
+            self.counters["evictions"] += max(db.execute(f"DELETE FROM {table} WHERE created_at < ?", (cutoff,)).rowcount, 0)
+        total = stored_bytes(db, _TABLES)
+        if total <= self.max_db_bytes:
+            return
+        # Least recently used rows of any table go first
+        rows = db.execute(
+            " UNION ALL ".join(f"SELECT '{table}', rowid, size, last_access FROM {table}" for table in _TABLES)
+            + " ORDER BY 4 ASC"
+        ).fetchall()
+        for table, rowid, size, _ in rows:
+            if total <= self.max_db_bytes:
+                break
+            db.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+            total -= size
+            self.counters["evictions"] += 1
+
+    # --- public API ---
+
+    async def get_document(self, content_hash: str) -> Optional[tuple]:
+        """Returns (ext, pages) extracted earlier from the same bytes, or None."""
+        if not CONTENT_STORE_ENABLED:
+            return None
+        found = await asyncio.to_thread(self._get_document, content_hash)
+        self.counters["document_hits" if found else "document_misses"] += 1
+        return found
+
+    async def put_document(self, content_hash: str, ext: str, pages: List[str]):
+        if not CONTENT_STORE_ENABLED:
+            return
+        value = json.dumps(pages, ensure_ascii=False)
+        now = time.time()
+        await self._write(
+            "INSERT OR REPLACE INTO documents (hash, ext, pages, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, ext, value, len(value.encode("utf-8")), now, now),
+        )
+
+    def set_prompt_version(self, prompt_version: str):
+        """Notes are stored and looked up under this version; call before the first notes lookup."""
+        self.prompt_version = prompt_version
+
+    async def get_notes(self, content_hash: str) -> Optional[str]:
+        if not CONTENT_STORE_ENABLED:
+            return None
+        notes = await asyncio.to_thread(self._get_notes, "notes", content_hash, self.prompt_version or "")
+        self.counters["notes_hits" if notes else "notes_misses"] += 1
+        return notes
+
+    async def put_notes(self, content_hash: str, notes: str):
+        await self._put_notes("notes", content_hash, notes)
+
+    async def get_chunk_notes(self, chunk_hash: str) -> Optional[str]:
+        if not CONTENT_STORE_ENABLED:
+            return None
+        notes = await asyncio.to_thread(self._get_notes, "chunk_notes", chunk_hash, self.prompt_version or "")
+        self.counters["chunk_hits" if notes else "chunk_misses"] += 1
+        return notes
+
+    async def put_chunk_notes(self, chunk_hash: str, notes: str):
+        await self._put_notes("chunk_notes", chunk_hash, notes)
+
+    async def _put_notes(self, table: str, content_hash: str, notes: str):
+        if not CONTENT_STORE_ENABLED or not notes:
+            return
+        now = time.time()
+        await self._write(
+            f"INSERT OR REPLACE INTO {table} (hash, prompt_version, notes, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, self.prompt_version or "", notes, len(notes.encode("utf-8")), now, now),
+        )
+
+    async def get_document_chunks(self, content_hash: str) -> Optional[tuple]:
+        """Returns (chunk_tokens, chunk hashes) of the last map-reduce run over this document, or None."""
+        if not CONTENT_STORE_ENABLED:
+            return None
+        return await asyncio.to_thread(self._get_document_chunks, content_hash)
+
+    async def put_document_chunks(self, content_hash: str, chunk_tokens: int, chunk_hashes: List[str]):
+        if not CONTENT_STORE_ENABLED:
+            return
+        value = json.dumps(chunk_hashes)
+        now = time.time()
+        await self._write(
+            "INSERT OR REPLACE INTO document_chunks (hash, chunk_tokens, chunks, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, chunk_tokens, value, len(value), now, now),
+        )
+
+    async def _write(self, sql: str, params: tuple):
+        try:
+            await asyncio.to_thread(self._put, sql, params)
+            self.counters["writes"] += 1
+        except sqlite3.Error as e:
+            # A broken store must not fail the request that produced the content
+            logger.error(f"[ContentStore] Failed to store entry: {e}")
+
+    def stats(self) -> dict:
+        return {"enabled": CONTENT_STORE_ENABLED, "prompt_version": self.prompt_version, **self.counters}
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+content_store = ContentStore()
@@ -0,0 +1,43 @@
+import sqlite3
+from typing import Iterable
+
+
+def track_sizes(db: sqlite3.Connection, tables: Iterable[str]):
+    """
+    Keeps the total of each table's `size` column in the one-row-per-table `size_totals`
+    table, maintained by triggers on every insert and delete, so size budgets are checked
+    without summing the whole table on each write. A table without its triggers (new, or
+    dropped and recreated) has its total recomputed once here.
+
+    Must be called on every new connection: recursive_triggers is what makes the rows
+    removed by INSERT OR REPLACE count as deletes.
+    """
+    db.execute("PRAGMA recursive_triggers = ON")
+    db.execute("CREATE TABLE IF NOT EXISTS size_totals (name TEXT PRIMARY KEY, bytes INTEGER NOT NULL)")
+    for table in tables:
+        if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f"{table}_size_insert",)).fetchone():
+            continue
+        db.execute(
+            "INSERT OR REPLACE INTO size_totals (name, bytes) "
+            f"SELECT ?, COALESCE(SUM(size), 0) FROM {table}",
+            (table,),
+        )
+        db.execute(
+            f"""CREATE TRIGGER {table}_size_insert AFTER INSERT ON {table} BEGIN
+                UPDATE size_totals SET bytes = bytes + NEW.size WHERE name = '{table}';
+            END"""
+        )
+        db.execute(
+            f"""CREATE TRIGGER {table}_size_delete AFTER DELETE ON {table} BEGIN
+                UPDATE size_totals SET bytes = bytes - OLD.size WHERE name = '{table}';
+            END"""
+        )
+
+
+def stored_bytes(db: sqlite3.Connection, tables: Iterable[str]) -> int:
+    """Total `size` of the rows in `tables`, as kept by track_sizes."""
+    tables = list(tables)
+    return db.execute(
+        f"SELECT COALESCE(SUM(bytes), 0) FROM size_totals WHERE name IN ({', '.join('?' for _ in tables)})",
+        tables,
+    ).fetchone()[0]
@@ -0,0 +1,209 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used for CPU-bound document parsing, kept off the event loop
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a free worker before new uploads are turned away
+EXTRACTION_MAX_QUEUE = int(os.getenv("EXTRACTION_MAX_QUEUE", "16"))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "60"))
+# Uploads above this size are only accepted while a worker is idle, so one big document
+# cannot sit in the queue in front of many small ones
+EXTRACTION_LARGE_JOB_BYTES = int(float(os.getenv("EXTRACTION_LARGE_JOB_MB", "20")) * 1024 * 1024)
+# "spawn" keeps workers from inheriting the event loop, sockets and SQLite handles of the server
+EXTRACTION_START_METHOD = os.getenv("EXTRACTION_START_METHOD", "spawn")
+
+
+class ExtractionPoolFull(Exception):
+    """Raised instead of queueing a job when the extraction pool is saturated."""
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a job does not finish within EXTRACTION_TIMEOUT_SECONDS."""
+
+
+def _status_mb(field: str) -> Optional[float]:
+    # Linux only; VmRSS is the current resident set, VmHWM its high-water mark
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> float:
+    return _status_mb("VmRSS") or 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = _status_mb("VmHWM")
+    if peak is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak
+
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+), so each job reports its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _timed(fn: Callable, *args):
+    # Runs in the worker. Wall-clock start time lets the parent work out how long the job queued
+    _reset_peak_rss()
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time() - started, peak_rss_mb()
+
+
+class ExtractionPool:
+    """
+    Bounded process pool for text extraction. Jobs beyond the worker count wait in a queue of
+    at most EXTRACTION_MAX_QUEUE entries; past that (or for large jobs while every worker is
+    busy) they are rejected with ExtractionPoolFull so the route can answer 503 straight away.
+    Background callers (batches, jobs) pass `wait=True` to wait for room instead.
+
+    A timed-out job that already started keeps its worker until it finishes (a process pool
+    cannot interrupt a running call), and it keeps counting towards saturation until then.
+    """
+
+    def __init__(self, workers: int = EXTRACTION_WORKERS, max_queue: int = EXTRACTION_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        # Callers waiting for room (run(wait=True)); woken whenever a job finishes
+        self._waiters: List[asyncio.Future] = []
+        self.counters = {
+            "submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "waited": 0, "timeouts": 0,
+            "total_seconds": 0.0, "max_seconds": 0.0, "total_queue_wait": 0.0, "max_queue_wait": 0.0,
+            "max_peak_rss_mb": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(EXTRACTION_START_METHOD),
+            )
+        return self._executor
+
+    def _release(self, _future=None):
+        self._pending -= 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _saturated(self, size: int) -> bool:
+        return self._pending >= self.workers + self.max_queue or (
+            size > EXTRACTION_LARGE_JOB_BYTES and self._pending >= self.workers
+        )
+
+    async def run(self, fn: Callable, *args, size: int = 0, timeout: Optional[float] = None,
+                  report: Optional[dict] = None, wait: bool = False):
+        """
+        Runs `fn(*args)` in a worker process and returns its result. `fn` must be a
+        module-level function and `size` the input size in bytes (used for admission).
+        If `report` is given, the worker's peak RSS for this job is merged into
+        report["peak_rss_mb"] (max over jobs sharing the dict). With `wait`, a saturated
+        pool is waited out instead of raising ExtractionPoolFull; the timeout starts once
+        the job is admitted.
+        """
+        if wait and self._saturated(size):
+            self.counters["waited"] += 1
+            while self._saturated(size):
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                await waiter
+        if self._saturated(size):
+            self.counters["rejected"] += 1
+            logger.warning(f"[Extraction] Pool saturated ({self._pending} jobs), rejecting a {size:,} byte job")
+            raise ExtractionPoolFull("The document processor is busy right now. Please try again in a moment.")
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(_timed, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. a parser crash); start a fresh pool for this and later jobs
+            logger.error("[Extraction] Process pool was broken, restarting it")
+            self._executor = None
+            future = self._get_executor().submit(_timed, fn, *args)
+        self._pending += 1
+        self.counters["submitted"] += 1
+        submitted_at = time.time()
+        # The slot is freed when the worker is actually done, not when the caller stops waiting
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+
+        timeout = EXTRACTION_TIMEOUT if timeout is None else timeout
+        try:
+            result, started, elapsed, job_peak_rss = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            logger.warning(f"[Extraction] Job timed out after {timeout:.1f}s")
+            raise ExtractionTimeout("Extracting text from the document took too long. Please try a smaller file.")
+        except BrokenProcessPool:
+            self.counters["failed"] += 1
+            self._executor = None
+            raise
+        except Exception:
+            self.counters["failed"] += 1
+            raise
+
+        queued = max(0.0, started - submitted_at)
+        self.counters["completed"] += 1
+        self.counters["total_seconds"] += elapsed
+        self.counters["max_seconds"] = max(self.counters["max_seconds"], elapsed)
+        self.counters["total_queue_wait"] += queued
+        self.counters["max_queue_wait"] = max(self.counters["max_queue_wait"], queued)
+        self.counters["max_peak_rss_mb"] = max(self.counters["max_peak_rss_mb"], job_peak_rss)
+        if report is not None:
+            report["peak_rss_mb"] = max(report.get("peak_rss_mb", 0.0), job_peak_rss)
+        logger.info(f"[Extraction] {getattr(fn, '__name__', 'job')} took {elapsed:.2f}s (queued {queued:.2f}s)")
+        return result
+
+    def idle_workers(self) -> int:
+        """Workers not busy with (or queued for) a job right now; at least 1 so callers always get a slot."""
+        return max(1, self.workers - self._pending)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        completed = self.counters["completed"]
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "queue_depth": max(0, self._pending - self.workers),
+            "submitted": self.counters["submitted"],
+            "completed": completed,
+            "failed": self.counters["failed"],
+            "rejected": self.counters["rejected"],
+            "waited": self.counters["waited"],
+            "timeouts": self.counters["timeouts"],
+            "avg_seconds": round(self.counters["total_seconds"] / completed, 3) if completed else 0.0,
+            "max_seconds": round(self.counters["max_seconds"], 3),
+            "avg_queue_wait": round(self.counters["total_queue_wait"] / completed, 3) if completed else 0.0,
+            "max_queue_wait": round(self.counters["max_queue_wait"], 3),
+            "max_worker_peak_rss_mb": round(self.counters["max_peak_rss_mb"], 1),
+        }
+
+
+extraction_pool = ExtractionPool()
@@ -1,26 +1,157 @@
-import fitz  # PyMuPDF
+import io
+import os
+import math
+import mmap
+import asyncio
 import docx
-import tempfile
+import logging
+import pymupdf  # PyMuPDF
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+from utils.extraction_pool import extraction_pool
+from utils.uploads import SpooledUpload, spool_upload, upload_stats
+from utils.content_store import content_store
 
-async def extract_text_from_file(file):
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt")
+
+# A PDF is only split across workers when every worker gets at least this many pages
+MIN_PAGES_PER_JOB = int(os.getenv("EXTRACTION_MIN_PAGES_PER_JOB", "16"))
+
+
+@dataclass
+class ExtractedDocument:
+    """Text of an uploaded document, one entry per page (DOCX and TXT have a single page)."""
+    ext: str
+    pages: List[str]
+    # Highest resident memory of an extraction worker while processing this document
+    peak_rss_mb: float = 0.0
+    # SHA-256 of the uploaded bytes, set for uploads
+    sha256: str = ""
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.pages)
+
+
+# The extractors below are plain module-level functions so they can run in the
+# extraction process pool. `source` is either the document bytes or the path of a
+# spooled upload, which is memory-mapped so workers never copy the whole file.
+
+@contextmanager
+def _mapped(source: Union[bytes, str]):
+    if isinstance(source, bytes):
+        yield source
+        return
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                # The mapping cannot close while a view of it is still exported
+                view.release()
+
+def pdf_page_count(source: Union[bytes, str]) -> int:
+    with _mapped(source) as buffer, pymupdf.open(stream=buffer, filetype="pdf") as doc:
+        return doc.page_count
+
+def extract_pdf_pages(source: Union[bytes, str], start: int = 0, stop: int = None) -> List[str]:
+    """Text of pages [start, stop) of a PDF."""
+    with _mapped(source) as buffer, pymupdf.open(stream=buffer, filetype="pdf") as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [doc[number].get_text() for number in range(start, stop)]
+
+def extract_docx_pages(source: Union[bytes, str]) -> List[str]:
+    # python-docx reads the zip container through seek/read, so the path is enough
+    doc = docx.Document(io.BytesIO(source) if isinstance(source, bytes) else source)
+    return ["\n".join(p.text for p in doc.paragraphs)]
+
+def read_text(source: Union[bytes, str]) -> str:
+    if isinstance(source, bytes):
+        return source.decode("utf-8")
+    with open(source, encoding="utf-8") as f:
+        return f.read()
+
+def page_ranges(page_count: int, jobs: int) -> List[tuple]:
+    """Splits [0, page_count) into `jobs` contiguous ranges of near-equal size."""
+    if page_count <= 0:
+        return []
+    jobs = max(1, min(jobs, page_count))
+    size = math.ceil(page_count / jobs)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+async def extract_document(ext: str, source: Union[bytes, str], size: int = None,
+                           on_progress: Optional[Callable[[dict], None]] = None,
+                           wait: bool = False) -> ExtractedDocument:
+    """
+    Extracts a PDF, DOCX or TXT document given as bytes or as a file path. PDFs are split
+    into page ranges that are extracted in parallel by the idle workers of the extraction pool;
+    `on_progress` receives a dict as each range completes. With `wait`, a busy pool is waited
+    for instead of failing with ExtractionPoolFull (for batches and background jobs).
+    """
+    if size is None:
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    report = {}
+    if ext == "txt":
+        # Decoding is cheap; not worth a trip to another process
+        return ExtractedDocument(ext, [await asyncio.to_thread(read_text, source)])
+    if ext == "docx":
+        pages = await extraction_pool.run(extract_docx_pages, source, size=size, report=report, wait=wait)
+        return ExtractedDocument(ext, pages, report.get("peak_rss_mb", 0.0))
+    if ext != "pdf":
+        raise ValueError("Unsupported file type")
+
+    # Counting pages only parses the cross-reference table, but that is still untrusted input:
+    # it runs in a worker like the rest of the parsing, never on the event loop
+    page_count = await extraction_pool.run(pdf_page_count, source, size=size, report=report, wait=wait)
+    jobs = min(extraction_pool.idle_workers(), math.ceil(page_count / MIN_PAGES_PER_JOB))
+    ranges = page_ranges(page_count, jobs)
+    extracted = 0
+
+    async def extract_range(start: int, stop: int) -> List[str]:
+        nonlocal extracted
+        pages = await extraction_pool.run(extract_pdf_pages, source, start, stop, size=size, report=report,
+                                           wait=wait)
+        extracted += len(pages)
+        if on_progress:
+            on_progress({"stage": "extract", "status": "progress", "pages_extracted": extracted, "pages": page_count})
+        return pages
+
+    results = await asyncio.gather(*(extract_range(start, stop) for start, stop in ranges))
+    return ExtractedDocument(ext, [page for pages in results for page in pages], report.get("peak_rss_mb", 0.0))
+
+
+async def extract_document_from_path(ext: str, spooled: SpooledUpload, filename: str,
+                                     on_progress: Optional[Callable[[dict], None]] = None,
+                                     wait: bool = False) -> ExtractedDocument:
+    """
+    Extracts a saved upload. Text extracted earlier from identical bytes is reused from the
+    content store.
+    """
+    stored = await content_store.get_document(spooled.sha256)
+    if stored is not None and stored[0] == ext:
+        logger.info(f"[Uploads] {filename}: reusing text extracted from identical content {spooled.sha256[:12]}")
+        return ExtractedDocument(ext, stored[1], sha256=spooled.sha256)
+    document = await extract_document(ext, spooled.path, spooled.size, on_progress=on_progress, wait=wait)
+    document.sha256 = spooled.sha256
+    upload_stats.record(filename, spooled.size, document.peak_rss_mb)
+    await content_store.put_document(document.sha256, ext, document.pages)
+    return document
+
+
+async def extract_document_from_file(file) -> ExtractedDocument:
+    """Spools an UploadFile to disk (enforcing UPLOAD_MAX_FILE_MB) and extracts it from there."""
     ext = file.filename.split(".")[-1].lower()
-    contents = await file.read()
-    if ext == "pdf":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(contents)
-            tmp.flush()
-            doc = fitz.open(tmp.name)
-            text = "\n".join(page.get_text() for page in doc)
-            doc.close()
-        return text
-    elif ext == "docx":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(contents)
-            tmp.flush()
-            doc = docx.Document(tmp.name)
-            text = "\n".join([p.text for p in doc.paragraphs])
-        return text
-    elif ext == "txt":
-        return contents.decode("utf-8")
-    else:
-        raise ValueError("Unsupported file type") 
\ No newline at end of file
+    async with spool_upload(file) as spooled:
+        return await extract_document_from_path(ext, spooled, file.filename)
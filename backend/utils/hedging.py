@@ -0,0 +1,100 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Delay used before a model has enough latency samples to derive one
+HEDGE_DEFAULT_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY_SECONDS", "8.0"))
+HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# At most this fraction of primary requests may trigger an extra (hedged) request
+HEDGE_MAX_RATIO = float(os.getenv("GEMINI_HEDGE_MAX_RATIO", "0.1"))
+HEDGE_BURST = float(os.getenv("GEMINI_HEDGE_BURST", "3"))
+LATENCY_WINDOW = int(os.getenv("GEMINI_LATENCY_WINDOW", "200"))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float):
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get(model)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": round(self.percentile(model, 0.5), 3),
+                "p95": round(self.percentile(model, 0.95), 3),
+            }
+            for model, samples in self._samples.items() if samples
+        }
+
+
+class HedgeBudget:
+    """
+    Token bucket that caps hedged requests to HEDGE_MAX_RATIO of primary requests.
+    Every primary request deposits `ratio` tokens (up to `burst`); every hedge spends one.
+    """
+
+    def __init__(self, ratio: float = HEDGE_MAX_RATIO, burst: float = HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class HedgePolicy:
+    """Decides when a hedge may be sent and keeps the counters for it."""
+
+    def __init__(self, tracker: LatencyTracker):
+        self.tracker = tracker
+        self.budget = HedgeBudget()
+        self.counters = {"requests": 0, "hedges_sent": 0, "hedges_won": 0, "hedges_denied": 0}
+
+    def delay_for(self, model: str) -> float:
+        """Hedge after the model's observed p95 latency, or the configured default until there is data."""
+        if self.tracker.count(model) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.tracker.percentile(model, HEDGE_PERCENTILE))
+
+    def start_request(self):
+        self.counters["requests"] += 1
+        self.budget.deposit()
+
+    def allow_hedge(self) -> bool:
+        if self.budget.try_spend():
+            self.counters["hedges_sent"] += 1
+            return True
+        self.counters["hedges_denied"] += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"enabled": HEDGE_ENABLED, **self.counters}
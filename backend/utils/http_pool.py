@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Pool settings for the shared upstream clients. All of them can be overridden from .env
+HTTP2_ENABLED = os.getenv("HTTP_POOL_HTTP2", "true").lower() in ("1", "true", "yes")
+MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "60.0"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_POOL_CONNECT_TIMEOUT", "10.0"))
+WARMUP_CONNECTIONS = int(os.getenv("HTTP_POOL_WARMUP_CONNECTIONS", "2"))
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_client_info: Dict[str, dict] = {}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (installed with httpx[http2])."""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+        return False
+    return True
+
+
+def _count_request(name: str):
+    async def _hook(request: httpx.Request):
+        _client_info[name]["requests"] += 1
+    return _hook
+
+
+def get_client(name: str, timeout: float, max_connections: Optional[int] = None) -> httpx.AsyncClient:
+    """
+    Returns the long-lived AsyncClient registered under `name`, creating it on first use.
+    Normally the clients are created from the FastAPI lifespan in main.py; lazy creation
+    keeps scripts and one-off imports working without the app running.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=max_connections or MAX_CONNECTIONS,
+            max_keepalive_connections=min(MAX_KEEPALIVE_CONNECTIONS, max_connections or MAX_CONNECTIONS),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        http2 = _http2_available()
+        client = httpx.AsyncClient(
+            http2=http2,
+            limits=limits,
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+        )
+        _clients[name] = client
+        _client_info[name] = {"http2": http2, "max_connections": limits.max_connections, "requests": 0}
+        client.event_hooks["request"].append(_count_request(name))
+        logger.info(f"[HTTPPool] Created client '{name}' (http2={http2}, max_connections={limits.max_connections})")
+    return client
+
+
+async def warm_up(name: str, url: str, connections: int = WARMUP_CONNECTIONS):
+    """
+    Opens connections to `url` ahead of the first real request so the TCP+TLS handshake
+    is paid at startup. Failures are logged and ignored - warming is best effort.
+    """
+    client = _clients.get(name)
+    if client is None:
+        return
+
+    async def _touch():
+        try:
+            await client.head(url)
+        except httpx.HTTPError as e:
+            logger.warning(f"[HTTPPool] Warm-up request for '{name}' failed: {e}")
+
+    # With HTTP/2 one connection multiplexes every request, so a single warm-up is enough
+    count = 1 if _client_info[name]["http2"] else max(1, connections)
+    await asyncio.gather(*(_touch() for _ in range(count)))
+    logger.info(f"[HTTPPool] Warmed {count} connection(s) for '{name}'")
+
+
+async def close_all():
+    """Closes every registered client. Called from the FastAPI lifespan on shutdown."""
+    for name, client in list(_clients.items()):
+        if not client.is_closed:
+            await client.aclose()
+            logger.info(f"[HTTPPool] Closed client '{name}'")
+    _clients.clear()
+    _client_info.clear()
+
+
+def stats() -> Dict[str, dict]:
+    """Pool settings and request counts per registered client, for diagnostics."""
+    return {
+        name: {"closed": client.is_closed, **_client_info[name]}
+        for name, client in _clients.items()
+    }
@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import secrets
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join("data", "jobs.sqlite3"))
+# Uploaded inputs of jobs that have not finished yet
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join("data", "jobs"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+# Queued plus running jobs; further submissions are rejected
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "100"))
+# How long finished jobs and their results are kept
+JOBS_RESULT_TTL_SECONDS = float(os.getenv("JOBS_RESULT_TTL_SECONDS", str(24 * 3600)))
+# A job interrupted by this many restarts is failed instead of being resumed again
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_SWEEP_INTERVAL_SECONDS = float(os.getenv("JOBS_SWEEP_INTERVAL_SECONDS", "300"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+_CANCELLED_ERROR = json.dumps({"status_code": 499, "detail": "The job was cancelled."})
+
+# handler(job, report) -> result; `report` takes progress dicts
+JobHandler = Callable[[dict, Callable[[dict], None]], Awaitable[dict]]
+
+
+class JobQueueFull(Exception):
+    """Raised when JOBS_MAX_PENDING jobs are already queued or running."""
+
+
+def _apply_progress(progress: dict, event: dict):
+    """Folds one pipeline event into the job's progress summary."""
+    progress["stage"] = event.get("stage", progress.get("stage"))
+    if event.get("stage") == "extract":
+        for key in ("pages_extracted", "pages"):
+            if key in event:
+                progress[key] = event[key]
+    elif event.get("stage") == "map":
+        if event.get("status") == "started":
+            progress["chunks"] = event.get("chunks", 0)
+            progress["chunks_summarized"] = 0
+        elif event.get("status") in ("done", "reused"):
+            progress["chunks_summarized"] = progress.get("chunks_summarized", 0) + 1
+    elif event.get("stage") == "reduce":
+        progress["merge_level"] = event.get("level")
+    progress["last_event"] = event
+
+
+class JobManager:
+    """
+    Runs long note generations in the background. Submitting a job stores it in SQLite and
+    returns its ID at once; JOBS_WORKERS worker tasks run the registered handler for its kind.
+    Progress events are kept in memory and fanned out to subscribers (SSE), and polling
+    returns a summary of them.
+
+    Job state survives restarts: jobs that were queued or running when the server stopped are
+    queued again on start. They resume from the content store and response cache, so sections
+    that were already summarized are not generated again. Finished jobs, with their results,
+    are deleted JOBS_RESULT_TTL_SECONDS after they finish.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, workers: int = JOBS_WORKERS,
+                 max_pending: int = JOBS_MAX_PENDING, ttl: float = JOBS_RESULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._handlers: Dict[str, JobHandler] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Set[str] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: Set[str] = set()
+        self._progress: Dict[str, dict] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "resumed": 0, "expired": 0, "rejected": 0}
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    # --- SQLite ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    input_path TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._db.commit()
+        return self._db
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        with self._db_lock:
+            db = self._connect()
+            rowcount = db.execute(sql, params).rowcount
+            db.commit()
+            return rowcount
+
+    def _fetch(self, sql: str, params: tuple = ()) -> List[dict]:
+        with self._db_lock:
+            return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def _recover(self) -> List[str]:
+        """Re-queues jobs interrupted by a shutdown and returns the IDs of all queued jobs."""
+        with self._db_lock:
+            db = self._connect()
+            failed = db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND attempts >= ?",
+                (FAILED, json.dumps({"status_code": 500, "detail": "The job was interrupted too many times."}),
+                 time.time(), RUNNING, JOBS_MAX_ATTEMPTS),
+            ).rowcount
+            resumed = db.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)).rowcount
+            db.commit()
+            queued = [row[0] for row in db.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+        self.counters["resumed"] += resumed
+        self.counters["failed"] += failed
+        if resumed or failed:
+            logger.info(f"[Jobs] Resuming {resumed} interrupted jobs, {failed} failed after {JOBS_MAX_ATTEMPTS} attempts")
+        return queued
+
+    def _sweep(self) -> int:
+        expired = self._fetch(
+            "SELECT id, input_path FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - self.ttl,)
+        )
+        for job in expired:
+            self.remove_input(job["input_path"])
+            self._execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+        return len(expired)
+
+    @staticmethod
+    def remove_input(path: Optional[str]):
+        """Deletes a job's saved upload, if it still exists."""
+        if path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    # --- workers ---
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(self._recover):
+            self._pending.add(job_id)
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        # Running jobs stay "running" in the database and are resumed on the next start
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    async def _sweeper(self):
+        while True:
+            try:
+                expired = await asyncio.to_thread(self._sweep)
+                self.counters["expired"] += expired
+            except sqlite3.Error as e:
+                logger.error(f"[Jobs] Sweep failed: {e}")
+            await asyncio.sleep(JOBS_SWEEP_INTERVAL_SECONDS)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Jobs] Worker failed on job {job_id}: {e}")
+
+    async def _run(self, job_id: str):
+        rows = await asyncio.to_thread(self._fetch, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows or rows[0]["status"] != QUEUED:
+            self._pending.discard(job_id)
+            return
+        job = rows[0]
+        job["payload"] = json.loads(job["payload"])
+
+        started = time.time()
+        # Only a job that is still queued is started: a cancel may have claimed it meanwhile
+        claimed = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ? AND status = ?",
+            (RUNNING, started, job_id, QUEUED),
+        )
+        if not claimed:
+            self._pending.discard(job_id)
+            return
+        self._progress[job_id] = {}
+        self._publish(job_id, "status", {"status": RUNNING})
+
+        def report(event: dict):
+            _apply_progress(self._progress.setdefault(job_id, {}), event)
+            self._publish(job_id, "progress", event)
+
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            error = {"status_code": 500, "detail": f"No handler for job kind {job['kind']!r}"}
+            logger.error(f"[Jobs] {job['kind']} job {job_id} failed: {error['detail']}")
+            await self._finish(job_id, FAILED, None, json.dumps(error), job["input_path"])
+            return
+
+        # The task covers the handler and recording its outcome, so cancel() can await it
+        task = asyncio.ensure_future(self._perform(job, handler, report, started))
+        self._running[job_id] = task
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # Shutdown: leave the job running so it is resumed on the next start
+            task.cancel()
+            raise
+        finally:
+            self._running.pop(job_id, None)
+        # A task cancelled before it started is recorded by cancel()
+        if not task.cancelled():
+            task.result()
+
+    async def _perform(self, job: dict, handler: JobHandler, report: Callable[[dict], None], started: float):
+        job_id = job["id"]
+        try:
+            result = await handler(job, report)
+            status, result_json, error_json = SUCCEEDED, json.dumps(result), None
+        except asyncio.CancelledError:
+            if job_id not in self._cancel_requested:
+                raise
+            status, result_json, error_json = CANCELLED, None, _CANCELLED_ERROR
+        except Exception as e:
+            error = {"status_code": getattr(e, "status_code", 500), "detail": str(getattr(e, "detail", None) or e)}
+            logger.error(f"[Jobs] {job['kind']} job {job_id} failed: {error['detail']}")
+            status, result_json, error_json = FAILED, None, json.dumps(error)
+        finally:
+            self._cancel_requested.discard(job_id)
+
+        await self._finish(job_id, status, result_json, error_json, job["input_path"])
+        logger.info(f"[Jobs] {job['kind']} job {job_id} {status} in {time.time() - started:.1f}s")
+
+    async def _finish(self, job_id: str, status: str, result_json: Optional[str], error_json: Optional[str],
+                      input_path: Optional[str]):
+        await asyncio.to_thread(
+            self._execute, "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, result_json, error_json, time.time(), job_id),
+        )
+        await asyncio.to_thread(self.remove_input, input_path)
+        self._pending.discard(job_id)
+        self._progress.pop(job_id, None)
+        self.counters[status] += 1
+        if status == SUCCEEDED:
+            self._publish(job_id, "done", json.loads(result_json))
+        else:
+            self._publish(job_id, "failed", {"status": status, **json.loads(error_json)})
+
+    def _publish(self, job_id: str, event: str, data: dict):
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait((event, data))
+
+    # --- public API ---
+
+    def input_path(self, job_id: str, suffix: str = "") -> str:
+        """Where a job's uploaded input should be saved before it is submitted."""
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        return os.path.join(JOBS_DIR, f"{job_id}{suffix}")
+
+    def new_id(self) -> str:
+        return secrets.token_hex(16)
+
+    def check_capacity(self):
+        if len(self._pending) >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise JobQueueFull("Too many jobs are waiting right now. Please try again in a moment.")
+
+    async def submit(self, kind: str, payload: dict, job_id: Optional[str] = None, input_path: Optional[str] = None) -> dict:
+        """Stores a job and queues it; raises JobQueueFull."""
+        self.check_capacity()
+        job_id = job_id or self.new_id()
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO jobs (id, kind, status, payload, input_path, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, json.dumps(payload), input_path, time.time()),
+        )
+        self._pending.add(job_id)
+        self._queue.put_nowait(job_id)
+        self.counters["submitted"] += 1
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        rows = await asyncio.to_thread(
+            self._fetch,
+            "SELECT id, kind, status, result, error, attempts, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+        if not rows:
+            return None
+        job = rows[0]
+        state = {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "progress": {k: v for k, v in self._progress.get(job_id, {}).items() if k != "last_event"},
+        }
+        if job["status"] == QUEUED:
+            ahead = await asyncio.to_thread(
+                self._fetch, "SELECT COUNT(*) AS n FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, job["created_at"])
+            )
+            state["jobs_ahead"] = ahead[0]["n"]
+        if job["finished_at"]:
+            state["expires_at"] = job["finished_at"] + self.ttl
+        if job["result"]:
+            state["result"] = json.loads(job["result"])
+        if job["error"]:
+            state["error"] = json.loads(job["error"])
+        return state
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancels a queued or running job; finished jobs are left as they are."""
+        job = await self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        if job_id not in self._running:
+            # Claim the queued job with the same status guard _run uses, so only one of them wins
+            claimed = await asyncio.to_thread(
+                self._execute, "UPDATE jobs SET status = ? WHERE id = ? AND status = ?", (CANCELLED, job_id, QUEUED)
+            )
+            if claimed:
+                await self._finish_cancelled(job_id)
+                return await self.get(job_id)
+        # Running, or started by a worker while the claim above was in flight: _run registers
+        # its task right after its own claim, which committed first
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancel_requested.add(job_id)
+            task.cancel()
+            # Done once the handler has unwound and the cancellation is recorded
+            await asyncio.wait({task})
+            if task.cancelled():
+                # Cancelled before the handler started, so _perform never got to record it
+                self._cancel_requested.discard(job_id)
+                await self._finish_cancelled(job_id)
+        return await self.get(job_id)
+
+    async def _finish_cancelled(self, job_id: str):
+        rows = await asyncio.to_thread(self._fetch, "SELECT input_path FROM jobs WHERE id = ?", (job_id,))
+        await self._finish(job_id, CANCELLED, None, _CANCELLED_ERROR, rows[0]["input_path"] if rows else None)
+
+    async def events(self, job_id: str, keepalive: float = 15.0):
+        """
+        Yields (event, data) pairs for a job: its current state, then progress events until it
+        finishes with "done" (the result) or "failed". None is yielded every `keepalive`
+        seconds without events, so proxies do not close an idle stream.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            if job["status"] == SUCCEEDED:
+                yield "done", job["result"]
+                return
+            if job["status"] in FINISHED:
+                yield "failed", {"status": job["status"], **job.get("error", {})}
+                return
+            yield "status", {"status": job["status"], "progress": job["progress"]}
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event, data
+                if event in ("done", "failed"):
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": len(self._pending),
+            "running": len(self._running),
+            "max_pending": self.max_pending,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            **self.counters,
+        }
+
+
+job_manager = JobManager()
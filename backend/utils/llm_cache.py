@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from utils.db_size import track_sizes, stored_bytes
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+DB_PATH = os.getenv("LLM_CACHE_DB_PATH", os.path.join("data", "llm_cache.sqlite3"))
+TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+DB_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_DB_MB", "256")) * 1024 * 1024)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so prompts that differ only in indentation or spacing share an entry."""
+    return " ".join(prompt.split())
+
+
+def make_key(model: str, prompt: str, generation_config: Optional[dict] = None) -> str:
+    """Content address of a request: SHA-256 over (model, normalized prompt, generation config)."""
+    material = json.dumps(
+        [model, normalize_prompt(prompt), generation_config or {}],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier response cache: a bounded in-process LRU in front of a persistent SQLite table.
+    SQLite work runs in a thread so lookups never block the event loop.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_entries: int = MEMORY_MAX_ENTRIES,
+                 ttl: float = TTL_SECONDS, max_db_bytes: int = DB_MAX_BYTES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_bytes = max_db_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses(created_at)")
+            track_sizes(self._db, ("responses",))
+            self._db.commit()
+        return self._db
+
+    # --- in-memory tier ---
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # --- SQLite tier (called from a worker thread) ---
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            return row
+
+    def _disk_set(self, key: str, model: str, value: str, created_at: float):
+        size = len(value.encode("utf-8"))
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, size, created_at, created_at),
+            )
+            self._evict_locked(db)
+            db.commit()
+
+    def _evict_locked(self, db: sqlite3.Connection):
+        expired = db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+        self.counters["evictions"] += max(expired, 0)
+        total = stored_bytes(db, ("responses",))
+        if total <= self.max_db_bytes:
+            return
+        # Drop least recently used rows until the table fits the size budget again
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_db_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.counters["evictions"] += 1
+
+    # --- public API ---
+
+    async def get(self, *keys: str) -> Optional[str]:
+        """Returns the first cached value among `keys` (in order), or None. Counts one hit or miss per call."""
+        for key in keys:
+            value = self._memory_get(key)
+            if value is not None:
+                self.counters["memory_hits"] += 1
+                return value
+        for key in keys:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                self.counters["disk_hits"] += 1
+                self._memory_set(key, row[0], row[1])
+                return row[0]
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, model: str, value: str):
+        created_at = time.time()
+        self._memory_set(key, value, created_at)
+        try:
+            await asyncio.to_thread(self._disk_set, key, model, value, created_at)
+            self.counters["writes"] += 1
+        except sqlite3.Error as e:
+            # The memory tier still serves the entry; a broken disk tier must not fail the request
+            logger.error(f"[LLMCache] Failed to persist cache entry: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            "enabled": CACHE_ENABLED,
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+llm_cache = LLMCache()
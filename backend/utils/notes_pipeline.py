@@ -0,0 +1,357 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Set
+
+from utils.scheduler import Priority
+from utils.retry import RETRY_POLICIES
+from utils.tokens import token_estimator, PromptTooLargeError
+from utils.text_normalize import NORMALIZE_ENABLED, NORMALIZE_VERSION, normalize_pages
+
+logger = logging.getLogger(__name__)
+
+# Documents larger than one chunk are summarized chunk by chunk and then merged
+NOTES_CHUNK_TOKENS = int(os.getenv("NOTES_CHUNK_TOKENS", "12000"))
+# Chunk summaries generated at the same time for one document
+NOTES_CHUNK_CONCURRENCY = int(os.getenv("NOTES_CHUNK_CONCURRENCY", "4"))
+# Section notes combined by one merge call
+NOTES_MERGE_FAN_IN = int(os.getenv("NOTES_MERGE_FAN_IN", "6"))
+# Extra attempts for a chunk whose generation failed after the per-call retry policy gave up
+NOTES_CHUNK_RETRIES = int(os.getenv("NOTES_CHUNK_RETRIES", "2"))
+NOTES_MAX_CHUNKS = int(os.getenv("NOTES_MAX_CHUNKS", "64"))
+# Smaller chunks used when a document is uploaded as a revision of an earlier one, so an edit
+# to a few pages only invalidates the sections around them
+NOTES_REVISION_CHUNK_TOKENS = int(os.getenv("NOTES_REVISION_CHUNK_TOKENS", "3000"))
+# A chunk may end after a page whose hash is divisible by this (once it is half full). Because
+# these boundaries depend on page content rather than position, chunking resynchronizes right
+# after an inserted or deleted page instead of shifting every later chunk
+NOTES_CHUNK_BOUNDARY_MODULUS = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    first_page: int
+    last_page: int
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(" ".join(self.text.split()).encode("utf-8")).hexdigest()
+
+    @property
+    def label(self) -> str:
+        if self.first_page == self.last_page:
+            return f"page {self.first_page + 1}"
+        return f"pages {self.first_page + 1}-{self.last_page + 1}"
+
+
+def _split_page(text: str, max_tokens: int) -> List[str]:
+    """Splits one oversized page (or a whole DOCX/TXT document) at paragraph breaks, then between words."""
+    pieces, current = [], ""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if token_estimator.estimate(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if token_estimator.estimate(paragraph) <= max_tokens:
+            current = paragraph
+        else:
+            *full, current = token_estimator.split(paragraph, max_tokens)
+            pieces.extend(full)
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _page_hash(page: str) -> int:
+    return int(hashlib.sha256(" ".join(page.split()).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def chunk_pages(pages: List[str], max_tokens: Optional[int] = None) -> List[Chunk]:
+    """
+    Packs consecutive pages into chunks of at most `max_tokens` (by the calibrated token
+    estimate). Chunks break between pages where possible; a page that is too large on its own
+    is split at paragraph boundaries. Past half of `max_tokens`, a chunk also ends after any
+    page whose content hash hits NOTES_CHUNK_BOUNDARY_MODULUS, so unchanged pages of a revised
+    document land in the same chunks as before.
+    """
+    max_tokens = max_tokens or NOTES_CHUNK_TOKENS
+    chunks: List[Chunk] = []
+    parts, first, tokens = [], 0, 0
+
+    def flush(last: int):
+        nonlocal parts, tokens
+        if parts:
+            chunks.append(Chunk(len(chunks), "\n".join(parts), first, last))
+        parts, tokens = [], 0
+
+    for number, page in enumerate(pages):
+        if not page.strip():
+            continue
+        page_tokens = token_estimator.estimate(page)
+        if page_tokens > max_tokens:
+            flush(number - 1)
+            for piece in _split_page(page, max_tokens):
+                chunks.append(Chunk(len(chunks), piece, number, number))
+            continue
+        if tokens + page_tokens > max_tokens:
+            flush(number - 1)
+        if not parts:
+            first = number
+        parts.append(page)
+        tokens += page_tokens
+        if tokens >= max_tokens // 2 and _page_hash(page) % NOTES_CHUNK_BOUNDARY_MODULUS == 0:
+            flush(number)
+    flush(len(pages) - 1)
+    return chunks
+
+
+def notes_prompt_version(ai_client) -> str:
+    """
+    Fingerprint of everything that shapes generated notes: the notes, section and merge
+    prompt templates plus the chunking and text normalization settings. Stored notes are keyed by it, so editing
+    build_notes_prompt (or the pipeline settings) retires previously stored notes.
+    """
+    material = "\x00".join([
+        ai_client.build_notes_prompt(""),
+        ai_client.build_section_notes_prompt("", 0, 0, ""),
+        ai_client.build_merge_notes_prompt([], final=False),
+        ai_client.build_merge_notes_prompt([], final=True),
+        str(NOTES_CHUNK_TOKENS),
+        str(NOTES_MERGE_FAN_IN),
+        f"normalize:{NORMALIZE_VERSION}" if NORMALIZE_ENABLED else "",
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+
+def needs_map_reduce(pages: List[str]) -> bool:
+    return token_estimator.estimate("\n".join(pages)) > NOTES_CHUNK_TOKENS
+
+
+async def previous_chunks(store, previous_hash: str) -> tuple:
+    """
+    Chunk size and chunk hashes of an earlier version of a document, from its last map-reduce
+    run or, failing that, by re-chunking its stored (normalized) text. The hashes are None if
+    the earlier version is unknown.
+    """
+    found = await store.get_document_chunks(previous_hash)
+    if found:
+        return found
+    document = await store.get_document(previous_hash)
+    if document is None:
+        return NOTES_REVISION_CHUNK_TOKENS, None
+    pages, _ = await asyncio.to_thread(normalize_pages, document[1])
+    return NOTES_REVISION_CHUNK_TOKENS, [chunk.hash for chunk in chunk_pages(pages, NOTES_REVISION_CHUNK_TOKENS)]
+
+
+def compare_revision(previous_hashes: Optional[List[str]], chunk_hashes: List[str], reused_hashes=()) -> dict:
+    """
+    How a revision's chunks relate to the previous version's: `unchanged` chunks have the same
+    text, and `reused_from_previous` counts those whose stored notes were actually reused. The
+    two differ when the previous version never stored section notes, e.g. because it was short
+    enough for a single prompt.
+    """
+    if previous_hashes is None:
+        return {"previous_found": False}
+    previous, current, reused = set(previous_hashes), set(chunk_hashes), set(reused_hashes)
+    unchanged = [chunk_hash for chunk_hash in chunk_hashes if chunk_hash in previous]
+    return {
+        "previous_found": True,
+        "unchanged": len(unchanged),
+        "reused_from_previous": sum(1 for chunk_hash in unchanged if chunk_hash in reused),
+        "changed": len(chunk_hashes) - len(unchanged),
+        "removed": len(previous - current),
+    }
+
+
+class SectionedPipeline:
+    """
+    What the document and video notes pipelines share: section prompts generated a bounded
+    number at a time, a failed section retried on its own, and progress events that are
+    passed to `on_progress` and, for streaming responses, relayed into the stream.
+    """
+
+    log_tag = "NotesPipeline"
+    retry_policy = "notes"
+
+    def __init__(self, ai_client, use_cache: bool, priority: Priority,
+                 on_progress: Optional[Callable[[dict], None]], concurrency: int):
+        self.ai_client = ai_client
+        self.use_cache = use_cache
+        self.priority = priority
+        self.on_progress = on_progress
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    def _report(self, **event) -> dict:
+        logged = {key: value for key, value in event.items() if key != "notes"}
+        logger.info(f"[{self.log_tag}] {logged}")
+        if self.on_progress:
+            self.on_progress(event)
+        return event
+
+    async def _generate(self, prompt: str) -> str:
+        async with self.semaphore:
+            return await self.ai_client._generate_with_fallback(
+                prompt, use_cache=self.use_cache, priority=self.priority, retry_policy=RETRY_POLICIES[self.retry_policy]
+            )
+
+    async def _generate_section(self, prompt: str, position: dict) -> str:
+        """
+        Notes for one section, retried up to NOTES_CHUNK_RETRIES more times if it fails or
+        comes back empty. "retry" and "failed" map events carry `position`; "done" is left to
+        the caller.
+        """
+        for attempt in range(1, NOTES_CHUNK_RETRIES + 2):
+            try:
+                notes = await self._generate(prompt)
+                if not notes:
+                    raise ValueError("empty response")
+                return notes
+            except PromptTooLargeError:
+                raise
+            except Exception as e:
+                if attempt > NOTES_CHUNK_RETRIES:
+                    self._report(stage="map", status="failed", **position)
+                    raise
+                self._report(stage="map", status="retry", **position, attempt=attempt, error=str(e))
+                await asyncio.sleep(RETRY_POLICIES[self.retry_policy].base_delay * attempt)
+
+    async def _relay(self, task: asyncio.Future):
+        """
+        Yields the progress events reported while `task` runs, as they happen; `on_progress`
+        still receives them too. The task is cancelled if the stream is closed early.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        forward = self.on_progress
+
+        def relay(event: dict):
+            events.put_nowait(event)
+            if forward:
+                forward(event)
+
+        self.on_progress = relay
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            self.on_progress = forward
+            task.cancel()
+
+
+class NotesPipeline(SectionedPipeline):
+    """
+    Map-reduce note generation for documents too large for one prompt: chunks are summarized
+    concurrently (at most NOTES_CHUNK_CONCURRENCY at a time), then the section notes are merged
+    NOTES_MERGE_FAN_IN at a time until one final merge produces the structured notes.
+
+    A failed chunk is retried on its own; the other chunks' results are kept, and because
+    every call goes through the response cache a repeated request does not redo them either.
+    `on_progress` receives a dict per chunk and merge step.
+
+    With a `chunk_store`, section notes are also stored by chunk hash and reused for any
+    later document containing the same chunk, e.g. a revised upload with a few changed pages;
+    `summary` then reports how many sections were reused and generated.
+    """
+
+    def __init__(self, ai_client, use_cache: bool = True, priority: Priority = Priority.BULK,
+                 on_progress: Optional[Callable[[dict], None]] = None, chunk_store=None,
+                 chunk_tokens: Optional[int] = None):
+        super().__init__(ai_client, use_cache, priority, on_progress, NOTES_CHUNK_CONCURRENCY)
+        self.chunk_store = chunk_store
+        self.chunk_tokens = chunk_tokens or NOTES_CHUNK_TOKENS
+        self.chunk_hashes: List[str] = []
+        # Chunks whose section notes came from the chunk store rather than Gemini
+        self.reused_hashes: Set[str] = set()
+        self.summary = {"chunks": 0, "reused": 0, "generated": 0, "reused_tokens": 0}
+
+    async def _summarize_chunk(self, chunk: Chunk, total: int) -> str:
+        position = {"chunk": chunk.index + 1, "chunks": total, "pages": chunk.label}
+        if self.chunk_store and self.use_cache:
+            stored = await self.chunk_store.get_chunk_notes(chunk.hash)
+            if stored:
+                self.reused_hashes.add(chunk.hash)
+                self.summary["reused"] += 1
+                self.summary["reused_tokens"] += token_estimator.estimate(chunk.text)
+                self._report(stage="map", status="reused", **position)
+                return stored
+        prompt = self.ai_client.build_section_notes_prompt(chunk.text, chunk.index + 1, total, chunk.label)
+        notes = await self._generate_section(prompt, position)
+        self.summary["generated"] += 1
+        if self.chunk_store:
+            await self.chunk_store.put_chunk_notes(chunk.hash, notes)
+        self._report(stage="map", status="done", **position)
+        return notes
+
+    def _merge_groups(self, notes: List[str]) -> List[List[str]]:
+        """Groups consecutive notes so each merge prompt stays within the fan-in and the token budget."""
+        budget = min(self.ai_client.prompt_budget(), NOTES_CHUNK_TOKENS * NOTES_MERGE_FAN_IN)
+        groups, current, tokens = [], [], 0
+        for item in notes:
+            item_tokens = token_estimator.estimate(item)
+            if current and (len(current) >= NOTES_MERGE_FAN_IN or tokens + item_tokens > budget):
+                groups.append(current)
+                current, tokens = [], 0
+            current.append(item)
+            tokens += item_tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _map_and_reduce(self, pages: List[str]) -> List[str]:
+        """Summarizes the chunks and merges until the remaining notes fit one final merge."""
+        chunks = chunk_pages(pages, self.chunk_tokens)
+        self.chunk_hashes = [chunk.hash for chunk in chunks]
+        self.summary["chunks"] = len(chunks)
+        if len(chunks) > NOTES_MAX_CHUNKS:
+            raise PromptTooLargeError(
+                f"The document is too large to process ({len(chunks)} sections, limit {NOTES_MAX_CHUNKS}). "
+                "Please upload a shorter document."
+            )
+        self._report(stage="map", status="started", chunks=len(chunks))
+        notes = list(await asyncio.gather(*(self._summarize_chunk(chunk, len(chunks)) for chunk in chunks)))
+
+        level = 0
+        # Stop once everything fits one merge, or if notes are too large to combine any further
+        while 1 < len(groups := self._merge_groups(notes)) < len(notes):
+            level += 1
+            self._report(stage="reduce", status="started", level=level, groups=len(groups))
+            notes = list(await asyncio.gather(*(
+                self._generate(self.ai_client.build_merge_notes_prompt(group, final=False)) for group in groups
+            )))
+            self._report(stage="reduce", status="done", level=level, groups=len(groups))
+        return notes
+
+    async def generate(self, pages: List[str]) -> str:
+        notes = await self._map_and_reduce(pages)
+        self._report(stage="final", status="started", parts=len(notes))
+        final = await self._generate(self.ai_client.build_merge_notes_prompt(notes, final=True))
+        self._report(stage="final", status="done")
+        return final
+
+    async def stream(self, pages: List[str]):
+        """
+        Yields progress dicts while chunks are summarized and merged, then the text chunks of
+        the final merge as it is generated.
+        """
+        task = asyncio.ensure_future(self._map_and_reduce(pages))
+        async with aclosing(self._relay(task)) as events:
+            async for event in events:
+                yield event
+        notes = task.result()
+
+        yield self._report(stage="final", status="started", parts=len(notes))
+        async for text in self.ai_client._stream_with_fallback(
+            self.ai_client.build_merge_notes_prompt(notes, final=True),
+            use_cache=self.use_cache, priority=self.priority, retry_policy=RETRY_POLICIES["notes"],
+        ):
+            yield text
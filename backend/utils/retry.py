@@ -0,0 +1,106 @@
+import os
+import re
+import random
+import logging
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3          # attempts per model, including the first one
+    base_delay: float = 0.5        # seconds
+    max_delay: float = 20.0        # cap for a single backoff sleep
+    deadline: float = 120.0        # overall budget for the whole request, across models
+    retry_on: Tuple[int, ...] = field(default=RETRYABLE_STATUS_CODES)
+
+
+def _policy_from_env(name: str, default: RetryPolicy) -> RetryPolicy:
+    """GEMINI_RETRY_<NAME>="attempts:base_delay:max_delay:deadline" overrides a policy."""
+    spec = os.getenv(f"GEMINI_RETRY_{name.upper()}")
+    if not spec:
+        return default
+    try:
+        attempts, base, cap, deadline = spec.split(":")
+        return RetryPolicy(int(attempts), float(base), float(cap), float(deadline))
+    except ValueError:
+        logger.error(f"[Retry] Ignoring malformed GEMINI_RETRY_{name.upper()}: {spec!r}")
+        return default
+
+
+# Per-endpoint policies: chat must answer quickly, note generation can afford to wait out an overload
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    name: _policy_from_env(name, policy)
+    for name, policy in {
+        "default": RetryPolicy(),
+        "chat": RetryPolicy(max_attempts=2, base_delay=0.3, max_delay=3.0, deadline=30.0),
+        "plan": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=90.0),
+        "notes": RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=20.0, deadline=240.0),
+        "youtube": RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=20.0, deadline=240.0),
+        "background": RetryPolicy(max_attempts=1, deadline=60.0),
+    }.items()
+}
+
+
+def decorrelated_jitter(previous: float, policy: RetryPolicy) -> float:
+    """'Decorrelated jitter' backoff: sleep = min(cap, uniform(base, previous * 3))."""
+    return min(policy.max_delay, random.uniform(policy.base_delay, max(policy.base_delay, previous * 3)))
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    # google.protobuf.Duration in JSON form, e.g. "12s" or "0.500s"
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)s\s*", value or "")
+    return float(match.group(1)) if match else None
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Server-requested delay in seconds, from the Retry-After header (seconds or HTTP date) or
+    from a google.rpc.RetryInfo entry in the error body's `details`.
+    """
+    header = response.headers.get("retry-after")
+    if header:
+        if header.strip().isdigit():
+            return float(header)
+        try:
+            when = parsedate_to_datetime(header)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except Exception:
+        return None
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("google.rpc.RetryInfo"):
+            return _parse_duration(detail.get("retryDelay", ""))
+    return None
+
+
+class RetryStats:
+    def __init__(self):
+        self.counters: Dict[str, dict] = {}
+
+    def _model(self, model: str) -> dict:
+        return self.counters.setdefault(model, {"retries": 0, "by_status": {}, "gave_up": 0, "slept": 0.0})
+
+    def record_retry(self, model: str, status: Optional[int], delay: float):
+        entry = self._model(model)
+        entry["retries"] += 1
+        key = str(status or "timeout")
+        entry["by_status"][key] = entry["by_status"].get(key, 0) + 1
+        entry["slept"] = round(entry["slept"] + delay, 3)
+
+    def record_give_up(self, model: str):
+        self._model(model)["gave_up"] += 1
+
+    def stats(self) -> dict:
+        return self.counters
@@ -0,0 +1,167 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("GEMINI_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+DEFAULT_RPM = float(os.getenv("GEMINI_DEFAULT_RPM", "60"))
+DEFAULT_TPM = float(os.getenv("GEMINI_DEFAULT_TPM", "1000000"))
+# Per-model overrides: "model:rpm:tpm,model:rpm:tpm"
+RATE_LIMITS = os.getenv("GEMINI_RATE_LIMITS", "")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+    BACKGROUND = 2
+
+
+# How long a caller of each class may wait in the queue before giving up (seconds)
+DEFAULT_DEADLINES = {
+    Priority.INTERACTIVE: float(os.getenv("GEMINI_QUEUE_DEADLINE_INTERACTIVE", "15")),
+    Priority.BULK: float(os.getenv("GEMINI_QUEUE_DEADLINE_BULK", "90")),
+    Priority.BACKGROUND: float(os.getenv("GEMINI_QUEUE_DEADLINE_BACKGROUND", "300")),
+}
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request could not get a rate-limit slot before its deadline."""
+
+
+def _parse_rate_limits(spec: str) -> Dict[str, tuple]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, rpm, tpm = item.split(":")
+            limits[model] = (float(rpm), float(tpm))
+        except ValueError:
+            logger.error(f"[Scheduler] Ignoring malformed GEMINI_RATE_LIMITS entry: {item!r}")
+    return limits
+
+
+class TokenBucket:
+    """Continuous-refill bucket holding at most one minute's worth of capacity."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _ModelQueue:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiters: List[list] = []
+        self.changed = asyncio.Condition()
+        self.counters = {"granted": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+
+class GeminiScheduler:
+    """
+    Client-side rate limiter in front of Gemini: a requests-per-minute and a tokens-per-minute
+    bucket per model, with a priority queue so interactive work is served before bulk and
+    background work. Callers wait up to a deadline instead of failing on the first 429.
+    """
+
+    def __init__(self):
+        self._overrides = _parse_rate_limits(RATE_LIMITS)
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._sequence = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        if model not in self._queues:
+            rpm, tpm = self._overrides.get(model, (DEFAULT_RPM, DEFAULT_TPM))
+            self._queues[model] = _ModelQueue(rpm, tpm)
+        return self._queues[model]
+
+    async def acquire(self, model: str, tokens: int, priority: Priority = Priority.BULK,
+                      deadline: Optional[float] = None) -> float:
+        """
+        Waits for a slot for one request of `tokens` tokens. Returns the time spent queued.
+        Raises SchedulerTimeout if no slot is available within `deadline` seconds.
+        """
+        if not SCHEDULER_ENABLED:
+            return 0.0
+        queue = self._queue(model)
+        timeout = DEFAULT_DEADLINES[priority] if deadline is None else deadline
+        started = time.monotonic()
+        give_up_at = started + timeout
+        entry = [int(priority), next(self._sequence)]
+        heapq.heappush(queue.waiters, entry)
+        try:
+            async with queue.changed:
+                while True:
+                    wait = None
+                    if queue.waiters[0] is entry:
+                        wait = max(queue.requests.time_until(1), queue.tokens.time_until(tokens))
+                        if wait == 0.0:
+                            queue.requests.consume(1)
+                            queue.tokens.consume(tokens)
+                            break
+                    remaining = give_up_at - time.monotonic()
+                    if remaining <= 0:
+                        queue.counters["timeouts"] += 1
+                        raise SchedulerTimeout(
+                            f"Gemini rate limit queue for {model} is full. Please try again shortly."
+                        )
+                    try:
+                        await asyncio.wait_for(queue.changed.wait(), timeout=min(wait or remaining, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if entry in queue.waiters:
+                queue.waiters.remove(entry)
+                heapq.heapify(queue.waiters)
+            # The head of the queue may have changed; let the next waiter re-check
+            async with queue.changed:
+                queue.changed.notify_all()
+
+        waited = time.monotonic() - started
+        queue.counters["granted"] += 1
+        queue.counters["total_wait"] += waited
+        queue.counters["max_wait"] = max(queue.counters["max_wait"], waited)
+        if waited > 1.0:
+            logger.info(f"[Scheduler] {Priority(priority).name} request for {model} waited {waited:.1f}s")
+        return waited
+
+    def stats(self) -> dict:
+        result = {"enabled": SCHEDULER_ENABLED}
+        for model, queue in self._queues.items():
+            granted = queue.counters["granted"]
+            result[model] = {
+                "queue_depth": len(queue.waiters),
+                "queued_by_priority": {
+                    p.name.lower(): sum(1 for entry in queue.waiters if entry[0] == p) for p in Priority
+                },
+                "granted": granted,
+                "timeouts": queue.counters["timeouts"],
+                "avg_wait": round(queue.counters["total_wait"] / granted, 3) if granted else 0.0,
+                "max_wait": round(queue.counters["max_wait"], 3),
+                "requests_available": round(queue.requests.tokens, 1),
+                "tokens_available": round(queue.tokens.tokens),
+            }
+        return result
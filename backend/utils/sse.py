@@ -0,0 +1,58 @@
+import json
+import inspect
+import logging
+from typing import Any, AsyncIterator, Callable, Optional, Union
+
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """Formats one Server-Sent Event. `data` is JSON-encoded so newlines in text stay on one line."""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+
+async def single_chunk(text: str):
+    """Wraps an already complete text as a one-chunk stream."""
+    yield text
+
+
+def sse_response(chunks: AsyncIterator[Union[str, dict]], on_complete: Optional[Callable[[str], Any]] = None) -> StreamingResponse:
+    """
+    Streams text chunks to the browser as Server-Sent Events:
+
+        event: chunk     data: {"text": "..."}    - one per generated piece of text
+        event: progress  data: {...}              - for every dict the iterator yields (e.g. chunk progress)
+        event: done      data: {...}              - the final payload, built by on_complete(full_text) (sync or async)
+        event: error     data: {"detail": "..."}  - if generation fails part way through
+
+    Errors can no longer change the HTTP status once the first byte is sent, so they are
+    reported as an `error` event instead.
+    """
+    async def event_stream():
+        collected = []
+        try:
+            async for chunk in chunks:
+                if isinstance(chunk, dict):
+                    yield format_sse(chunk, event="progress")
+                    continue
+                collected.append(chunk)
+                yield format_sse({"text": chunk}, event="chunk")
+            full_text = "".join(collected)
+            payload = on_complete(full_text) if on_complete else {"text": full_text}
+            if inspect.isawaitable(payload):
+                payload = await payload
+            yield format_sse(payload, event="done")
+        except Exception as e:
+            logger.error(f"Streaming response failed: {e}")
+            yield format_sse({"detail": str(e)}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,259 @@
+import os
+import re
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List
+
+from utils.tokens import token_estimator
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE_ENABLED = os.getenv("NORMALIZE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Lines this close to the top or bottom of a page are header/footer candidates
+NORMALIZE_EDGE_LINES = int(os.getenv("NORMALIZE_EDGE_LINES", "3"))
+# A candidate line is a running header/footer if it repeats on at least this share of pages
+NORMALIZE_REPEAT_RATIO = float(os.getenv("NORMALIZE_REPEAT_RATIO", "0.5"))
+# Documents with fewer pages are too short to tell headers from content
+NORMALIZE_MIN_PAGES = int(os.getenv("NORMALIZE_MIN_PAGES", "3"))
+# Longer edge lines are content, however often they repeat
+NORMALIZE_MAX_HEADER_CHARS = 100
+# Part of the notes prompt version: bump when the rules below change what is sent to Gemini
+NORMALIZE_VERSION = "3"
+
+# The numbers a running header or footer changes from page to page: "Page 3", "3 of 40", "3/40"
+_PAGE_COUNTER = re.compile(r"\bpage\s*\d+|\d+\s*(?:of|/)\s*\d+", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\u00a0\u2000-\u200a\u202f\u3000]+")
+_INVISIBLE = re.compile(r"[\u00ad\u200b\u200c\u200d\u2060\ufeff]")
+_LIGATURES = str.maketrans({"\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi", "\ufb04": "ffl"})
+# A word hyphenated across a line break; only when the next line continues in lower case, so
+# "Jean-\nPaul" is left alone. Whether the hyphen stays is decided by _rejoin.
+_HYPHENATED = re.compile(r"(\w+)-[ \t]*\n[ \t]*([a-z]\w*)")
+_WORD = re.compile(r"\w+(?:-\w+)*")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_PAGE_NUMBER = re.compile(r"^(?:page\s*)?[-–—\s]*(\d+)(?:\s*(?:of|/)\s*\d+)?[-–—\s]*$", re.IGNORECASE)
+# Front matter numbering; lower case only, and like page numbers it has to recur across pages,
+# since words such as "mix" or "mi" are valid numerals too
+_ROMAN_PAGE = re.compile(r"^(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})$")
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+_BOILERPLATE = re.compile(
+    r"^(?:"
+    r"(?:copyright\s*)?(?:©|\(c\))\s*(?:\d{4}|copyright).*"
+    r"|copyright\s+\d{4}.*"
+    r"|all rights reserved\.?"
+    r"|this page (?:is )?intentionally left blank\.?"
+    r"|downloaded from\s+\S+.*"
+    r"|confidential(?:\s*[-–—]\s*do not distribute)?"
+    r")$",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class NormalizationReport:
+    pages: int = 0
+    repeated_lines: int = 0
+    page_numbers: int = 0
+    boilerplate_lines: int = 0
+    dehyphenated: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    headers: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "reduction": round(self.tokens_saved / self.tokens_before, 4) if self.tokens_before else 0.0,
+            "repeated_lines": self.repeated_lines,
+            "page_numbers": self.page_numbers,
+            "boilerplate_lines": self.boilerplate_lines,
+            "dehyphenated": self.dehyphenated,
+        }
+
+
+def _line_key(line: str) -> str:
+    """
+    Compares header/footer lines with only their page counters masked, so "Page 3 of 40" and
+    "Page 4 of 40" repeat but "Theorem 3.1" and "Theorem 4.1" do not.
+    """
+    key = " ".join(line.lower().split())
+    return _PAGE_COUNTER.sub(lambda match: re.sub(r"\d+", "#", match.group(0)), key)
+
+
+def _edge_indexes(lines: List[str]) -> List[int]:
+    """
+    Indexes of the short lines among the first and last NORMALIZE_EDGE_LINES non-empty lines of
+    a page. On short pages (slides) the window shrinks to a quarter of the lines at each end,
+    so most of the page is never a header candidate.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    width = min(NORMALIZE_EDGE_LINES, len(filled) // 4)
+    if not width:
+        return []
+    edges = set(filled[:width] + filled[-width:])
+    return sorted(i for i in edges if len(lines[i].strip()) <= NORMALIZE_MAX_HEADER_CHARS)
+
+
+def _roman_value(numeral: str) -> int:
+    values = [_ROMAN_VALUES[c] for c in numeral]
+    return sum(-v if i + 1 < len(values) and v < values[i + 1] else v for i, v in enumerate(values))
+
+
+def _page_number(line: str):
+    """("arabic" | "roman", value) if the line looks like a page number, otherwise None."""
+    stripped = line.strip()
+    match = _PAGE_NUMBER.match(stripped)
+    if match:
+        return "arabic", int(match.group(1))
+    if _ROMAN_PAGE.match(stripped):
+        return "roman", _roman_value(stripped)
+    return None
+
+
+def _numbering_styles(split: List[List[str]], edges: List[List[int]]) -> set:
+    """
+    Page number styles ("arabic", "roman") that recur at the page edges: on at least two pages,
+    with values that increase from page to page, so a lone "42" or a word that happens to be a
+    numeral is kept.
+    """
+    seen = {}
+    for lines, indexes in zip(split, edges):
+        for style, value in {number for number in (_page_number(lines[i]) for i in indexes) if number}:
+            seen.setdefault(style, []).append(value)
+    return {style for style, values in seen.items() if len(set(values)) >= 2 and values == sorted(values)}
+
+
+def _rejoin(text: str):
+    """
+    Rejoins words hyphenated across line breaks. "exam-\nple" becomes "example" only when the
+    document spells "example" elsewhere without the hyphen; anything else keeps its hyphen
+    ("well-\nknown" -> "well-known"), so real compounds are never merged.
+    Returns (text, number of line breaks repaired).
+    """
+    words = set()
+    hyphenated = set()
+    for word in _WORD.findall(text.lower()):
+        (hyphenated if "-" in word else words).add(word)
+
+    def join(match: re.Match) -> str:
+        head, tail = match.group(1), match.group(2)
+        joined = head + tail
+        if joined.lower() in words and f"{head}-{tail}".lower() not in hyphenated:
+            return joined
+        return f"{head}-{tail}"
+
+    return _HYPHENATED.subn(join, text)
+
+
+def normalize_pages(pages: List[str]) -> tuple:
+    """
+    Strips what Gemini would otherwise be billed for without learning anything: running
+    headers and footers repeated across pages, page numbers, boilerplate lines (copyright,
+    "intentionally left blank"), soft hyphens and ligatures, words hyphenated across line
+    breaks, and runs of spaces and blank lines. Works on the whole document at once: the
+    header/footer scan is one pass over the page edges, and the character rules run as a
+    handful of regex substitutions over all pages joined together rather than page by page.
+
+    Returns (normalized pages, NormalizationReport). Page count and order are preserved.
+    """
+    report = NormalizationReport(pages=len(pages))
+    if not pages:
+        return pages, report
+    report.tokens_before = token_estimator.estimate("\n".join(pages))
+    if not NORMALIZE_ENABLED:
+        report.tokens_after = report.tokens_before
+        return pages, report
+
+    # Running headers and footers: edge lines whose text (page counters masked) recurs on many pages
+    split = [page.splitlines() for page in pages]
+    edges = [_edge_indexes(lines) for lines in split]
+    repeated = set()
+    numbering = set()
+    # Single documents (TXT, DOCX) and short ones have no page edges to speak of: their first
+    # and last lines are content
+    if len(pages) >= NORMALIZE_MIN_PAGES:
+        numbering = _numbering_styles(split, edges)
+        counts = Counter(key for lines, indexes in zip(split, edges) for key in {_line_key(lines[i]) for i in indexes})
+        threshold = max(2, NORMALIZE_REPEAT_RATIO * len(pages))
+        repeated = {key for key, count in counts.items() if count >= threshold and key.strip("#/ ")}
+        report.headers = sorted(repeated)[:10]
+
+    cleaned = []
+    for lines, indexes in zip(split, edges):
+        headers, numbers = set(), set()
+        for i in indexes:
+            number = _page_number(lines[i])
+            if _line_key(lines[i]) in repeated:
+                headers.add(i)
+            elif number and number[0] in numbering:
+                numbers.add(i)
+        drop = headers | numbers
+        # A page that would be left with nothing had no headers: its "repeats" are its content
+        if sum(1 for line in lines if line.strip()) <= len(drop):
+            drop = set()
+        else:
+            report.repeated_lines += len(headers)
+            report.page_numbers += len(numbers)
+        kept = []
+        for i, line in enumerate(lines):
+            if i in drop:
+                continue
+            if _BOILERPLATE.match(line.strip()):
+                report.boilerplate_lines += 1
+                continue
+            kept.append(line)
+        cleaned.append("\n".join(kept).replace("\f", "\n"))
+
+    # Character-level rules over the whole document; pages are rejoined with a form feed,
+    # which none of the rules touch, and split again afterwards
+    text = "\f".join(cleaned).translate(_LIGATURES)
+    text = _INVISIBLE.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text, report.dehyphenated = _rejoin(text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = _BLANK_LINES.sub("\n\n", text)
+    normalized = [page.strip() for page in text.split("\f")]
+
+    report.tokens_after = token_estimator.estimate("\n".join(normalized))
+    return normalized, report
+
+
+class NormalizationStats:
+    def __init__(self):
+        self.documents = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last: dict = {}
+
+    def record(self, report: NormalizationReport):
+        self.documents += 1
+        self.tokens_before += report.tokens_before
+        self.tokens_after += report.tokens_after
+        self.last = report.as_dict()
+        logger.info(
+            f"[Normalize] {report.pages} pages: {report.tokens_before} -> {report.tokens_after} tokens "
+            f"({self.last['reduction']:.1%} saved; {report.repeated_lines} header/footer lines, "
+            f"{report.page_numbers} page numbers, {report.boilerplate_lines} boilerplate lines, "
+            f"{report.dehyphenated} hyphenations)"
+        )
+
+    def stats(self) -> dict:
+        saved = self.tokens_before - self.tokens_after
+        return {
+            "enabled": NORMALIZE_ENABLED,
+            "documents": self.documents,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": saved,
+            "reduction": round(saved / self.tokens_before, 4) if self.tokens_before else 0.0,
+            "last_document": self.last,
+        }
+
+
+normalization_stats = NormalizationStats()
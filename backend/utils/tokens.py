@@ -0,0 +1,113 @@
+import os
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Input context windows of the models we use (tokens)
+MODEL_CONTEXT_LIMITS = {
+    "gemini-1.5-flash-latest": 1_048_576,
+    "gemini-1.5-pro-latest": 2_097_152,
+}
+DEFAULT_CONTEXT_LIMIT = 32_768
+# Room left for the model's answer
+OUTPUT_RESERVE_TOKENS = int(os.getenv("GEMINI_OUTPUT_RESERVE_TOKENS", "8192"))
+# Optional app-wide cap below the context window (0 = use the window), e.g. to keep latency down
+MAX_PROMPT_TOKENS = int(os.getenv("GEMINI_MAX_PROMPT_TOKENS", "0"))
+# What to do with input that does not fit: "trim" it, or "reject" the request
+OVERSIZE_STRATEGY = os.getenv("GEMINI_OVERSIZE_STRATEGY", "trim").lower()
+
+DEFAULT_CHARS_PER_TOKEN = 4.0
+# Weight of each new usageMetadata sample in the calibration average
+CALIBRATION_ALPHA = 0.1
+
+
+class PromptTooLargeError(Exception):
+    """Raised before any network call when a prompt cannot fit the model's token budget."""
+
+
+def prompt_budget(model: str) -> int:
+    """Max input tokens for `model`: its context window minus the output reserve, optionally capped."""
+    budget = MODEL_CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT) - OUTPUT_RESERVE_TOKENS
+    if MAX_PROMPT_TOKENS > 0:
+        budget = min(budget, MAX_PROMPT_TOKENS)
+    return budget
+
+
+class TokenEstimator:
+    """
+    Fast local token estimate, calibrated against the promptTokenCount Gemini reports in
+    usageMetadata. Exact counts are available from GeminiClient.count_tokens (countTokens API)
+    but cost a round trip, so budgeting uses this estimate.
+    """
+
+    def __init__(self):
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self.counters: Dict[str, dict] = {}
+        self.trimmed = 0
+        self.rejected = 0
+
+    def estimate(self, text: str) -> int:
+        if not text:
+            return 0
+        return int(len(text) / self.chars_per_token) + 1
+
+    def record_usage(self, model: str, prompt: str, usage: Optional[dict]):
+        """Books a response's usageMetadata and nudges chars_per_token towards the observed ratio."""
+        if not usage:
+            return
+        prompt_tokens = usage.get("promptTokenCount") or 0
+        entry = self.counters.setdefault(model, {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "estimated_prompt_tokens": 0})
+        entry["requests"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["output_tokens"] += usage.get("candidatesTokenCount") or 0
+        entry["estimated_prompt_tokens"] += self.estimate(prompt)
+        if prompt_tokens > 0 and len(prompt) > 200:
+            observed = len(prompt) / prompt_tokens
+            self.chars_per_token += CALIBRATION_ALPHA * (observed - self.chars_per_token)
+
+    def fit(self, text: str, max_tokens: int, what: str = "Input") -> str:
+        """
+        Returns `text` if it fits in `max_tokens`, otherwise trims it at a whitespace boundary
+        (or raises PromptTooLargeError when GEMINI_OVERSIZE_STRATEGY=reject).
+        """
+        if self.estimate(text) <= max_tokens:
+            return text
+        if OVERSIZE_STRATEGY == "reject" or max_tokens <= 0:
+            self.rejected += 1
+            raise PromptTooLargeError(
+                f"{what} is too large to process (about {self.estimate(text):,} tokens, limit {max(max_tokens, 0):,}). "
+                "Please upload a shorter document."
+            )
+        self.trimmed += 1
+        limit = int(max_tokens * self.chars_per_token)
+        cut = text.rfind(" ", 0, limit)
+        trimmed = text[:cut if cut > limit // 2 else limit]
+        logger.warning(f"[Tokens] {what} trimmed from ~{self.estimate(text):,} to ~{self.estimate(trimmed):,} tokens")
+        return trimmed
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """Splits text into consecutive pieces of at most `max_tokens`, breaking between words."""
+        limit = max(1, int(max_tokens * self.chars_per_token))
+        pieces, start = [], 0
+        while start < len(text):
+            end = min(len(text), start + limit)
+            if end < len(text):
+                space = text.rfind(" ", start, end)
+                if space > start:
+                    end = space
+            pieces.append(text[start:end])
+            start = end
+        return pieces
+
+    def stats(self) -> dict:
+        return {
+            "chars_per_token": round(self.chars_per_token, 3),
+            "oversize_strategy": OVERSIZE_STRATEGY,
+            "trimmed": self.trimmed,
+            "rejected": self.rejected,
+            "usage": self.counters,
+        }
+
+
+token_estimator = TokenEstimator()
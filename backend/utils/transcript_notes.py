@@ -0,0 +1,270 @@
+import os
+import re
+import time
+import asyncio
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from utils.scheduler import Priority
+from utils.retry import RETRY_POLICIES
+from utils.tokens import token_estimator, PromptTooLargeError
+from utils.notes_pipeline import NOTES_CHUNK_TOKENS, NOTES_MAX_CHUNKS, SectionedPipeline
+from utils.transcripts import Transcript, format_timestamp, parse_timestamp, video_url
+
+# Length of the time windows a long transcript is summarized in
+YOUTUBE_WINDOW_SECONDS = float(os.getenv("YOUTUBE_WINDOW_SECONDS", "600"))
+# Videos at least this long (or too many tokens for one chunk) are summarized window by window
+YOUTUBE_WINDOWED_MIN_SECONDS = float(os.getenv("YOUTUBE_WINDOWED_MIN_SECONDS", "1200"))
+# Window summaries generated at the same time for one video
+YOUTUBE_WINDOW_CONCURRENCY = int(os.getenv("YOUTUBE_WINDOW_CONCURRENCY", "4"))
+# Transcript entries are grouped into lines of about this many seconds, each prefixed with its
+# timestamp, so window notes can say where in the video a topic starts
+TRANSCRIPT_LINE_SECONDS = 30
+# Timestamps linked back into the video per set of notes
+NOTE_LINKS_MAX = 200
+
+_NOTE_TIMESTAMP = re.compile(r"(?<![\d:])(\d{1,2}:\d{2}(?::\d{2})?)(?![\d:])")
+
+
+@dataclass
+class TranscriptWindow:
+    index: int
+    start: float
+    end: float
+    text: str
+
+    @property
+    def label(self) -> str:
+        return f"{format_timestamp(self.start)}-{format_timestamp(self.end)}"
+
+
+def window_transcript(transcript: Transcript, window_seconds: Optional[float] = None,
+                      max_tokens: Optional[int] = None) -> List[TranscriptWindow]:
+    """
+    Cuts a transcript into consecutive windows of about `window_seconds`, breaking between
+    entries. A window also ends early once it reaches `max_tokens`, so fast speech never
+    produces an oversized prompt. Window text is one line per TRANSCRIPT_LINE_SECONDS, each
+    prefixed with its [m:ss] timestamp.
+    """
+    window_seconds = window_seconds or YOUTUBE_WINDOW_SECONDS
+    max_tokens = max_tokens or NOTES_CHUNK_TOKENS
+    windows: List[TranscriptWindow] = []
+    lines, line, line_start, start, end, tokens = [], [], 0.0, 0.0, 0.0, 0
+
+    def close_line():
+        nonlocal line
+        if line:
+            lines.append(f"[{format_timestamp(line_start)}] {' '.join(line)}")
+        line = []
+
+    def close_window():
+        nonlocal lines, tokens
+        close_line()
+        if lines:
+            windows.append(TranscriptWindow(len(windows), start, end, "\n".join(lines)))
+        lines, tokens = [], 0
+
+    for i, entry_start in enumerate(transcript.starts):
+        text = transcript.entry_text(i)
+        entry_tokens = token_estimator.estimate(text) + 1
+        if (lines or line) and (entry_start >= start + window_seconds or tokens + entry_tokens > max_tokens):
+            close_window()
+        if not lines and not line:
+            start = entry_start
+        if line and entry_start >= line_start + TRANSCRIPT_LINE_SECONDS:
+            close_line()
+        if not line:
+            line_start = entry_start
+        line.append(text)
+        tokens += entry_tokens
+        end = entry_start + transcript.durations[i]
+    close_window()
+    return windows
+
+
+def needs_windows(transcript: Transcript) -> bool:
+    return (transcript.duration >= YOUTUBE_WINDOWED_MIN_SECONDS
+            or token_estimator.estimate(transcript.text) > NOTES_CHUNK_TOKENS)
+
+
+def build_window_notes_prompt(window: TranscriptWindow, total: int) -> str:
+    return f"""
+    The following is part {window.index + 1} of {total} ({window.label}) of a YouTube video transcript.
+    Each line starts with the time in the video it was said, in [m:ss] or [h:mm:ss] form.
+    Create revision notes for this part only.
+
+    Requirements:
+    - Start with one line giving a short title for this part in CAPITAL LETTERS, and nothing else on it
+    - Use clear headings with numbers (1., 2., 3.) instead of ##
+    - Put the time a topic starts after its heading, e.g. "1. TOPIC NAME (12:30)"
+    - Use bullet points (- or •) for key points
+    - Use CAPITAL LETTERS for important terms instead of **bold**
+    - Keep every definition, formula, date and example that matters
+    - Do not write an introduction or a summary section; they are added when the parts are merged
+    - Avoid markdown symbols like #, *, **, etc.
+
+    Transcript:
+    {window.text}
+    """
+
+
+def build_video_summary_prompt(sections: str) -> str:
+    return f"""
+    The following are revision notes for consecutive parts of one YouTube video, in order,
+    each headed with its time range in the video.
+    Write only the final summary section of the notes.
+
+    Requirements:
+    - Start with the heading SUMMARY on its own line
+    - Use bullet points (- or •) for the main takeaways and key points to remember
+    - Mention the time range a point comes from where it helps, e.g. "(see 12:30)"
+    - Avoid markdown symbols like #, *, **, etc.
+
+    Notes:
+    {sections}
+    """
+
+
+def timestamp_links(notes: str, transcript: Transcript, video_id: str) -> List[dict]:
+    """
+    Deep links for the timestamps cited in generated notes, e.g. "(12:30)": each is snapped to
+    the start of the transcript entry playing at that time, with the text said there.
+    Timestamps past the end of the video are left out.
+    """
+    links, seen = [], set()
+    for match in _NOTE_TIMESTAMP.finditer(notes):
+        timestamp = match.group(1)
+        if timestamp in seen:
+            continue
+        seen.add(timestamp)
+        seconds = parse_timestamp(timestamp)
+        if not len(transcript) or seconds > transcript.duration:
+            continue
+        i = transcript.index_at(seconds)
+        links.append({"timestamp": timestamp, "start": transcript.starts[i], "url": video_url(video_id, transcript.starts[i]),
+                      "text": transcript.entry_text(i)})
+        if len(links) >= NOTE_LINKS_MAX:
+            break
+    return links
+
+
+class TranscriptNotesStats:
+    def __init__(self):
+        self.videos = 0
+        self.windows = 0
+        self.video_seconds = 0.0
+        self.map_seconds = 0.0
+        self.last: dict = {}
+
+    def record(self, windows: List[TranscriptWindow], elapsed: float):
+        self.videos += 1
+        self.windows += len(windows)
+        self.video_seconds += windows[-1].end if windows else 0.0
+        self.map_seconds += elapsed
+        self.last = {"windows": len(windows), "video_seconds": round(windows[-1].end if windows else 0.0, 1),
+                     "map_seconds": round(elapsed, 3)}
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": YOUTUBE_WINDOW_SECONDS,
+            "concurrency": YOUTUBE_WINDOW_CONCURRENCY,
+            "videos": self.videos,
+            "windows": self.windows,
+            "video_seconds": round(self.video_seconds, 1),
+            "avg_map_seconds": round(self.map_seconds / self.videos, 3) if self.videos else 0.0,
+            "last_video": self.last,
+        }
+
+
+transcript_notes_stats = TranscriptNotesStats()
+
+
+class TranscriptNotesPipeline(SectionedPipeline):
+    """
+    Notes for long videos: the transcript is cut into YOUTUBE_WINDOW_SECONDS windows, which are
+    summarized concurrently (at most YOUTUBE_WINDOW_CONCURRENCY at a time). The window notes are
+    joined in time order under headings carrying their time range, and one last call adds the
+    summary section. Unlike document sections, window notes are not rewritten by a merge call,
+    so the timestamps in them survive as generated.
+
+    `on_progress` receives a "map" event for every window, including its notes once they are
+    done, so callers can show each part as soon as it is ready.
+    """
+
+    log_tag = "TranscriptNotes"
+    retry_policy = "youtube"
+
+    def __init__(self, ai_client, use_cache: bool = True, priority: Priority = Priority.BULK,
+                 on_progress: Optional[Callable[[dict], None]] = None):
+        super().__init__(ai_client, use_cache, priority, on_progress, YOUTUBE_WINDOW_CONCURRENCY)
+        self.windows: List[TranscriptWindow] = []
+        self.window_notes: List[str] = []
+
+    async def _summarize_window(self, window: TranscriptWindow, total: int) -> str:
+        position = {"chunk": window.index + 1, "chunks": total, "start": window.start, "end": window.end,
+                    "label": window.label}
+        notes = (await self._generate_section(build_window_notes_prompt(window, total), position)).strip()
+        self._report(stage="map", status="done", **position, notes=notes)
+        return notes
+
+    async def _map(self, transcript: Transcript):
+        self.windows = window_transcript(transcript)
+        if len(self.windows) > NOTES_MAX_CHUNKS:
+            raise PromptTooLargeError(
+                f"The video is too long to process ({len(self.windows)} parts, limit {NOTES_MAX_CHUNKS})."
+            )
+        self._report(stage="map", status="started", chunks=len(self.windows))
+        started = time.perf_counter()
+        self.window_notes = list(await asyncio.gather(
+            *(self._summarize_window(window, len(self.windows)) for window in self.windows)
+        ))
+        transcript_notes_stats.record(self.windows, time.perf_counter() - started)
+
+    def sections(self) -> List[dict]:
+        """Title and time range of every window, in order."""
+        return [
+            {"part": window.index + 1, "start": window.start, "end": window.end, "label": window.label,
+             "title": next((line.strip() for line in notes.splitlines() if line.strip()), "")}
+            for window, notes in zip(self.windows, self.window_notes)
+        ]
+
+    def merged_sections(self) -> str:
+        parts = []
+        for section, notes in zip(self.sections(), self.window_notes):
+            body = notes.split("\n", 1)[1].strip() if "\n" in notes else ""
+            parts.append(f"PART {section['part']} ({section['label']}): {section['title']}\n{body}".strip())
+        return "\n\n".join(parts)
+
+    def _summary_prompt(self, sections: str) -> str:
+        reserve = token_estimator.estimate(build_video_summary_prompt(""))
+        return build_video_summary_prompt(self.ai_client.fit_to_budget(sections, reserve, what="The video notes"))
+
+    async def generate(self, transcript: Transcript) -> str:
+        await self._map(transcript)
+        sections = self.merged_sections()
+        self._report(stage="final", status="started", parts=len(self.windows))
+        summary = await self._generate(self._summary_prompt(sections))
+        self._report(stage="final", status="done")
+        return f"{sections}\n\n{summary.strip()}"
+
+    async def stream(self, transcript: Transcript):
+        """
+        Yields progress dicts while windows are summarized, each window's notes included as it
+        finishes (in completion order), then the merged notes as text: the time-ordered
+        sections in one piece, followed by the summary as it is generated.
+        """
+        task = asyncio.ensure_future(self._map(transcript))
+        async with aclosing(self._relay(task)) as events:
+            async for event in events:
+                yield event
+        task.result()
+
+        sections = self.merged_sections()
+        yield self._report(stage="final", status="started", parts=len(self.windows))
+        yield f"{sections}\n\n"
+        async for text in self.ai_client._stream_with_fallback(
+            self._summary_prompt(sections), use_cache=self.use_cache, priority=self.priority,
+            retry_policy=RETRY_POLICIES["youtube"],
+        ):
+            yield text
@@ -0,0 +1,420 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+
+from utils.singleflight import SingleFlight
+from utils.db_size import track_sizes, stored_bytes
+from utils.youtube_fetcher import youtube_fetcher
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSCRIPT_CACHE_DB_PATH = os.getenv("TRANSCRIPT_CACHE_DB_PATH", os.path.join("data", "transcripts.sqlite3"))
+TRANSCRIPT_CACHE_TTL_SECONDS = float(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Videos without captions are remembered for a shorter time; the owner may still add them
+TRANSCRIPT_NEGATIVE_TTL_SECONDS = float(os.getenv("TRANSCRIPT_NEGATIVE_TTL_SECONDS", str(6 * 3600)))
+TRANSCRIPT_CACHE_MAX_DB_BYTES = int(float(os.getenv("TRANSCRIPT_CACHE_MAX_DB_MB", "128")) * 1024 * 1024)
+TRANSCRIPT_FETCH_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIPT_FETCH_TIMEOUT_SECONDS", "20"))
+TRANSCRIPT_DEFAULT_LANGUAGE = os.getenv("TRANSCRIPT_DEFAULT_LANGUAGE", "en")
+# "async" fetches over the pooled httpx client (utils/youtube_fetcher.py); "library" runs
+# youtube-transcript-api in a worker thread
+TRANSCRIPT_FETCHER = os.getenv("TRANSCRIPT_FETCHER", "async").lower()
+# Recently used transcripts kept in memory with their phrase index, for timestamp and phrase lookups
+TRANSCRIPT_MEMORY_ITEMS = int(os.getenv("TRANSCRIPT_MEMORY_ITEMS", "32"))
+# Bump when the on-disk layout of cached transcripts changes; older caches are dropped
+TRANSCRIPT_SCHEMA_VERSION = 2
+
+_WORD = re.compile(r"\w+")
+
+OK, DISABLED, NOT_FOUND = "ok", "disabled", "not_found"
+
+
+class TranscriptUnavailable(Exception):
+    """The video has no transcript: captions are disabled (`reason` "disabled") or none exist in the language ("not_found")."""
+
+    def __init__(self, video_id: str, reason: str):
+        super().__init__(f"No transcript for video {video_id} ({reason})")
+        self.video_id = video_id
+        self.reason = reason
+
+
+class TranscriptTimeout(Exception):
+    """Raised when fetching a transcript takes longer than TRANSCRIPT_FETCH_TIMEOUT_SECONDS."""
+
+
+def fetch_transcript_entries(video_id: str, language: str) -> List[dict]:
+    """
+    Blocking fetch of a transcript as [{"text", "start", "duration"}, ...]. Works with both the
+    static API of youtube-transcript-api before 1.0 and the instance API of 1.x.
+    """
+    if hasattr(YouTubeTranscriptApi, "get_transcript"):
+        return YouTubeTranscriptApi.get_transcript(video_id, languages=[language])
+    return YouTubeTranscriptApi().fetch(video_id, languages=[language]).to_raw_data()
+
+
+def format_timestamp(seconds: float) -> str:
+    """12:05 or 1:02:05."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def parse_timestamp(value: str) -> float:
+    """Seconds from "2530", "42:10" or "1:02:05"; raises ValueError otherwise."""
+    parts = value.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(parts):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    return seconds
+
+
+def video_url(video_id: str, seconds: float = 0) -> str:
+    """Deep link that opens the video at `seconds`."""
+    if seconds >= 1:
+        return f"https://www.youtube.com/watch?v={video_id}&t={int(seconds)}s"
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+class Transcript:
+    """
+    A transcript stored column-wise: all entry texts in one string, joined by single spaces,
+    plus array-backed `starts`, `durations` and `offsets` (where each entry's text begins in
+    `text`). Entries are in time order, so the entry playing at a given second is a bisect on
+    `starts`, and the entry containing a character is a bisect on `offsets`. An inverted index
+    of words to entries is built on first search and kept with the transcript.
+    """
+
+    def __init__(self, text: str = "", starts: array = None, durations: array = None, offsets: array = None):
+        self.text = text
+        self.starts = starts if starts is not None else array("d")
+        self.durations = durations if durations is not None else array("d")
+        self.offsets = offsets if offsets is not None else array("I")
+        self._index: Optional[Dict[str, array]] = None
+
+    @classmethod
+    def from_entries(cls, entries: List[dict]) -> "Transcript":
+        """Builds a transcript from [{"text", "start", "duration"}, ...]; whitespace in texts is collapsed."""
+        parts, starts, durations, offsets = [], array("d"), array("d"), array("I")
+        position = 0
+        for entry in sorted(entries, key=lambda e: e["start"]):
+            text = " ".join(str(entry["text"]).split())
+            if not text:
+                continue
+            starts.append(float(entry["start"]))
+            durations.append(float(entry.get("duration", 0.0)))
+            offsets.append(position)
+            parts.append(text)
+            position += len(text) + 1
+        return cls(" ".join(parts), starts, durations, offsets)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def duration(self) -> float:
+        return self.starts[-1] + self.durations[-1] if self.starts else 0.0
+
+    def entry_text(self, i: int) -> str:
+        end = self.offsets[i + 1] - 1 if i + 1 < len(self.offsets) else len(self.text)
+        return self.text[self.offsets[i]:end]
+
+    def entry(self, i: int) -> dict:
+        return {"text": self.entry_text(i), "start": self.starts[i], "duration": self.durations[i]}
+
+    def entries(self) -> List[dict]:
+        return [self.entry(i) for i in range(len(self))]
+
+    def index_at(self, seconds: float) -> int:
+        """Index of the entry that started last at or before `seconds` (the first entry before it starts)."""
+        return max(0, bisect_right(self.starts, seconds) - 1)
+
+    def index_of_offset(self, offset: int) -> int:
+        return max(0, bisect_right(self.offsets, offset) - 1)
+
+    def text_between(self, start: float, end: float) -> str:
+        """Text of the entries starting in [start, end)."""
+        first, last = bisect_left(self.starts, start), bisect_left(self.starts, end)
+        if first >= last:
+            return ""
+        stop = self.offsets[last] - 1 if last < len(self.offsets) else len(self.text)
+        return self.text[self.offsets[first]:stop]
+
+    def at(self, seconds: float, context: float = 15.0) -> dict:
+        """What was said at `seconds`: the entry playing then, with `context` seconds of text either side."""
+        if not self.starts:
+            return {}
+        i = self.index_at(seconds)
+        start = self.starts[i]
+        return {
+            "start": start,
+            "timestamp": format_timestamp(start),
+            "text": self.entry_text(i),
+            "context": self.text_between(max(0.0, seconds - context), seconds + context) or self.entry_text(i),
+        }
+
+    def _build_index(self) -> Dict[str, array]:
+        index: Dict[str, array] = {}
+        for i in range(len(self)):
+            for word in set(_WORD.findall(self.entry_text(i).lower())):
+                index.setdefault(word, array("I")).append(i)
+        return index
+
+    def search(self, phrase: str, limit: int = 20) -> List[dict]:
+        """
+        Where `phrase` is said, in time order. Candidate entries come from the word index (the
+        rarest word of the phrase), and only the text around them is matched, so a phrase
+        spanning two entries is still found without scanning the whole transcript.
+        """
+        words = _WORD.findall(phrase.lower())
+        if not words or not self.starts:
+            return []
+        if self._index is None:
+            self._index = self._build_index()
+        postings = [self._index.get(word) for word in words]
+        if not all(postings):
+            return []
+        candidates = min(postings, key=len)
+        pattern = re.compile(r"\b" + r"\W+".join(map(re.escape, words)) + r"\b", re.IGNORECASE)
+        # A phrase of n words can start up to n - 1 entries before the entry holding any one of them
+        reach = len(words) - 1
+        matches, seen = [], set()
+        for i in candidates:
+            first = max(0, i - reach)
+            last = min(len(self) - 1, i + reach)
+            stop = self.offsets[last + 1] - 1 if last + 1 < len(self) else len(self.text)
+            for match in pattern.finditer(self.text, self.offsets[first], stop):
+                if match.start() in seen:
+                    continue
+                seen.add(match.start())
+                entry = self.index_of_offset(match.start())
+                matches.append({"start": self.starts[entry], "timestamp": format_timestamp(self.starts[entry]),
+                                "text": self.entry_text(entry)})
+            if len(matches) >= limit:
+                break
+        matches.sort(key=lambda m: m["start"])
+        return matches[:limit]
+
+
+class TranscriptStore:
+    """
+    Fetches YouTube transcripts with a timeout, natively async over the pooled httpx client or
+    (TRANSCRIPT_FETCHER=library) in a worker thread, so the network round trip never blocks
+    the event loop. Results are kept in SQLite, keyed by video ID and language,
+    for TRANSCRIPT_CACHE_TTL_SECONDS. Videos whose captions are disabled or missing are cached
+    as well (for TRANSCRIPT_NEGATIVE_TTL_SECONDS), so repeated requests for them fail fast.
+    Concurrent requests for the same video share one fetch, and the TRANSCRIPT_MEMORY_ITEMS
+    most recently used transcripts stay in memory, phrase index included.
+    """
+
+    def __init__(self, db_path: str = TRANSCRIPT_CACHE_DB_PATH, ttl: float = TRANSCRIPT_CACHE_TTL_SECONDS,
+                 negative_ttl: float = TRANSCRIPT_NEGATIVE_TTL_SECONDS, max_db_bytes: int = TRANSCRIPT_CACHE_MAX_DB_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_db_bytes = max_db_bytes
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._memory: "OrderedDict[str, Transcript]" = OrderedDict()
+        self.counters = {"hits": 0, "memory_hits": 0, "negative_hits": 0, "misses": 0, "fetches": 0, "timeouts": 0, "errors": 0, "evictions": 0}
+        self._fetch_seconds = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != TRANSCRIPT_SCHEMA_VERSION:
+                self._db.execute("DROP TABLE IF EXISTS transcripts")
+                self._db.execute(f"PRAGMA user_version = {TRANSCRIPT_SCHEMA_VERSION}")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS transcripts (
+                    video_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    starts BLOB NOT NULL,
+                    durations BLOB NOT NULL,
+                    offsets BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (video_id, language)
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS transcripts_created_at ON transcripts(created_at)")
+            track_sizes(self._db, ("transcripts",))
+            self._db.commit()
+        return self._db
+
+    def _get(self, video_id: str, language: str) -> Optional[tuple]:
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT status, text, starts, durations, offsets, created_at FROM transcripts "
+                "WHERE video_id = ? AND language = ?",
+                (video_id, language),
+            ).fetchone()
+            if row is None:
+                return None
+            status, text, starts, durations, offsets, created_at = row
+            now = time.time()
+            if now - created_at > (self.ttl if status == OK else self.negative_ttl):
+                db.execute("DELETE FROM transcripts WHERE video_id = ? AND language = ?", (video_id, language))
+                db.commit()
+                return None
+            db.execute("UPDATE transcripts SET last_access = ? WHERE video_id = ? AND language = ?", (now, video_id, language))
+            db.commit()
+            transcript = Transcript(text, array("d", starts), array("d", durations), array("I", offsets))
+            return status, transcript
+
+    def _put(self, video_id: str, language: str, status: str, transcript: Transcript):
+        columns = (transcript.starts.tobytes(), transcript.durations.tobytes(), transcript.offsets.tobytes())
+        size = len(transcript.text.encode("utf-8")) + sum(len(column) for column in columns)
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(video_id, language, status, text, starts, durations, offsets, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, language, status, transcript.text, *columns, size, now, now),
+            )
+            self._evict_locked(db)
+            db.commit()
+
+    def _evict_locked(self, db: sqlite3.Connection):
+        now = time.time()
+        self.counters["evictions"] += max(db.execute(
+            "DELETE FROM transcripts WHERE (status = ? AND created_at < ?) OR (status != ? AND created_at < ?)",
+            (OK, now - self.ttl, OK, now - self.negative_ttl),
+        ).rowcount, 0)
+        total = stored_bytes(db, ("transcripts",))
+        if total <= self.max_db_bytes:
+            return
+        for rowid, size in db.execute("SELECT rowid, size FROM transcripts ORDER BY last_access ASC").fetchall():
+            if total <= self.max_db_bytes:
+                break
+            db.execute("DELETE FROM transcripts WHERE rowid = ?", (rowid,))
+            total -= size
+            self.counters["evictions"] += 1
+
+    def _remember(self, key: str, transcript: Transcript):
+        self._memory[key] = transcript
+        self._memory.move_to_end(key)
+        while len(self._memory) > TRANSCRIPT_MEMORY_ITEMS:
+            self._memory.popitem(last=False)
+
+    async def _store(self, video_id: str, language: str, status: str, transcript: Transcript):
+        if not TRANSCRIPT_CACHE_ENABLED:
+            return
+        try:
+            await asyncio.to_thread(self._put, video_id, language, status, transcript)
+        except sqlite3.Error as e:
+            logger.error(f"[Transcripts] Failed to cache transcript of {video_id}: {e}")
+
+    async def _fetch(self, video_id: str, language: str) -> Transcript:
+        self.counters["fetches"] += 1
+        started = time.perf_counter()
+        try:
+            if TRANSCRIPT_FETCHER == "library":
+                # The worker thread cannot be interrupted; on timeout it finishes in the background
+                fetch = asyncio.to_thread(fetch_transcript_entries, video_id, language)
+            else:
+                fetch = youtube_fetcher.get_transcript(video_id, [language])
+            entries = await asyncio.wait_for(fetch, TRANSCRIPT_FETCH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise TranscriptTimeout(
+                f"Fetching the transcript took longer than {TRANSCRIPT_FETCH_TIMEOUT_SECONDS:g}s. Please try again."
+            )
+        except TranscriptsDisabled:
+            await self._store(video_id, language, DISABLED, Transcript())
+            raise TranscriptUnavailable(video_id, DISABLED)
+        except NoTranscriptFound:
+            await self._store(video_id, language, NOT_FOUND, Transcript())
+            raise TranscriptUnavailable(video_id, NOT_FOUND)
+        except Exception:
+            # Network and parsing errors are not cached
+            self.counters["errors"] += 1
+            raise
+        finally:
+            self._fetch_seconds += time.perf_counter() - started
+        transcript = await asyncio.to_thread(Transcript.from_entries, entries)
+        await self._store(video_id, language, OK, transcript)
+        logger.info(f"[Transcripts] Fetched {video_id} ({language}): {len(transcript)} entries in {time.perf_counter() - started:.2f}s")
+        return transcript
+
+    # --- public API ---
+
+    async def get_transcript(self, video_id: str, language: Optional[str] = None) -> Transcript:
+        """
+        Transcript of a video. Raises TranscriptUnavailable (cached too) or TranscriptTimeout;
+        other fetch errors propagate unchanged.
+        """
+        language = language or TRANSCRIPT_DEFAULT_LANGUAGE
+        key = f"{video_id}:{language}"
+        if TRANSCRIPT_CACHE_ENABLED and key in self._memory:
+            self._memory.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["memory_hits"] += 1
+            return self._memory[key]
+        if TRANSCRIPT_CACHE_ENABLED:
+            try:
+                cached = await asyncio.to_thread(self._get, video_id, language)
+            except sqlite3.Error as e:
+                logger.error(f"[Transcripts] Cache lookup failed: {e}")
+                cached = None
+            if cached is not None:
+                status, transcript = cached
+                if status != OK:
+                    self.counters["negative_hits"] += 1
+                    raise TranscriptUnavailable(video_id, status)
+                self.counters["hits"] += 1
+                self._remember(key, transcript)
+                return transcript
+        self.counters["misses"] += 1
+        transcript = await self._flights.do(key, lambda: self._fetch(video_id, language))
+        if TRANSCRIPT_CACHE_ENABLED:
+            self._remember(key, transcript)
+        return transcript
+
+    def stats(self) -> dict:
+        fetches = self.counters["fetches"]
+        return {
+            "enabled": TRANSCRIPT_CACHE_ENABLED,
+            "fetcher": TRANSCRIPT_FETCHER,
+            **self.counters,
+            "avg_fetch_seconds": round(self._fetch_seconds / fetches, 3) if fetches else 0.0,
+            "coalesced": self._flights.counters["coalesced"],
+            "in_memory": len(self._memory),
+            "async_fetcher": youtube_fetcher.stats(),
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+transcript_store = TranscriptStore()
@@ -0,0 +1,177 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from utils.extraction_pool import current_rss_mb, peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_FILE_BYTES = int(float(os.getenv("UPLOAD_MAX_FILE_MB", "50")) * 1024 * 1024)
+UPLOAD_MAX_REQUEST_BYTES = int(float(os.getenv("UPLOAD_MAX_REQUEST_MB", "100")) * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Where uploads are spooled while they are extracted (default: the system temp directory)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the per-file or per-request size limit."""
+
+
+def _too_large(limit: int, what: str = "File") -> UploadTooLargeError:
+    return UploadTooLargeError(f"{what} is too large. The limit is {limit / 1024 / 1024:g} MB.")
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies above UPLOAD_MAX_REQUEST_MB with 413. The Content-Length header
+    is checked before anything is read; bodies without one are counted as they stream in,
+    so an oversized upload is cut off instead of being parsed and spooled completely.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            upload_stats.rejected += 1
+            return await self._reject(send)
+
+        received = 0
+        exceeded = False
+        responded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _too_large(self.max_bytes, "Request")
+            return message
+
+        async def limited_send(message):
+            nonlocal responded
+            # FastAPI reports any error raised while parsing the body as a generic 400;
+            # once the limit has tripped, answer with our own 413 instead
+            if not exceeded:
+                await send(message)
+            elif message["type"] == "http.response.start" and not responded:
+                responded = True
+                await self._reject(send)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLargeError:
+            if not responded:
+                responded = True
+                await self._reject(send)
+        finally:
+            if exceeded:
+                upload_stats.rejected += 1
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": str(_too_large(self.max_bytes, "Request"))}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+async def save_upload(upload, path: str, max_bytes: int = UPLOAD_MAX_FILE_BYTES) -> SpooledUpload:
+    """
+    Copies an UploadFile to `path` in UPLOAD_CHUNK_BYTES chunks, fingerprinting it with
+    SHA-256 on the way. Raises UploadTooLargeError once more than `max_bytes` have been read;
+    the partial file is left for the caller to delete.
+    """
+    if (getattr(upload, "size", None) or 0) > max_bytes:
+        upload_stats.rejected += 1
+        raise _too_large(max_bytes)
+
+    size = 0
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                upload_stats.rejected += 1
+                raise _too_large(max_bytes)
+            digest.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    return SpooledUpload(path, size, digest.hexdigest())
+
+
+@asynccontextmanager
+async def spool_upload(upload, max_bytes: int = UPLOAD_MAX_FILE_BYTES):
+    """
+    Saves an UploadFile to a temporary file and yields it as a SpooledUpload, so extractors
+    can memory-map it instead of holding the bytes. The file is deleted on exit.
+    """
+    suffix = os.path.splitext(upload.filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=UPLOAD_SPOOL_DIR) as tmp:
+        pass
+    try:
+        yield await save_upload(upload, tmp.name, max_bytes)
+    finally:
+        os.unlink(tmp.name)
+
+
+class UploadStats:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.max_file_bytes = 0
+        self.last_peak_rss_mb = 0.0
+        self.max_peak_rss_mb = 0.0
+
+    def record(self, filename: str, size: int, worker_peak_rss_mb: float):
+        self.accepted += 1
+        self.bytes += size
+        self.max_file_bytes = max(self.max_file_bytes, size)
+        self.last_peak_rss_mb = worker_peak_rss_mb
+        self.max_peak_rss_mb = max(self.max_peak_rss_mb, worker_peak_rss_mb)
+        logger.info(
+            f"[Uploads] {filename}: {size / 1024 / 1024:.1f} MB, extraction peak RSS {worker_peak_rss_mb:.0f} MB "
+            f"(server RSS {current_rss_mb():.0f} MB)"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_file_mb": round(UPLOAD_MAX_FILE_BYTES / 1024 / 1024, 1),
+            "max_request_mb": round(UPLOAD_MAX_REQUEST_BYTES / 1024 / 1024, 1),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "total_mb": round(self.bytes / 1024 / 1024, 1),
+            "largest_file_mb": round(self.max_file_bytes / 1024 / 1024, 1),
+            "last_extraction_peak_rss_mb": round(self.last_peak_rss_mb, 1),
+            "max_extraction_peak_rss_mb": round(self.max_peak_rss_mb, 1),
+            "server_rss_mb": round(current_rss_mb(), 1),
+            "server_peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+upload_stats = UploadStats()
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import httpx
+
+from utils import http_pool
+from utils.hedging import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Videos of all YouTube batches whose transcripts are fetched at the same time
+YOUTUBE_BATCH_FETCH_CONCURRENCY = int(os.getenv("YOUTUBE_BATCH_FETCH_CONCURRENCY", "8"))
+# Videos of all YouTube batches whose notes are generated at the same time; every Gemini call
+# still goes through the shared scheduler and its rate limits
+YOUTUBE_BATCH_CONCURRENCY = int(os.getenv("YOUTUBE_BATCH_CONCURRENCY", "3"))
+YOUTUBE_BATCH_MAX_VIDEOS = int(os.getenv("YOUTUBE_BATCH_MAX_VIDEOS", "100"))
+# How long a batch and its finished videos are kept for resuming
+YOUTUBE_BATCH_TTL_SECONDS = float(os.getenv("YOUTUBE_BATCH_TTL_SECONDS", str(7 * 24 * 3600)))
+YOUTUBE_BATCH_DB_PATH = os.getenv("YOUTUBE_BATCH_DB_PATH", os.path.join("data", "video_batches.sqlite3"))
+YOUTUBE_BATCH_SWEEP_INTERVAL_SECONDS = float(os.getenv("YOUTUBE_BATCH_SWEEP_INTERVAL_SECONDS", "300"))
+# Playlists are listed with the YouTube Data API; without a key only video lists are accepted
+YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY", "")
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3").rstrip("/")
+YOUTUBE_API_TIMEOUT_SECONDS = float(os.getenv("YOUTUBE_API_TIMEOUT_SECONDS", "15"))
+
+
+class PlaylistError(Exception):
+    """Raised when a playlist cannot be listed; `status_code` is the status to return for it."""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def playlist_video_ids(playlist_id: str, max_videos: int = YOUTUBE_BATCH_MAX_VIDEOS) -> List[str]:
+    """IDs of the videos in a playlist, in playlist order, at most `max_videos` of them."""
+    if not YOUTUBE_API_KEY:
+        raise PlaylistError("Playlists need YOUTUBE_API_KEY to be configured. Please send the video URLs instead.", 400)
+    client = http_pool.get_client("youtube_api", timeout=YOUTUBE_API_TIMEOUT_SECONDS)
+    video_ids: List[str] = []
+    page_token = None
+    while len(video_ids) < max_videos:
+        params = {"part": "contentDetails", "playlistId": playlist_id, "maxResults": 50, "key": YOUTUBE_API_KEY}
+        if page_token:
+            params["pageToken"] = page_token
+        try:
+            response = await client.get(f"{YOUTUBE_API_BASE_URL}/playlistItems", params=params)
+        except httpx.HTTPError as e:
+            raise PlaylistError(f"Could not list the playlist: {e}")
+        if response.status_code == 404:
+            raise PlaylistError("Playlist not found. It may be private or deleted.", 404)
+        if response.status_code >= 400:
+            logger.error(f"[VideoBatch] Listing playlist {playlist_id} failed: {response.status_code} {response.text[:200]}")
+            raise PlaylistError(f"Could not list the playlist (YouTube API returned {response.status_code}).")
+        body = response.json()
+        video_ids.extend(item["contentDetails"]["videoId"] for item in body.get("items", []))
+        page_token = body.get("nextPageToken")
+        if not page_token:
+            break
+    return video_ids[:max_videos]
+
+
+class VideoBatchStore:
+    """
+    Keeps every YouTube batch and the result of each finished video in SQLite, so a batch
+    that was cut short (client disconnect, restart, failed videos) can be resumed by its ID:
+    finished videos are replayed from here and only the rest are processed again. Batches are
+    deleted YOUTUBE_BATCH_TTL_SECONDS after they were last used.
+    """
+
+    def __init__(self, db_path: str = YOUTUBE_BATCH_DB_PATH, ttl: float = YOUTUBE_BATCH_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.counters = {"batches": 0, "resumed": 0, "videos": 0, "succeeded": 0, "failed": 0, "replayed": 0,
+                         "rejected": 0}
+        self.last_batch: dict = {}
+        self.latency = LatencyTracker()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    videos TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS batch_videos (
+                    batch_id TEXT NOT NULL,
+                    video_id TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    finished_at REAL NOT NULL,
+                    PRIMARY KEY (batch_id, video_id)
+                )"""
+            )
+            self._db.commit()
+        return self._db
+
+    def _create(self, batch_id: str, video_ids: List[str], options: dict):
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO batches (batch_id, videos, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (batch_id, json.dumps(video_ids), json.dumps(options), now, now),
+            )
+            db.commit()
+
+    def _load(self, batch_id: str) -> Optional[dict]:
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute("SELECT videos, options, updated_at FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is None or time.time() - row[2] > self.ttl:
+                return None
+            finished = {
+                video_id: json.loads(result)
+                for video_id, result in db.execute(
+                    "SELECT video_id, result FROM batch_videos WHERE batch_id = ?", (batch_id,)
+                )
+            }
+            db.execute("UPDATE batches SET updated_at = ? WHERE batch_id = ?", (time.time(), batch_id))
+            db.commit()
+        return {"batch_id": batch_id, "video_ids": json.loads(row[0]), "options": json.loads(row[1]), "finished": finished}
+
+    def _finish_video(self, batch_id: str, video_id: str, result: dict):
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO batch_videos (batch_id, video_id, result, finished_at) VALUES (?, ?, ?, ?)",
+                (batch_id, video_id, json.dumps(result), now),
+            )
+            db.execute("UPDATE batches SET updated_at = ? WHERE batch_id = ?", (now, batch_id))
+            db.commit()
+
+    def _sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._db_lock:
+            db = self._connect()
+            expired = [row[0] for row in db.execute("SELECT batch_id FROM batches WHERE updated_at < ?", (cutoff,))]
+            for batch_id in expired:
+                db.execute("DELETE FROM batch_videos WHERE batch_id = ?", (batch_id,))
+                db.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+            db.commit()
+        if expired:
+            logger.info(f"[VideoBatch] Removed {len(expired)} expired batch(es)")
+        return len(expired)
+
+    # --- public API ---
+
+    async def create(self, video_ids: List[str], options: dict) -> str:
+        if time.monotonic() - self._last_sweep > YOUTUBE_BATCH_SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = time.monotonic()
+            await asyncio.to_thread(self._sweep)
+        batch_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._create, batch_id, video_ids, options)
+        self.counters["batches"] += 1
+        return batch_id
+
+    async def load(self, batch_id: str) -> Optional[dict]:
+        """The batch's video IDs, options and the stored result of every finished video, or None."""
+        return await asyncio.to_thread(self._load, batch_id)
+
+    async def finish_video(self, batch_id: str, video_id: str, result: dict):
+        try:
+            await asyncio.to_thread(self._finish_video, batch_id, video_id, result)
+        except sqlite3.Error as e:
+            logger.error(f"[VideoBatch] Failed to store the result of {video_id} in batch {batch_id}: {e}")
+
+    def record_video(self, ok: bool, seconds: float):
+        self.counters["videos"] += 1
+        if ok:
+            self.counters["succeeded"] += 1
+            self.latency.record("video", seconds)
+        else:
+            self.counters["failed"] += 1
+
+    def record_batch(self, summary: dict):
+        self.last_batch = summary
+        logger.info(
+            f"[VideoBatch] {summary['videos']} videos ({summary['replayed']} replayed, {summary['failed']} failed) "
+            f"in {summary['elapsed_seconds']}s"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "fetch_concurrency": YOUTUBE_BATCH_FETCH_CONCURRENCY,
+            "concurrency": YOUTUBE_BATCH_CONCURRENCY,
+            **self.counters,
+            "video_latency": self.latency.stats().get("video", {}),
+            "last_batch": self.last_batch,
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+video_batch_store = VideoBatchStore()
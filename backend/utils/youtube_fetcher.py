@@ -0,0 +1,179 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from html import unescape
+from typing import Iterable, List
+
+import httpx
+from defusedxml import ElementTree
+from youtube_transcript_api import (CouldNotRetrieveTranscript, TranscriptsDisabled, NoTranscriptFound, VideoUnavailable,
+                                    YouTubeRequestFailed)
+
+from utils import http_pool
+
+logger = logging.getLogger(__name__)
+
+# Point this at tools/youtube_fixture.py to run without the network
+YOUTUBE_BASE_URL = os.getenv("YOUTUBE_BASE_URL", "https://www.youtube.com").rstrip("/")
+# Transcript fetches in flight at once, across all requests
+YOUTUBE_FETCH_CONCURRENCY = int(os.getenv("YOUTUBE_FETCH_CONCURRENCY", "8"))
+YOUTUBE_MAX_CONNECTIONS = int(os.getenv("YOUTUBE_MAX_CONNECTIONS", "16"))
+YOUTUBE_HTTP_TIMEOUT_SECONDS = float(os.getenv("YOUTUBE_HTTP_TIMEOUT_SECONDS", "15"))
+# Client YouTube's player API is asked as; the same one youtube-transcript-api uses
+INNERTUBE_CONTEXT = {"client": {"clientName": "ANDROID", "clientVersion": "20.10.38"}}
+
+_API_KEY = re.compile(r'"INNERTUBE_API_KEY":\s*"([a-zA-Z0-9_-]+)"')
+_CONSENT_FORM = 'action="https://consent.youtube.com/s"'
+_CONSENT_VALUE = re.compile(r'name="v" value="(.*?)"')
+_TAGS = re.compile(r"<[^>]*>")
+
+
+class YouTubeFetchError(CouldNotRetrieveTranscript):
+    """Any other reason a transcript could not be fetched (blocked, age restricted, unplayable...)."""
+
+    def __init__(self, video_id: str, reason: str):
+        self.reason = reason
+        super().__init__(video_id)
+
+    @property
+    def cause(self) -> str:
+        return self.reason
+
+
+def parse_transcript_xml(raw: str) -> List[dict]:
+    """[{"text", "start", "duration"}, ...] from a timedtext XML document, as youtube-transcript-api parses it."""
+    return [
+        {
+            "text": _TAGS.sub("", unescape(element.text)),
+            "start": float(element.attrib["start"]),
+            "duration": float(element.attrib.get("dur", "0.0")),
+        }
+        for element in ElementTree.fromstring(raw)
+        if element.text is not None
+    ]
+
+
+def pick_caption_track(video_id: str, tracks: List[dict], languages: Iterable[str]) -> dict:
+    """
+    The caption track for the first language in `languages` that has one, preferring manually
+    created captions over generated ones for each language, like TranscriptList.find_transcript.
+    """
+    manual = {track["languageCode"]: track for track in tracks if track.get("kind", "") != "asr"}
+    generated = {track["languageCode"]: track for track in tracks if track.get("kind", "") == "asr"}
+    for language in languages:
+        for found in (manual, generated):
+            if language in found:
+                return found[language]
+    available = ", ".join(sorted(manual) + [f"{code} (generated)" for code in sorted(generated)])
+    raise NoTranscriptFound(video_id, list(languages), f"Available transcripts: {available or 'none'}")
+
+
+class AsyncTranscriptFetcher:
+    """
+    Fetches YouTube transcripts natively on asyncio, over the pooled "youtube" httpx client,
+    instead of through youtube-transcript-api's blocking requests sessions. The protocol is the
+    library's: the watch page for the Innertube API key, the player API for the caption
+    tracks, then the timedtext XML of the chosen track. It raises the library's exceptions
+    (TranscriptsDisabled, NoTranscriptFound, ...), so callers handle both paths the same way.
+
+    Connections are kept alive between fetches and at most YOUTUBE_FETCH_CONCURRENCY fetches
+    run at once.
+    """
+
+    def __init__(self, base_url: str = YOUTUBE_BASE_URL, concurrency: int = YOUTUBE_FETCH_CONCURRENCY):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.counters = {"fetches": 0, "errors": 0, "requests": 0}
+        self._fetch_seconds = 0.0
+
+    def _client(self) -> httpx.AsyncClient:
+        return http_pool.get_client("youtube", timeout=YOUTUBE_HTTP_TIMEOUT_SECONDS, max_connections=YOUTUBE_MAX_CONNECTIONS)
+
+    async def _request(self, video_id: str, method: str, url: str, **kwargs) -> httpx.Response:
+        self.counters["requests"] += 1
+        try:
+            response = await self._client().request(method, url, headers={"Accept-Language": "en-US"}, **kwargs)
+        except httpx.HTTPError as e:
+            raise YouTubeRequestFailed(video_id, e)
+        if response.status_code == 429:
+            raise YouTubeFetchError(video_id, "YouTube is rate limiting requests from this server (HTTP 429).")
+        if response.status_code >= 400:
+            raise YouTubeRequestFailed(video_id, f"HTTP {response.status_code} for {url}")
+        return response
+
+    async def _watch_html(self, video_id: str) -> str:
+        url = f"{self.base_url}/watch"
+        html = unescape((await self._request(video_id, "GET", url, params={"v": video_id})).text)
+        if _CONSENT_FORM in html:
+            # EU consent page: accept it once; the cookie stays on the shared client
+            match = _CONSENT_VALUE.search(html)
+            if match is None:
+                raise YouTubeFetchError(video_id, "Failed to accept the YouTube consent page.")
+            self._client().cookies.set("CONSENT", "YES+" + match.group(1), domain=".youtube.com")
+            html = unescape((await self._request(video_id, "GET", url, params={"v": video_id})).text)
+            if _CONSENT_FORM in html:
+                raise YouTubeFetchError(video_id, "Failed to accept the YouTube consent page.")
+        return html
+
+    async def _caption_tracks(self, video_id: str) -> List[dict]:
+        html = await self._watch_html(video_id)
+        match = _API_KEY.search(html)
+        if match is None:
+            if 'class="g-recaptcha"' in html:
+                raise YouTubeFetchError(video_id, "YouTube is blocking requests from this server (captcha).")
+            raise YouTubeFetchError(video_id, "The YouTube page could not be parsed.")
+        response = await self._request(
+            video_id, "POST", f"{self.base_url}/youtubei/v1/player", params={"key": match.group(1)},
+            json={"context": INNERTUBE_CONTEXT, "videoId": video_id},
+        )
+        data = response.json()
+        playability = data.get("playabilityStatus") or {}
+        status, reason = playability.get("status"), playability.get("reason")
+        if status not in (None, "OK"):
+            if status == "ERROR" and reason == "This video is unavailable":
+                raise VideoUnavailable(video_id)
+            raise YouTubeFetchError(video_id, f"The video is unplayable: {reason or status}")
+        captions = (data.get("captions") or {}).get("playerCaptionsTracklistRenderer")
+        if captions is None or "captionTracks" not in captions:
+            raise TranscriptsDisabled(video_id)
+        return captions["captionTracks"]
+
+    async def _fetch(self, video_id: str, languages: Iterable[str]) -> List[dict]:
+        track = pick_caption_track(video_id, await self._caption_tracks(video_id), languages)
+        url = track["baseUrl"].replace("&fmt=srv3", "")
+        if "&exp=xpe" in url:
+            raise YouTubeFetchError(video_id, "This transcript can only be fetched with a PO token.")
+        raw = (await self._request(video_id, "GET", url)).text
+        return await asyncio.to_thread(parse_transcript_xml, raw)
+
+    # --- public API ---
+
+    async def get_transcript(self, video_id: str, languages: Iterable[str] = ("en",)) -> List[dict]:
+        """Async counterpart of YouTubeTranscriptApi.get_transcript: [{"text", "start", "duration"}, ...]."""
+        async with self.semaphore:
+            self.counters["fetches"] += 1
+            started = time.perf_counter()
+            try:
+                return await self._fetch(video_id, list(languages))
+            except (TranscriptsDisabled, NoTranscriptFound):
+                raise
+            except Exception:
+                self.counters["errors"] += 1
+                raise
+            finally:
+                self._fetch_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        fetches = self.counters["fetches"]
+        return {
+            "base_url": self.base_url,
+            "concurrency": self.concurrency,
+            **self.counters,
+            "avg_fetch_seconds": round(self._fetch_seconds / fetches, 3) if fetches else 0.0,
+        }
+
+
+youtube_fetcher = AsyncTranscriptFetcher()